@@ -1,10 +1,40 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, stream_template, request, redirect, url_for, flash, session, jsonify
 from flask_cors import CORS
+import atexit
+import click
 import psycopg2
-from psycopg2 import pool, extras
-from datetime import datetime, timedelta
+from psycopg2 import extras
+from datetime import datetime, timedelta, timezone
+import io
+import json
 import os
+import time
 from functools import wraps
+from pagination import keyset_page, count_rows
+from report_engine import assemble_report, REPORT_SECTIONS, REPORT_TABLES
+from forecast import HORIZON_WEEKS, MAX_AGE_WEEKS, forecaster
+from report_executor import ReportExecutor
+from farm_stats import read_farm_stats, reconcile_farm_stats, farm_stats_drift
+from cache import ResultCache
+from bulk_import import import_csv, IMPORT_SPECS, RowError, record_plan, validate_record
+from bulk_write import MAX_RECORDS, write_records
+from task_board import (DEFAULT_WINDOW, EMPLOYEES, TASK_TRANSITIONS, TASK_WINDOWS, InvalidFilter, parse_employee,
+                        parse_task_ids, task_calendar, task_window, tasks_between, transition_tasks)
+from sync import (SYNC_LIMIT, SYNC_MAX_LIMIT, HorizonUnavailable, InvalidCursor, changes_since, horizon_problem,
+                  parse_since)
+from export import EXPORT_TABLES, build_export_query, stream_csv, stream_ndjson, gzip_stream
+from db import (DATABASE_URL, DatabaseUnavailable, db, get_db_connection, init_pool,
+                pool_stats, release_db_connection)
+from metrics import RouteMetrics, begin_request, end_request, server_timing, set_query_observer
+from slowlog import SlowQueryLog, read_log, summarize
+from migrations import MigrationError, migrate, migration_status
+from indexes import compare_index_pack, unused_indexes
+from live import ChangeListener
+from write_behind import QueueFull, WriteBehindQueue
+from sensors import MAX_POINTS, MAX_READINGS, RESOLUTIONS, ingest, parse_time, rollup, series
+from partitions import (check_pruning as check_pruning_queries, ensure_partitions, missing_partitions,
+                        partition_status)
+from bench import parse_scale, seed_database, run_benchmark, compare, save_results, load_results
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SESSION_SECRET', 'tomato-farm-secret-key-2025')
@@ -35,95 +65,240 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-DATABASE_URL = os.environ.get('DATABASE_URL')
+# Sensor gateways post with SENSOR_TOKEN as a bearer token; admins can
+# always post from their session
+def sensor_auth_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.environ.get('SENSOR_TOKEN')
+        if token and request.headers.get('Authorization') == f'Bearer {token}':
+            return f(*args, **kwargs)
+        if session.get('user_type') != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
 
-connection_pool = None
+# Read-view result cache; write handlers bump table versions after commit
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 256)),
+    ttl_seconds=float(os.environ.get('CACHE_TTL_SECONDS', 60))
+)
 
-def init_pool():
-    global connection_pool
-    if DATABASE_URL and not connection_pool:
-        try:
-            connection_pool = pool.SimpleConnectionPool(1, 10, DATABASE_URL)
-            print("Database connection pool created successfully!")
-        except Exception as e:
-            print(f"Error creating connection pool: {e}")
+# Report sections run in parallel on this many threads (and pooled
+# connections); a section slower than REPORT_SECTION_TIMEOUT is dropped
+report_executor = ReportExecutor(
+    max_workers=int(os.environ.get('REPORT_WORKERS', 4)),
+    timeout=float(os.environ.get('REPORT_SECTION_TIMEOUT', 10)),
+    log=app.logger.error
+)
+
+# One LISTEN connection per process feeds every /events stream; other
+# processes' writes also invalidate this process's result cache
+LIVE_TABLES = ('tomato_plants', 'harvest', 'inventory', 'sales', 'operations', 'employee_tasks',
+               'spraying', 'weeding', 'irrigation')
+
+def invalidate_on_change(event):
+    if event.get('event') == 'resync':
+        result_cache.bump(*LIVE_TABLES)
+    elif event.get('table') in LIVE_TABLES:
+        result_cache.bump(event['table'])
 
-def get_db_connection():
+change_listener = ChangeListener(
+    DATABASE_URL,
+    on_event=invalidate_on_change,
+    max_subscribers=int(os.environ.get('LIVE_MAX_CLIENTS', 100)),
+    log=app.logger.error
+)
+
+# WRITE_BEHIND=1: task starts/finishes and operation logs are acknowledged
+# once spooled to WRITE_BEHIND_SPOOL and written in batches in the background
+def flush_task_transitions(cursor, events):
+    tasks_cursor = cursor.connection.cursor(cursor_factory=extras.RealDictCursor)
+    # Starts before finishes, so a task started and finished in one batch ends Completed
+    for status in TASK_TRANSITIONS:
+        stamps = {}
+        for event in events:
+            if event['data']['status'] == status:
+                stamps.setdefault(event['data']['id'], event['at'])
+        if stamps:
+            result = transition_tasks(tasks_cursor, list(stamps), status, list(stamps.values()))
+            if result['skipped']:
+                app.logger.warning("Queued task transitions to %s skipped: %s", status,
+                                   ', '.join(f"{task['id']} ({task['reason']})" for task in result['skipped']))
+
+def flush_operations(cursor, events):
+    # The event id is the idempotency key, so a replayed spool inserts nothing twice
+    records = [dict(event['data'], idempotency_key=f"write-behind:{event['id']}") for event in events]
+    result = write_records(cursor, 'operations', records)
+    if result['errors']:
+        rejected = {error['index'] for error in result['errors']}
+        for error in result['errors']:
+            app.logger.error("Queued operation dropped: %s", error['error'])
+        write_records(cursor, 'operations', [record for index, record in enumerate(records) if index not in rejected])
+
+WRITE_BEHIND_TABLES = {'operations': 'operations', 'task_transition': 'employee_tasks'}
+
+write_queue = None
+if os.environ.get('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes'):
+    write_queue = WriteBehindQueue(
+        os.environ.get('WRITE_BEHIND_SPOOL', 'spool'),
+        {'operations': flush_operations, 'task_transition': flush_task_transitions},
+        flush_ms=float(os.environ.get('WRITE_BEHIND_FLUSH_MS', 50)),
+        batch_size=int(os.environ.get('WRITE_BEHIND_BATCH', 500)),
+        max_pending=int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 10000)),
+        fsync=os.environ.get('WRITE_BEHIND_FSYNC', '').lower() in ('1', 'true', 'yes'),
+        max_attempts=int(os.environ.get('WRITE_BEHIND_MAX_ATTEMPTS', 3)),
+        on_flush=lambda kinds: result_cache.bump(*(WRITE_BEHIND_TABLES[kind] for kind in kinds
+                                                   if kind in WRITE_BEHIND_TABLES)),
+        log=app.logger.error
+    )
+    atexit.register(write_queue.close)
+
+def queue_write(kind, data):
+    # True once a write is spooled; False when write-behind is off or the
+    # queue is full, and the caller writes synchronously
+    if write_queue is None:
+        return False
     try:
-        if not connection_pool:
-            init_pool()
-        if connection_pool:
-            return connection_pool.getconn()
-        return None
+        write_queue.enqueue(kind, data)
+        return True
+    except QueueFull as e:
+        app.logger.warning("%s; writing synchronously", e)
+        return False
+
+# Monthly partitions are kept this many months ahead of today
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+
+# Per-route latency histograms and DB counters, served at /metrics
+route_metrics = RouteMetrics()
+
+# Statements slower than SLOW_QUERY_MS, and failed ones, go to a rotating
+# JSON-lines log with sampled EXPLAIN plans; SLOW_QUERY_MS=0 turns it off
+slow_query_log = SlowQueryLog(
+    os.environ.get('SLOW_QUERY_LOG', 'logs/slow_queries.jsonl'),
+    threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 500)),
+    dsn=DATABASE_URL,
+    plans_per_minute=int(os.environ.get('SLOW_QUERY_PLANS_PER_MINUTE', 6))
+)
+if slow_query_log.threshold > 0:
+    set_query_observer(slow_query_log, slow_query_log.threshold)
+
+@app.before_request
+def start_request_metrics():
+    begin_request(request.endpoint or 'unmatched')
+
+@app.before_request
+def start_change_listener():
+    # Cached results only come from requests, so listening from the first
+    # request on is enough to see every write made by other processes
+    change_listener.start()
+
+@app.before_request
+def start_write_queue():
+    # Replays what a crashed process left in the spool without waiting for
+    # the first queued write
+    if write_queue is not None:
+        write_queue.start()
+
+@app.after_request
+def record_request_metrics(response):
+    stats = end_request(route_metrics, request.endpoint or 'unmatched', request.method, response.status_code)
+    if stats is not None:
+        response.headers['Server-Timing'] = server_timing(stats)
+    return response
+
+def stream_rows(sql, params=(), itersize=500):
+    # Server-side (named) cursor: rows arrive from Postgres itersize at a
+    # time while the template streams, instead of one big fetchall().
+    # The connection is only checked out once the template reaches the
+    # rows, and goes back to the pool when the generator finishes or the
+    # client disconnects.
+    connection = get_db_connection()
+    if not connection:
+        return
+    try:
+        cursor = connection.cursor(name='stream_rows', cursor_factory=extras.RealDictCursor)
+        cursor.itersize = itersize
+        cursor.execute(sql, params)
+        for row in cursor:
+            yield row
+        cursor.close()
     except Exception as e:
-        print(f"Error getting database connection: {e}")
+        app.logger.error("Database error: %s", e)
+    finally:
+        connection.rollback()
+        release_db_connection(connection)
+
+def date_arg(name):
+    try:
+        return datetime.strptime(request.args.get(name, ''), '%Y-%m-%d').date()
+    except ValueError:
         return None
 
-def release_db_connection(conn):
-    if connection_pool and conn:
-        connection_pool.putconn(conn)
+def list_filters(date_column, choice_column, choice_arg):
+    # Date-range and single-choice filters from the query string, as SQL
+    # clauses for keyset_page/stream_rows plus the values for the form
+    filters = {
+        'start_date': date_arg('start_date'),
+        'end_date': date_arg('end_date'),
+        choice_arg: request.args.get(choice_arg, '').strip()
+    }
+    where = []
+    params = []
+    if filters['start_date']:
+        where.append(f"{date_column} >= %s")
+        params.append(filters['start_date'])
+    if filters['end_date']:
+        where.append(f"{date_column} <= %s")
+        params.append(filters['end_date'])
+    if filters[choice_arg]:
+        where.append(f"{choice_column} = %s")
+        params.append(filters[choice_arg])
+    return where, params, filters
+
+@app.template_global()
+def page_url(**changes):
+    # Current list URL with its filters kept and the cursor replaced
+    args = request.args.to_dict()
+    for key in ('after', 'before', 'all'):
+        args.pop(key, None)
+    args.update({key: value for key, value in changes.items() if value is not None})
+    return url_for(request.endpoint, **args)
 
 def init_db():
+    # Applies pending schema migrations (a single query when up to date)
+    # and creates the monthly partitions for the coming months
+    if not DATABASE_URL:
+        print("DATABASE_URL not found. Please create a PostgreSQL database in the Database tab.")
+        return
+    
+    connection = get_db_connection()
+    if not connection:
+        print("Could not connect to database")
+        return
+    
     try:
-        if not DATABASE_URL:
-            print("DATABASE_URL not found. Please create a PostgreSQL database in the Database tab.")
-            return
-        
-        connection = get_db_connection()
-        if not connection:
-            print("Could not connect to database")
-            return
-            
-        cursor = connection.cursor()
-        
-        with open('database/schema_postgres.sql', 'r') as f:
-            sql_script = f.read()
-        
-        cursor.execute(sql_script)
-        
-        # Create employee_tasks table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS employee_tasks (
-                id SERIAL PRIMARY KEY,
-                employee_number INTEGER NOT NULL CHECK (employee_number BETWEEN 1 AND 10),
-                task_date DATE NOT NULL,
-                task_type VARCHAR(100) NOT NULL,
-                field_location VARCHAR(200),
-                description TEXT NOT NULL,
-                start_time TIME,
-                estimated_hours DECIMAL(4,1),
-                status VARCHAR(50) DEFAULT 'Pending',
-                actual_start_time TIMESTAMP,
-                actual_finish_time TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Add new columns to existing table if they don't exist
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                BEGIN
-                    ALTER TABLE employee_tasks ADD COLUMN actual_start_time TIMESTAMP;
-                EXCEPTION
-                    WHEN duplicate_column THEN NULL;
-                END;
-                BEGIN
-                    ALTER TABLE employee_tasks ADD COLUMN actual_finish_time TIMESTAMP;
-                EXCEPTION
-                    WHEN duplicate_column THEN NULL;
-                END;
-            END $$;
-        """)
-        
-        connection.commit()
+        applied = migrate(connection)
+        if applied:
+            print(f"Applied {len(applied)} migration(s)")
+        # Partition upkeep belongs to `partitions --ensure` in cron; startup
+        # only steps in when next month is missing
+        cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
+        missing = missing_partitions(cursor)
+        if missing:
+            created = ensure_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD)
+            print(f"Next month's partition was missing for {', '.join(missing)}; created {created} monthly "
+                  f"partition(s). Run 'flask --app app partitions --ensure' from cron.")
+        problem = horizon_problem(cursor)
+        if problem:
+            print(f"Warning: {problem}")
         cursor.close()
-        release_db_connection(connection)
+        connection.commit()
         print("Database initialized successfully!")
     except Exception as e:
         print(f"Error initializing database: {e}")
-        if connection:
-            release_db_connection(connection)
+    finally:
+        release_db_connection(connection)
 
 @app.route('/login')
 def login():
@@ -134,32 +309,26 @@ def login_admin():
     email = request.form.get('email', '').strip()
     password = request.form.get('password', '')
     
-    connection = get_db_connection()
-    if not connection:
+    try:
+        with db() as cursor:
+            cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
+    except DatabaseUnavailable:
         flash('Database connection error. Please try again.', 'error')
         return redirect(url_for('login'))
-    
-    try:
-        cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        cursor.close()
-        
-        if user and user['password'] == password:
-            session['user_type'] = 'admin'
-            session['username'] = user['full_name'] or 'Admin'
-            session['user_email'] = user['email']
-            flash(f'Welcome {session["username"]}! You have full access.', 'success')
-            release_db_connection(connection)
-            return redirect(url_for('index'))
-        else:
-            flash('Invalid email or password. Please try again.', 'error')
-            release_db_connection(connection)
-            return redirect(url_for('login'))
     except Exception as e:
-        print(f"Login error: {e}")
+        app.logger.error("Login error: %s", e)
         flash('Login error. Please try again.', 'error')
-        release_db_connection(connection)
+        return redirect(url_for('login'))
+    
+    if user and user['password'] == password:
+        session['user_type'] = 'admin'
+        session['username'] = user['full_name'] or 'Admin'
+        session['user_email'] = user['email']
+        flash(f'Welcome {session["username"]}! You have full access.', 'success')
+        return redirect(url_for('index'))
+    else:
+        flash('Invalid email or password. Please try again.', 'error')
         return redirect(url_for('login'))
 
 @app.route('/login/guest', methods=['POST'])
@@ -193,43 +362,32 @@ def register_user():
         flash('Password must be at least 6 characters long.', 'error')
         return redirect(url_for('register'))
     
-    connection = get_db_connection()
-    if not connection:
+    try:
+        with db() as cursor:
+            # Check if email already exists
+            cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+            existing_user = cursor.fetchone()
+            
+            if not existing_user:
+                # Insert new user
+                cursor.execute("""
+                    INSERT INTO users (email, password, full_name) 
+                    VALUES (%s, %s, %s)
+                """, (email, password, full_name))
+    except DatabaseUnavailable:
         flash('Database connection error. Please try again.', 'error')
         return redirect(url_for('register'))
-    
-    try:
-        cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-        
-        # Check if email already exists
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        existing_user = cursor.fetchone()
-        
-        if existing_user:
-            flash('An account with this email already exists. Please login.', 'error')
-            cursor.close()
-            release_db_connection(connection)
-            return redirect(url_for('login'))
-        
-        # Insert new user
-        cursor.execute("""
-            INSERT INTO users (email, password, full_name) 
-            VALUES (%s, %s, %s)
-        """, (email, password, full_name))
-        
-        connection.commit()
-        cursor.close()
-        release_db_connection(connection)
-        
-        flash('Account created successfully! Please login.', 'success')
-        return redirect(url_for('login'))
-        
     except Exception as e:
-        print(f"Registration error: {e}")
+        app.logger.error("Registration error: %s", e)
         flash('Error creating account. Please try again.', 'error')
-        if connection:
-            release_db_connection(connection)
         return redirect(url_for('register'))
+    
+    if existing_user:
+        flash('An account with this email already exists. Please login.', 'error')
+        return redirect(url_for('login'))
+    
+    flash('Account created successfully! Please login.', 'success')
+    return redirect(url_for('login'))
 
 @app.route('/logout')
 def logout():
@@ -240,7 +398,11 @@ def logout():
 @app.route('/')
 @login_required
 def index():
-    connection = get_db_connection()
+    cache_key = result_cache.key('index', request.args, ('tomato_plants', 'harvest', 'inventory', 'sales'))
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return render_template('index.html', **cached)
+    
     stats = {
         'total_plants': 0,
         'total_harvest': 0,
@@ -249,28 +411,10 @@ def index():
     }
     recent_activities = []
     
-    if not connection:
-        flash('Database not connected. Please create a PostgreSQL database in the Database tab.', 'error')
-    
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            
-            cursor.execute("SELECT COUNT(*) as count FROM tomato_plants")
-            result = cursor.fetchone()
-            stats['total_plants'] = result['count'] if result else 0
-            
-            cursor.execute("SELECT COALESCE(SUM(quantity), 0) as total FROM harvest WHERE unit = 'kg'")
-            result = cursor.fetchone()
-            stats['total_harvest'] = float(result['total']) if result else 0
-            
-            cursor.execute("SELECT COUNT(*) as count FROM inventory")
-            result = cursor.fetchone()
-            stats['inventory_items'] = result['count'] if result else 0
-            
-            cursor.execute("SELECT COALESCE(SUM(total_amount), 0) as total FROM sales")
-            result = cursor.fetchone()
-            stats['total_sales'] = float(result['total']) if result else 0
+    try:
+        with db() as cursor:
+            # Counters are maintained by triggers; this is a primary-key lookup
+            stats = read_farm_stats(cursor)
             
             cursor.execute("""
                 SELECT 'Planting' as type, planting_date as date, 
@@ -279,471 +423,532 @@ def index():
                 ORDER BY planting_date DESC LIMIT 5
             """)
             recent_activities = cursor.fetchall()
-            
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+        result_cache.put(cache_key, {'stats': stats, 'recent_activities': recent_activities})
+    except DatabaseUnavailable:
+        flash('Database not connected. Please create a PostgreSQL database in the Database tab.', 'error')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
     return render_template('index.html', stats=stats, recent_activities=recent_activities)
 
 @app.route('/planting')
 @login_required
 def planting():
-    connection = get_db_connection()
     plants = []
-    page = request.args.get('page', 1, type=int)
+    pagination = {'next_cursor': None, 'prev_cursor': None, 'total_items': None, 'total_is_estimate': False}
     per_page = 10
-    total_items = 0
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) as count FROM tomato_plants")
-            result = cursor.fetchone()
-            total_items = result['count'] if result else 0
+    try:
+        with db() as cursor:
+            # Seek on (planting_date, id) instead of OFFSET
+            result = keyset_page(cursor, "SELECT * FROM tomato_plants",
+                                 ['planting_date', 'id'],
+                                 after=request.args.get('after'),
+                                 before=request.args.get('before'),
+                                 per_page=per_page)
+            plants = result['rows']
+            pagination.update(next_cursor=result['next_cursor'], prev_cursor=result['prev_cursor'])
             
-            # Get paginated items
-            offset = (page - 1) * per_page
-            cursor.execute("""
-                SELECT * FROM tomato_plants 
-                ORDER BY planting_date DESC
-                LIMIT %s OFFSET %s
-            """, (per_page, offset))
-            plants = cursor.fetchall()
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+            # Total count is optional: estimated by default, exact on ?count=exact
+            total, is_estimate = count_rows(cursor, 'tomato_plants', request.args.get('count', 'estimate'))
+            pagination.update(total_items=total, total_is_estimate=is_estimate)
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
-    total_pages = (total_items + per_page - 1) // per_page
-    return render_template('planting.html', plants=plants, page=page, total_pages=total_pages)
+    return render_template('planting.html', plants=plants, pagination=pagination)
 
 @app.route('/planting/add', methods=['POST'])
 @admin_required
 def add_planting():
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            variety = request.form['variety']
-            planting_date = request.form['planting_date']
-            expected_harvest = request.form.get('expected_harvest', None)
-            field_location = request.form.get('field_location', '')
-            quantity = request.form.get('quantity', 1)
-            status = request.form.get('status', 'Growing')
-            notes = request.form.get('notes', '')
-            
-            cursor = connection.cursor()
+    try:
+        variety = request.form['variety']
+        planting_date = request.form['planting_date']
+        expected_harvest = request.form.get('expected_harvest', None)
+        field_location = request.form.get('field_location', '')
+        quantity = request.form.get('quantity', 1)
+        status = request.form.get('status', 'Growing')
+        notes = request.form.get('notes', '')
+        
+        with db() as cursor:
             cursor.execute("""
                 INSERT INTO tomato_plants 
                 (variety, planting_date, expected_harvest_date, field_location, quantity, status, notes)
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (variety, planting_date, expected_harvest, field_location, quantity, status, notes))
-            
-            connection.commit()
-            cursor.close()
-            flash('Planting record added successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error adding planting record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('tomato_plants')
+        flash('Planting record added successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error adding planting record', 'error')
     
     return redirect(url_for('planting'))
 
 @app.route('/planting/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_planting(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
+    try:
+        with db() as cursor:
             cursor.execute("DELETE FROM tomato_plants WHERE id = %s", (id,))
-            connection.commit()
-            cursor.close()
-            flash('Planting record deleted successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error deleting record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('tomato_plants', 'harvest')
+        flash('Planting record deleted successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error deleting record', 'error')
     
     return redirect(url_for('planting'))
 
 @app.route('/harvesting')
 @login_required
 def harvesting():
-    connection = get_db_connection()
     harvests = []
-    plants = []
-    page = request.args.get('page', 1, type=int)
+    pagination = {'next_cursor': None, 'prev_cursor': None, 'total_items': None, 'total_is_estimate': False}
     per_page = 10
-    total_items = 0
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) as count FROM harvest")
-            result = cursor.fetchone()
-            total_items = result['count'] if result else 0
-            
-            # Get paginated harvests
-            offset = (page - 1) * per_page
-            cursor.execute("""
+    try:
+        with db() as cursor:
+            # Seek on (harvest_date, id) instead of OFFSET
+            result = keyset_page(cursor, """
                 SELECT h.*, p.variety as plant_variety
                 FROM harvest h
                 LEFT JOIN tomato_plants p ON h.plant_id = p.id
-                ORDER BY h.harvest_date DESC
-                LIMIT %s OFFSET %s
-            """, (per_page, offset))
-            harvests = cursor.fetchall()
+            """, ['h.harvest_date', 'h.id'],
+                                 after=request.args.get('after'),
+                                 before=request.args.get('before'),
+                                 per_page=per_page)
+            harvests = result['rows']
+            pagination.update(next_cursor=result['next_cursor'], prev_cursor=result['prev_cursor'])
             
-            cursor.execute("SELECT * FROM tomato_plants ORDER BY planting_date DESC")
-            plants = cursor.fetchall()
-            
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+            total, is_estimate = count_rows(cursor, 'harvest', request.args.get('count', 'estimate'))
+            pagination.update(total_items=total, total_is_estimate=is_estimate)
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
-    total_pages = (total_items + per_page - 1) // per_page
-    return render_template('harvesting.html', harvests=harvests, plants=plants, page=page, total_pages=total_pages)
+    return render_template('harvesting.html', harvests=harvests, pagination=pagination)
+
+# Must match the expression of idx_tomato_plants_search_trgm
+PLANT_SEARCH_TEXT = "(variety::text || ' ' || COALESCE(field_location::text, ''))"
+
+@app.route('/plants/search')
+@login_required
+def search_plants():
+    # Type-ahead for the harvest form: words match variety/field through the
+    # trigram index, YYYY / YYYY-MM / YYYY-MM-DD words narrow planting_date.
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    where = []
+    params = []
+    
+    for term in query.split()[:5]:
+        parts = term.split('-')
+        is_date = all(part.isdigit() for part in parts) and (len(parts) > 1 or len(term) >= 4)
+        if is_date and [len(part) for part in parts] not in ([4], [4, 2], [4, 2, 2]):
+            # A date still being typed; wait for it to be complete
+            continue
+        if is_date:
+            try:
+                start = datetime(int(parts[0]), int(parts[1]) if len(parts) > 1 else 1,
+                                 int(parts[2]) if len(parts) > 2 else 1).date()
+            except ValueError:
+                return jsonify([])
+            if len(parts) == 3:
+                end = start + timedelta(days=1)
+            elif len(parts) == 2:
+                end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            else:
+                end = start.replace(year=start.year + 1)
+            where.append("planting_date >= %s AND planting_date < %s")
+            params.extend([start, end])
+        else:
+            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append(f"{PLANT_SEARCH_TEXT} ILIKE %s")
+            params.append(f"%{escaped}%")
+    
+    plants = []
+    
+    try:
+        with db() as cursor:
+            sql = "SELECT id, variety, planting_date, field_location FROM tomato_plants"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY planting_date DESC, id DESC LIMIT %s"
+            cursor.execute(sql, params + [limit])
+            plants = [{
+                'id': row['id'],
+                'label': f"{row['variety']} - {row['planting_date']} ({row['field_location'] or 'No location'})",
+                'variety': row['variety'],
+                'planting_date': row['planting_date'].isoformat(),
+                'field_location': row['field_location']
+            } for row in cursor.fetchall()]
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+    
+    return jsonify(plants)
 
 @app.route('/harvesting/add', methods=['POST'])
 @admin_required
 def add_harvest():
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            plant_id = request.form.get('plant_id', None)
-            if plant_id == '':
-                plant_id = None
-            harvest_date = request.form['harvest_date']
-            quantity = request.form['quantity']
-            unit = request.form.get('unit', 'kg')
-            quality_grade = request.form.get('quality_grade', 'Grade A')
-            notes = request.form.get('notes', '')
-            
-            cursor = connection.cursor()
+    try:
+        plant_id = request.form.get('plant_id', None)
+        if plant_id == '':
+            plant_id = None
+        harvest_date = request.form['harvest_date']
+        quantity = request.form['quantity']
+        unit = request.form.get('unit', 'kg')
+        quality_grade = request.form.get('quality_grade', 'Grade A')
+        notes = request.form.get('notes', '')
+        
+        with db() as cursor:
             cursor.execute("""
                 INSERT INTO harvest 
                 (plant_id, harvest_date, quantity, unit, quality_grade, notes)
                 VALUES (%s, %s, %s, %s, %s, %s)
             """, (plant_id, harvest_date, quantity, unit, quality_grade, notes))
-            
-            connection.commit()
-            cursor.close()
-            flash('Harvest record added successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error adding harvest record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('harvest')
+        flash('Harvest record added successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error adding harvest record', 'error')
     
     return redirect(url_for('harvesting'))
 
 @app.route('/harvesting/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_harvest(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
+    try:
+        with db() as cursor:
             cursor.execute("DELETE FROM harvest WHERE id = %s", (id,))
-            connection.commit()
-            cursor.close()
-            flash('Harvest record deleted successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error deleting record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('harvest')
+        flash('Harvest record deleted successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error deleting record', 'error')
     
     return redirect(url_for('harvesting'))
 
 @app.route('/inventory')
 @login_required
 def inventory():
-    connection = get_db_connection()
     items = []
-    page = request.args.get('page', 1, type=int)
+    pagination = {'next_cursor': None, 'prev_cursor': None, 'total_items': None, 'total_is_estimate': False}
     per_page = 10
-    total_items = 0
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) as count FROM inventory")
-            result = cursor.fetchone()
-            total_items = result['count'] if result else 0
+    try:
+        with db() as cursor:
+            # Seek on (item_name, id) instead of OFFSET
+            result = keyset_page(cursor, "SELECT * FROM inventory",
+                                 ['item_name', 'id'], descending=False,
+                                 after=request.args.get('after'),
+                                 before=request.args.get('before'),
+                                 per_page=per_page)
+            items = result['rows']
+            pagination.update(next_cursor=result['next_cursor'], prev_cursor=result['prev_cursor'])
             
-            # Get paginated items
-            offset = (page - 1) * per_page
-            cursor.execute("SELECT * FROM inventory ORDER BY item_name LIMIT %s OFFSET %s", (per_page, offset))
-            items = cursor.fetchall()
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+            total, is_estimate = count_rows(cursor, 'inventory', request.args.get('count', 'estimate'))
+            pagination.update(total_items=total, total_is_estimate=is_estimate)
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
-    total_pages = (total_items + per_page - 1) // per_page
-    return render_template('inventory.html', inventory=items, page=page, total_pages=total_pages)
+    return render_template('inventory.html', inventory=items, pagination=pagination)
 
 @app.route('/inventory/add', methods=['POST'])
 @admin_required
 def add_inventory():
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            item_name = request.form['item_name']
-            category = request.form['category']
-            quantity = request.form['quantity']
-            unit = request.form['unit']
-            min_quantity = request.form.get('min_quantity', 0)
-            supplier = request.form.get('supplier', '')
-            
-            cursor = connection.cursor()
+    try:
+        item_name = request.form['item_name']
+        category = request.form['category']
+        quantity = request.form['quantity']
+        unit = request.form['unit']
+        min_quantity = request.form.get('min_quantity', 0)
+        supplier = request.form.get('supplier', '')
+        
+        with db() as cursor:
             cursor.execute("""
                 INSERT INTO inventory 
                 (item_name, category, quantity, unit, min_quantity, supplier)
                 VALUES (%s, %s, %s, %s, %s, %s)
             """, (item_name, category, quantity, unit, min_quantity, supplier))
-            
-            connection.commit()
-            cursor.close()
-            flash('Inventory item added successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error adding inventory item', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('inventory')
+        flash('Inventory item added successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error adding inventory item', 'error')
     
     return redirect(url_for('inventory'))
 
 @app.route('/inventory/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_inventory(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
+    try:
+        with db() as cursor:
             cursor.execute("DELETE FROM inventory WHERE id = %s", (id,))
-            connection.commit()
-            cursor.close()
-            flash('Inventory item deleted successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error deleting item', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('inventory')
+        flash('Inventory item deleted successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error deleting item', 'error')
     
     return redirect(url_for('inventory'))
 
 @app.route('/operations')
 @login_required
 def operations():
-    connection = get_db_connection()
+    where, params, filters = list_filters('operation_date', 'operation_type', 'operation_type')
+    pagination = {'next_cursor': None, 'prev_cursor': None, 'total_items': None, 'total_is_estimate': False}
+    
+    # ?all=1 streams the full filtered history instead of one page
+    if request.args.get('all'):
+        sql = "SELECT * FROM operations"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY operation_date DESC, id DESC"
+        return stream_template('operations.html', operations=stream_rows(sql, params),
+                               pagination=pagination, filters=filters)
+    
+    cache_key = result_cache.key('operations', request.args, ('operations',))
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return render_template('operations.html', **cached)
+    
     ops = []
+    per_page = 10
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            cursor.execute("SELECT * FROM operations ORDER BY operation_date DESC")
-            ops = cursor.fetchall()
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+    try:
+        with db() as cursor:
+            # Seek on (operation_date, id) with the filters pushed into SQL
+            result = keyset_page(cursor, "SELECT * FROM operations",
+                                 ['operation_date', 'id'], params=params, where=where,
+                                 after=request.args.get('after'),
+                                 before=request.args.get('before'),
+                                 per_page=per_page)
+            ops = result['rows']
+            pagination.update(next_cursor=result['next_cursor'], prev_cursor=result['prev_cursor'])
+            
+            total, is_estimate = count_rows(cursor, 'operations', request.args.get('count', 'estimate'),
+                                            where=where, params=params)
+            pagination.update(total_items=total, total_is_estimate=is_estimate)
+        result_cache.put(cache_key, {'operations': ops, 'pagination': pagination, 'filters': filters})
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
-    return render_template('operations.html', operations=ops)
+    return render_template('operations.html', operations=ops, pagination=pagination, filters=filters)
 
 @app.route('/operations/add', methods=['POST'])
 @admin_required
 def add_operation():
-    connection = get_db_connection()
-    
-    if connection:
+    if write_queue is not None:
+        # Checked here so a queued record cannot fail later; column lengths
+        # are only known to the flusher, which drops (and logs) overlong ones
+        spec = IMPORT_SPECS['operations']
+        record = {name: request.form.get(name, '') for name, _, _ in spec['fields']}
         try:
-            operation_type = request.form['operation_type']
-            operation_date = request.form['operation_date']
-            field_location = request.form.get('field_location', '')
-            description = request.form['description']
-            cost = request.form.get('cost', 0)
-            performed_by = request.form.get('performed_by', '')
-            notes = request.form.get('notes', '')
-            
-            cursor = connection.cursor()
+            validate_record(spec, record_plan(spec, {}), record)
+        except RowError as e:
+            flash(f'Error adding operation record: {e}', 'error')
+            return redirect(url_for('operations'))
+        if queue_write('operations', record):
+            flash('Operation record saved!', 'success')
+            return redirect(url_for('operations'))
+    try:
+        operation_type = request.form['operation_type']
+        operation_date = request.form['operation_date']
+        field_location = request.form.get('field_location', '')
+        description = request.form['description']
+        cost = request.form.get('cost', 0)
+        performed_by = request.form.get('performed_by', '')
+        notes = request.form.get('notes', '')
+        
+        with db() as cursor:
             cursor.execute("""
                 INSERT INTO operations 
                 (operation_type, operation_date, field_location, description, cost, performed_by, notes)
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (operation_type, operation_date, field_location, description, cost, performed_by, notes))
-            
-            connection.commit()
-            cursor.close()
-            flash('Operation record added successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error adding operation record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('operations')
+        flash('Operation record added successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error adding operation record', 'error')
     
     return redirect(url_for('operations'))
 
 @app.route('/operations/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_operation(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
+    try:
+        with db() as cursor:
             cursor.execute("DELETE FROM operations WHERE id = %s", (id,))
-            connection.commit()
-            cursor.close()
-            flash('Operation record deleted successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error deleting record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('operations')
+        flash('Operation record deleted successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error deleting record', 'error')
     
     return redirect(url_for('operations'))
 
 @app.route('/sales')
 @login_required
 def sales():
-    connection = get_db_connection()
+    where, params, filters = list_filters('sale_date', 'payment_status', 'payment_status')
+    pagination = {'next_cursor': None, 'prev_cursor': None, 'total_items': None, 'total_is_estimate': False}
+    
+    # ?all=1 streams the full filtered ledger instead of one page
+    if request.args.get('all'):
+        sql = "SELECT * FROM sales"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY sale_date DESC, id DESC"
+        return stream_template('sales.html', sales=stream_rows(sql, params),
+                               pagination=pagination, filters=filters)
+    
+    cache_key = result_cache.key('sales', request.args, ('sales',))
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return render_template('sales.html', **cached)
+    
     sale_records = []
+    per_page = 10
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            cursor.execute("SELECT * FROM sales ORDER BY sale_date DESC")
-            sale_records = cursor.fetchall()
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+    try:
+        with db() as cursor:
+            # Seek on (sale_date, id) with the filters pushed into SQL
+            result = keyset_page(cursor, "SELECT * FROM sales",
+                                 ['sale_date', 'id'], params=params, where=where,
+                                 after=request.args.get('after'),
+                                 before=request.args.get('before'),
+                                 per_page=per_page)
+            sale_records = result['rows']
+            pagination.update(next_cursor=result['next_cursor'], prev_cursor=result['prev_cursor'])
+            
+            total, is_estimate = count_rows(cursor, 'sales', request.args.get('count', 'estimate'),
+                                            where=where, params=params)
+            pagination.update(total_items=total, total_is_estimate=is_estimate)
+        result_cache.put(cache_key, {'sales': sale_records, 'pagination': pagination, 'filters': filters})
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
-    return render_template('sales.html', sales=sale_records)
+    return render_template('sales.html', sales=sale_records, pagination=pagination, filters=filters)
 
 @app.route('/sales/add', methods=['POST'])
 @admin_required
 def add_sale():
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            sale_date = request.form['sale_date']
-            customer_name = request.form.get('customer_name', '')
-            quantity = float(request.form['quantity'])
-            unit = request.form.get('unit', 'kg')
-            price_per_unit = float(request.form['price_per_unit'])
-            total_amount = quantity * price_per_unit
-            payment_status = request.form.get('payment_status', 'Pending')
-            notes = request.form.get('notes', '')
-            
-            cursor = connection.cursor()
+    try:
+        sale_date = request.form['sale_date']
+        customer_name = request.form.get('customer_name', '')
+        quantity = float(request.form['quantity'])
+        unit = request.form.get('unit', 'kg')
+        price_per_unit = float(request.form['price_per_unit'])
+        total_amount = quantity * price_per_unit
+        payment_status = request.form.get('payment_status', 'Pending')
+        notes = request.form.get('notes', '')
+        
+        with db() as cursor:
             cursor.execute("""
                 INSERT INTO sales 
                 (sale_date, customer_name, quantity, unit, price_per_unit, total_amount, payment_status, notes)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """, (sale_date, customer_name, quantity, unit, price_per_unit, total_amount, payment_status, notes))
-            
-            connection.commit()
-            cursor.close()
-            flash('Sale record added successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error adding sale record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('sales')
+        flash('Sale record added successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error adding sale record', 'error')
     
     return redirect(url_for('sales'))
 
 @app.route('/sales/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_sale(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
+    try:
+        with db() as cursor:
             cursor.execute("DELETE FROM sales WHERE id = %s", (id,))
-            connection.commit()
-            cursor.close()
-            flash('Sale record deleted successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error deleting record', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('sales')
+        flash('Sale record deleted successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error deleting record', 'error')
     
     return redirect(url_for('sales'))
 
+def task_board_filters():
+    # Window, dates and employee of the task board from the query string;
+    # a start or end date without a window means a custom range
+    start, end = date_arg('start_date'), date_arg('end_date')
+    window = request.args.get('window') or ('range' if start or end else DEFAULT_WINDOW)
+    first, last = task_window(window, start, end)
+    employee = parse_employee(request.args.get('employee'))
+    filters = {'window': window, 'start_date': first, 'end_date': last, 'employee': employee}
+    return filters, first, last, employee
+
 @app.route('/employee_tasks')
 @login_required
 def employee_tasks():
-    connection = get_db_connection()
+    today = datetime.now().strftime('%Y-%m-%d')
+    try:
+        filters, first, last, employee = task_board_filters()
+    except InvalidFilter as e:
+        flash(f'{e}. Showing this week instead.', 'error')
+        first, last = task_window(DEFAULT_WINDOW)
+        employee = None
+        filters = {'window': DEFAULT_WINDOW, 'start_date': first, 'end_date': last, 'employee': None}
+    
+    # Keyed by the resolved dates, so "today" and "this week" roll over
+    cache_key = result_cache.key('employee_tasks', {'first': first, 'last': last, 'employee': employee},
+                                 ('employee_tasks',))
+    tasks = result_cache.get(cache_key)
+    if tasks is not None:
+        return render_template('employee_tasks.html', tasks=tasks, today=today, filters=filters,
+                               windows=TASK_WINDOWS, employees=EMPLOYEES)
+    
     tasks = []
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            cursor.execute("""
-                SELECT * FROM employee_tasks 
-                ORDER BY task_date DESC, employee_number ASC
-            """)
-            tasks = cursor.fetchall()
-            cursor.close()
-        except Exception as e:
-            print(f"Database error: {e}")
-        finally:
-            release_db_connection(connection)
+    try:
+        with db() as cursor:
+            tasks = tasks_between(cursor, first, last, employee)
+        result_cache.put(cache_key, tasks)
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
     
-    today = datetime.now().strftime('%Y-%m-%d')
-    return render_template('employee_tasks.html', tasks=tasks, today=today)
+    return render_template('employee_tasks.html', tasks=tasks, today=today, filters=filters,
+                           windows=TASK_WINDOWS, employees=EMPLOYEES)
+
+@app.route('/employee_tasks/calendar')
+@login_required
+def employee_task_calendar():
+    # Tasks of ?start_date=&end_date= (or ?window=today|week) grouped by
+    # employee, optionally for one ?employee=
+    try:
+        _, first, last, employee = task_board_filters()
+    except InvalidFilter as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        with db() as cursor:
+            calendar = task_calendar(cursor, first, last, employee)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except Exception as e:
+        app.logger.error("Calendar error: %s", e)
+        return jsonify({'error': 'Calendar could not be loaded'}), 500
+    return jsonify(calendar)
 
 @app.route('/employee_tasks/add', methods=['POST'])
 @admin_required
 def add_employee_task():
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            employee_number = int(request.form['employee_number'])
-            task_date = request.form['task_date']
-            task_type = request.form['task_type']
-            field_location = request.form.get('field_location', '')
-            description = request.form['description']
-            start_time = request.form.get('start_time', None)
-            if start_time == '':
-                start_time = None
-            estimated_hours = request.form.get('estimated_hours', None)
-            if estimated_hours == '':
-                estimated_hours = None
-            status = request.form.get('status', 'Pending')
-            
-            cursor = connection.cursor()
+    try:
+        employee_number = int(request.form['employee_number'])
+        task_date = request.form['task_date']
+        task_type = request.form['task_type']
+        field_location = request.form.get('field_location', '')
+        description = request.form['description']
+        start_time = request.form.get('start_time', None)
+        if start_time == '':
+            start_time = None
+        estimated_hours = request.form.get('estimated_hours', None)
+        if estimated_hours == '':
+            estimated_hours = None
+        status = request.form.get('status', 'Pending')
+        
+        with db() as cursor:
             cursor.execute("""
                 INSERT INTO employee_tasks 
                 (employee_number, task_date, task_type, field_location, description, 
@@ -751,108 +956,128 @@ def add_employee_task():
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """, (employee_number, task_date, task_type, field_location, description, 
                   start_time, estimated_hours, status))
-            
-            connection.commit()
-            cursor.close()
-            flash(f'Task assigned to Employee {employee_number} successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error assigning task', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('employee_tasks')
+        flash(f'Task assigned to Employee {employee_number} successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error assigning task', 'error')
     
     return redirect(url_for('employee_tasks'))
 
 @app.route('/employee_tasks/update_status/<int:id>', methods=['POST'])
 @admin_required
 def update_task_status(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            status = request.form['status']
-            cursor = connection.cursor()
+    try:
+        status = request.form['status']
+        with db() as cursor:
             cursor.execute("""
                 UPDATE employee_tasks 
                 SET status = %s 
                 WHERE id = %s
             """, (status, id))
-            connection.commit()
-            cursor.close()
-            flash('Task status updated successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error updating task status', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('employee_tasks')
+        flash('Task status updated successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error updating task status', 'error')
     
     return redirect(url_for('employee_tasks'))
 
 @app.route('/employee_tasks/start/<int:id>', methods=['POST'])
 @login_required
 def start_task(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                UPDATE employee_tasks 
-                SET status = 'In Progress', actual_start_time = CURRENT_TIMESTAMP 
-                WHERE id = %s
-            """, (id,))
-            connection.commit()
-            cursor.close()
+    if queue_write('task_transition', {'id': id, 'status': 'In Progress'}):
+        flash('Task start recorded!', 'success')
+        return redirect(url_for('employee_tasks'))
+    try:
+        with db() as cursor:
+            result = transition_tasks(cursor, [id], 'In Progress')
+        if result['updated']:
+            result_cache.bump('employee_tasks')
             flash('Task started successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error starting task', 'error')
-        finally:
-            release_db_connection(connection)
+        else:
+            flash(f"Task not started: it {result['skipped'][0]['reason']}", 'error')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error starting task', 'error')
     
     return redirect(url_for('employee_tasks'))
 
 @app.route('/employee_tasks/finish/<int:id>', methods=['POST'])
 @login_required
 def finish_task(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                UPDATE employee_tasks 
-                SET status = 'Completed', actual_finish_time = CURRENT_TIMESTAMP 
-                WHERE id = %s
-            """, (id,))
-            connection.commit()
-            cursor.close()
+    if queue_write('task_transition', {'id': id, 'status': 'Completed'}):
+        flash('Task finish recorded!', 'success')
+        return redirect(url_for('employee_tasks'))
+    try:
+        with db() as cursor:
+            result = transition_tasks(cursor, [id], 'Completed')
+        if result['updated']:
+            result_cache.bump('employee_tasks')
             flash('Task completed successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error finishing task', 'error')
-        finally:
-            release_db_connection(connection)
+        else:
+            flash(f"Task not finished: it {result['skipped'][0]['reason']}", 'error')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error finishing task', 'error')
     
     return redirect(url_for('employee_tasks'))
 
+@app.route('/employee_tasks/transition', methods=['POST'])
+@login_required
+def transition_employee_tasks():
+    # Starts or finishes many tasks in one statement: JSON {"ids": [...],
+    # "status": "In Progress" | "Completed"}, or the task board's form
+    # (ids checkboxes plus a status button), which redirects back
+    board = redirect(request.referrer or url_for('employee_tasks'))
+    
+    def failed(message, code):
+        if request.is_json:
+            return jsonify({'error': message}), code
+        flash(message, 'error')
+        return board
+    
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('ids'), list):
+            return failed('Expected {"ids": [...], "status": ...}', 400)
+        ids, status = payload['ids'], payload.get('status')
+    else:
+        ids, status = request.form.getlist('ids'), request.form.get('status')
+    
+    try:
+        ids = parse_task_ids(ids)
+        with db() as cursor:
+            result = transition_tasks(cursor, ids, status)
+    except InvalidFilter as e:
+        return failed(str(e), 400)
+    except DatabaseUnavailable:
+        return failed('Database connection error', 503)
+    except Exception as e:
+        app.logger.error("Task transition error: %s", e)
+        return failed('Task transition failed', 500)
+    if result['updated']:
+        result_cache.bump('employee_tasks')
+    
+    if request.is_json:
+        return jsonify(result)
+    message = f"{len(result['updated'])} task(s) moved to {status}"
+    if result['skipped']:
+        message += '; skipped ' + ', '.join(f"#{task['id']} ({task['reason']})" for task in result['skipped'])
+    flash(message, 'success' if result['updated'] else 'error')
+    return board
+
 @app.route('/employee_tasks/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_employee_task(id):
-    connection = get_db_connection()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
+    try:
+        with db() as cursor:
             cursor.execute("DELETE FROM employee_tasks WHERE id = %s", (id,))
-            connection.commit()
-            cursor.close()
-            flash('Task deleted successfully!', 'success')
-        except Exception as e:
-            print(f"Database error: {e}")
-            flash('Error deleting task', 'error')
-        finally:
-            release_db_connection(connection)
+        result_cache.bump('employee_tasks')
+        flash('Task deleted successfully!', 'success')
+    except Exception as e:
+        app.logger.error("Database error: %s", e)
+        flash('Error deleting task', 'error')
     
     return redirect(url_for('employee_tasks'))
 
@@ -864,166 +1089,637 @@ def help():
 @app.route('/reports')
 @login_required
 def reports():
+    cache_key = result_cache.key('reports', request.args, REPORT_TABLES)
+    report = result_cache.get(cache_key)
+    if report is not None:
+        return render_template('reports.html', **report)
+    
+    results, section_errors = report_executor.run(REPORT_SECTIONS)
+    report = assemble_report(results, section_errors)
+    if section_errors:
+        # A partial report is shown but not cached
+        flash('Error loading some report data', 'error')
+    else:
+        result_cache.put(cache_key, report)
+    
+    return render_template('reports.html', **report)
+
+@app.route('/forecast')
+@login_required
+def yield_forecast():
+    # Expected kg per week for the growing plantings, overall and per
+    # variety and field; ?weeks= sets the horizon
+    weeks = min(max(request.args.get('weeks', HORIZON_WEEKS, type=int), 1), MAX_AGE_WEEKS)
+    cache_key = result_cache.key('forecast', {'weeks': weeks, 'day': datetime.now().date()},
+                                 ('tomato_plants', 'harvest'))
+    result = result_cache.get(cache_key)
+    if result is not None:
+        return jsonify(result)
+    
+    try:
+        with db() as cursor:
+            result = forecaster.forecast(cursor, weeks)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except Exception as e:
+        app.logger.error("Forecast error: %s", e)
+        return jsonify({'error': 'Forecast failed'}), 500
+    result_cache.put(cache_key, result)
+    return jsonify(result)
+
+@app.route('/import/<kind>', methods=['POST'])
+@admin_required
+def bulk_import(kind):
+    # multipart upload: file=<csv>, optional dry_run=1 to validate only
+    if kind not in IMPORT_SPECS:
+        return jsonify({'error': f'Unknown import type: {kind}'}), 404
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'No CSV file uploaded'}), 400
+    
     connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection error'}), 503
     
-    # Initialize all report data
-    production = {
-        'total_plants': 0,
-        'active_plants': 0,
-        'total_harvest': 0,
-        'avg_harvest_per_plant': 0
-    }
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = import_csv(connection, kind, stream, dry_run=request.form.get('dry_run') == '1')
+        if report['inserted'] and not report['dry_run']:
+            result_cache.bump(IMPORT_SPECS[kind]['table'])
+    except Exception as e:
+        app.logger.error("Import error: %s", e)
+        return jsonify({'error': f'Import failed: {e}'}), 500
+    finally:
+        release_db_connection(connection)
     
-    financial = {
-        'total_sales': 0,
-        'total_operations_cost': 0,
-        'net_income': 0,
-        'pending_payments': 0
-    }
+    return jsonify(report)
+
+@app.route('/api/<kind>/batch', methods=['POST'])
+@admin_required
+def api_batch_write(kind):
+    # JSON array of records (or {"records": [...]}) from the field tablets;
+    # all-or-nothing, ids come back in request order
+    if kind not in IMPORT_SPECS:
+        return jsonify({'error': f'Unknown record type: {kind}'}), 404
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'Expected a non-empty JSON array of records'}), 400
+    if len(records) > MAX_RECORDS:
+        return jsonify({'error': f'At most {MAX_RECORDS} records per batch'}), 413
     
-    quality_distribution = []
-    operations_summary = []
-    field_performance = []
-    employee_summary = []
-    monthly_sales = []
-    inventory = {'total_items': 0, 'low_stock': 0}
-    low_stock_items = []
+    try:
+        with db(cursor_factory=None) as cursor:
+            result = write_records(cursor, kind, records)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except Exception as e:
+        app.logger.error("Batch write error: %s", e)
+        return jsonify({'error': f'Batch write failed: {e}'}), 500
     
-    if connection:
-        try:
-            cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
-            
-            # Production Summary
-            cursor.execute("SELECT COUNT(*) as count FROM tomato_plants")
-            result = cursor.fetchone()
-            production['total_plants'] = result['count'] if result else 0
-            
-            cursor.execute("SELECT COUNT(*) as count FROM tomato_plants WHERE status = 'Growing'")
-            result = cursor.fetchone()
-            production['active_plants'] = result['count'] if result else 0
-            
-            cursor.execute("SELECT COALESCE(SUM(quantity), 0) as total FROM harvest WHERE unit = 'kg'")
-            result = cursor.fetchone()
-            production['total_harvest'] = float(result['total']) if result else 0
-            
-            if production['total_plants'] > 0:
-                production['avg_harvest_per_plant'] = production['total_harvest'] / production['total_plants']
-            
-            # Financial Summary
-            cursor.execute("SELECT COALESCE(SUM(total_amount), 0) as total FROM sales")
-            result = cursor.fetchone()
-            financial['total_sales'] = float(result['total']) if result else 0
-            
-            cursor.execute("SELECT COALESCE(SUM(cost), 0) as total FROM operations")
-            result = cursor.fetchone()
-            financial['total_operations_cost'] = float(result['total']) if result else 0
-            
-            financial['net_income'] = financial['total_sales'] - financial['total_operations_cost']
-            
-            cursor.execute("SELECT COALESCE(SUM(total_amount), 0) as total FROM sales WHERE payment_status = 'Pending'")
-            result = cursor.fetchone()
-            financial['pending_payments'] = float(result['total']) if result else 0
-            
-            # Quality Distribution
-            cursor.execute("""
-                SELECT quality_grade, 
-                       SUM(quantity) as total_quantity,
-                       (SUM(quantity) * 100.0 / NULLIF((SELECT SUM(quantity) FROM harvest WHERE unit = 'kg'), 0)) as percentage
-                FROM harvest 
-                WHERE unit = 'kg'
-                GROUP BY quality_grade
-                ORDER BY total_quantity DESC
-            """)
-            quality_distribution = cursor.fetchall()
-            
-            # Operations Summary
-            cursor.execute("""
-                SELECT operation_type, 
-                       COUNT(*) as count,
-                       COALESCE(SUM(cost), 0) as total_cost
-                FROM operations
-                GROUP BY operation_type
-                ORDER BY count DESC
-            """)
-            operations_summary = cursor.fetchall()
-            
-            # Field Performance
-            cursor.execute("""
-                SELECT p.field_location,
-                       COUNT(p.id) as plant_count,
-                       COALESCE(SUM(h.quantity), 0) as total_harvest
-                FROM tomato_plants p
-                LEFT JOIN harvest h ON p.id = h.plant_id AND h.unit = 'kg'
-                WHERE p.field_location IS NOT NULL AND p.field_location != ''
-                GROUP BY p.field_location
-                ORDER BY total_harvest DESC
-            """)
-            field_performance = cursor.fetchall()
-            
-            # Employee Summary
-            cursor.execute("""
-                SELECT employee_number,
-                       COUNT(*) as total_tasks,
-                       SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) as completed,
-                       SUM(CASE WHEN status = 'In Progress' THEN 1 ELSE 0 END) as in_progress,
-                       SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END) as pending
-                FROM employee_tasks
-                GROUP BY employee_number
-                ORDER BY employee_number
-            """)
-            employee_summary = cursor.fetchall()
-            
-            # Monthly Sales Trend
-            cursor.execute("""
-                SELECT TO_CHAR(sale_date, 'YYYY-MM') as month,
-                       SUM(total_amount) as total_sales,
-                       SUM(quantity) as total_quantity
-                FROM sales
-                WHERE sale_date >= CURRENT_DATE - INTERVAL '6 months'
-                GROUP BY TO_CHAR(sale_date, 'YYYY-MM')
-                ORDER BY month DESC
-            """)
-            monthly_sales = cursor.fetchall()
-            
-            # Inventory Status
-            cursor.execute("SELECT COUNT(*) as count FROM inventory")
-            result = cursor.fetchone()
-            inventory['total_items'] = result['count'] if result else 0
-            
-            cursor.execute("SELECT COUNT(*) as count FROM inventory WHERE quantity <= min_quantity")
-            result = cursor.fetchone()
-            inventory['low_stock'] = result['count'] if result else 0
-            
+    if result['errors']:
+        return jsonify(result), 400
+    if result['created']:
+        result_cache.bump(IMPORT_SPECS[kind]['table'])
+    return jsonify(result), 201 if result['created'] else 200
+
+@app.route('/api/sensors/readings', methods=['POST'])
+@sensor_auth_required
+def ingest_sensor_readings():
+    # JSON array of readings (or {"readings": [...]}), each
+    # {"sensor", "at", "value"} plus "field_location" and "metric" the first
+    # time a sensor reports; all-or-nothing
+    payload = request.get_json(silent=True)
+    readings = payload.get('readings') if isinstance(payload, dict) else payload
+    if not isinstance(readings, list) or not readings:
+        return jsonify({'error': 'Expected a non-empty JSON array of readings'}), 400
+    if len(readings) > MAX_READINGS:
+        return jsonify({'error': f'At most {MAX_READINGS} readings per batch'}), 413
+    
+    try:
+        with db(cursor_factory=None) as cursor:
+            result = ingest(cursor, readings)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except Exception as e:
+        app.logger.error("Sensor ingest error: %s", e)
+        return jsonify({'error': f'Sensor ingest failed: {e}'}), 500
+    
+    if result['errors']:
+        return jsonify(result), 400
+    return jsonify(result), 201
+
+@app.route('/api/sensors')
+@login_required
+def list_sensors():
+    try:
+        with db() as cursor:
             cursor.execute("""
-                SELECT item_name, quantity, unit, min_quantity
-                FROM inventory
-                WHERE quantity <= min_quantity
-                ORDER BY (quantity - min_quantity)
+                SELECT sensor_key, field_location, metric, created_at FROM sensors
+                ORDER BY field_location, metric, sensor_key
             """)
-            low_stock_items = cursor.fetchall()
-            
-            cursor.close()
-        except Exception as e:
-            print(f"Database error in reports: {e}")
-            flash('Error loading some report data', 'error')
+            sensors = cursor.fetchall()
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except Exception as e:
+        app.logger.error("Sensor list error: %s", e)
+        return jsonify({'error': 'Sensors could not be loaded'}), 500
+    return jsonify({'sensors': [dict(row, created_at=row['created_at'].isoformat()) for row in sensors]})
+
+@app.route('/api/sensors/series')
+@login_required
+def sensor_series():
+    # ?field_location=&metric=&start=&end= (ISO 8601 or epoch seconds, end
+    # defaults to now); ?resolution=raw|5m|1h|1d overrides the automatic
+    # choice of the finest source that fits the range in ?max_points= points
+    field_location = request.args.get('field_location')
+    metric = request.args.get('metric')
+    if not field_location or not metric:
+        return jsonify({'error': 'field_location and metric are required'}), 400
+    try:
+        end = parse_time(request.args['end']) if request.args.get('end') else datetime.now(timezone.utc)
+        start = parse_time(request.args['start']) if request.args.get('start') else end - timedelta(days=1)
+    except (ValueError, OverflowError, OSError):
+        return jsonify({'error': 'start and end must be ISO 8601 times or epoch seconds'}), 400
+    if end <= start:
+        return jsonify({'error': 'end must be after start'}), 400
+    resolution = request.args.get('resolution') or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({'error': f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    max_points = min(max(request.args.get('max_points', MAX_POINTS, type=int), 1), MAX_POINTS * 10)
+    
+    try:
+        with db() as cursor:
+            result = series(cursor, field_location, metric, start, end, resolution, max_points)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except Exception as e:
+        app.logger.error("Sensor series error: %s", e)
+        return jsonify({'error': 'Sensor series could not be loaded'}), 500
+    return jsonify(result)
+
+@app.route('/sync')
+@login_required
+def sync_changes():
+    # Delta feed for offline clients: ?since=<next from the previous call>,
+    # optional limit; an empty since starts a full sync
+    try:
+        since = parse_since(request.args.get('since'))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', SYNC_LIMIT, type=int), 1), SYNC_MAX_LIMIT)
+    
+    try:
+        with db() as cursor:
+            result = changes_since(cursor, since, limit)
+    except DatabaseUnavailable:
+        return jsonify({'error': 'Database connection error'}), 503
+    except HorizonUnavailable as e:
+        # Answering would risk skipping a hidden writer's rows for good
+        app.logger.error("Sync horizon unavailable: %s", e)
+        return jsonify({'error': 'Sync is unavailable: the database role cannot see all open transactions'}), 503
+    except Exception as e:
+        app.logger.error("Sync error: %s", e)
+        return jsonify({'error': 'Sync failed'}), 500
+    return jsonify(result)
+
+@app.route('/events')
+@login_required
+def events():
+    # Server-Sent Events for the live dashboards: a comment line every 15s
+    # keeps proxies from closing the stream and notices gone clients
+    if not DATABASE_URL:
+        return Response(status=204)
+    subscriber = change_listener.subscribe()
+    if subscriber is None:
+        return Response('Too many live clients\n', status=503, mimetype='text/plain',
+                        headers={'Retry-After': '30'})
+    
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = change_listener.next_event(subscriber, timeout=15)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event.get('event', 'change')}\ndata: {json.dumps(event)}\n\n"
         finally:
-            release_db_connection(connection)
-    
-    return render_template('reports.html',
-                         production=production,
-                         financial=financial,
-                         quality_distribution=quality_distribution,
-                         operations_summary=operations_summary,
-                         field_performance=field_performance,
-                         employee_summary=employee_summary,
-                         monthly_sales=monthly_sales,
-                         inventory=inventory,
-                         low_stock_items=low_stock_items)
+            change_listener.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/export/<table>.<fmt>')
+@login_required
+def export_table(table, fmt):
+    # /export/harvest.csv?start_date=&end_date=&columns=id,quantity&gzip=1
+    if table not in EXPORT_TABLES or fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Unknown export: {table}.{fmt}'}), 404
+    
+    columns = [column.strip() for column in request.args.get('columns', '').split(',') if column.strip()]
+    try:
+        sql, params = build_export_query(table, columns, date_arg('start_date'), date_arg('end_date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    stream = stream_csv if fmt == 'csv' else stream_ndjson
+    body = stream(get_db_connection, release_db_connection, sql, params, log=app.logger.error)
+    filename = f"{table}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if request.args.get('gzip') == '1':
+        body = gzip_stream(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/cache/stats')
+@admin_required
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/pool/stats')
+@admin_required
+def db_pool_stats():
+    return jsonify(pool_stats() or {})
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape target; set METRICS_TOKEN to require a bearer token
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    
+    extra = []
+    stats = pool_stats()
+    if stats:
+        extra += [
+            ('farm_db_pool_in_use', 'gauge', 'Connections checked out.', stats['in_use']),
+            ('farm_db_pool_idle', 'gauge', 'Idle connections in the pool.', stats['idle']),
+            ('farm_db_pool_waiting', 'gauge', 'Requests waiting for a connection.', stats['waiting']),
+            ('farm_db_pool_max', 'gauge', 'Maximum pool size.', stats['max_size']),
+            ('farm_db_pool_checkouts_total', 'counter', 'Connection checkouts.', stats['checkouts']),
+            ('farm_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection.',
+             stats['wait_seconds_total']),
+            ('farm_db_pool_timeouts_total', 'counter', 'Checkouts that timed out.', stats['timeouts']),
+            ('farm_db_pool_discarded_total', 'counter', 'Broken connections discarded.', stats['discarded'])
+        ]
+    live = change_listener.stats()
+    extra += [
+        ('farm_live_clients', 'gauge', 'Open /events streams.', live['subscribers']),
+        ('farm_live_events_total', 'counter', 'Change notifications received.', live['events']),
+        ('farm_live_reconnects_total', 'counter', 'Change listener reconnects.', live['reconnects'])
+    ]
+    reports = report_executor.stats()
+    extra += [
+        ('farm_report_section_failures_total', 'counter', 'Report sections that raised.', reports['failures']),
+        ('farm_report_section_timeouts_total', 'counter', 'Report sections that timed out.', reports['timeouts'])
+    ]
+    if write_queue is not None:
+        queued = write_queue.stats()
+        extra += [
+            ('farm_write_behind_pending', 'gauge', 'Spooled writes not yet in the database.', queued['pending']),
+            ('farm_write_behind_flushed_total', 'counter', 'Spooled writes committed.', queued['flushed']),
+            ('farm_write_behind_failures_total', 'counter', 'Write-behind flushes that failed.', queued['failures']),
+            ('farm_write_behind_rejected_total', 'counter', 'Writes done synchronously because the queue was full.',
+             queued['rejected']),
+            ('farm_write_behind_dead_letters_total', 'counter', 'Spooled writes the database rejected, set aside.',
+             queued['dead_lettered'])
+        ]
+    cache = result_cache.stats()
+    extra += [
+        ('farm_cache_entries', 'gauge', 'Entries in the result cache.', cache['entries']),
+        ('farm_cache_hits_total', 'counter', 'Result cache hits.', cache['hits']),
+        ('farm_cache_misses_total', 'counter', 'Result cache misses.', cache['misses']),
+        ('farm_cache_evictions_total', 'counter', 'Result cache evictions.', cache['evictions'])
+    ]
+    return Response(route_metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.cli.command('reconcile-stats')
+@click.option('--check', is_flag=True, help='Only report drift, do not rewrite the counters.')
+def reconcile_stats_command(check):
+    """Rebuild the farm_stats dashboard counters from the source tables."""
+    try:
+        with db() as cursor:
+            drift = farm_stats_drift(cursor) if check else reconcile_farm_stats(cursor)
+    except DatabaseUnavailable:
+        raise click.ClickException('Could not connect to database')
+    
+    for key, (stored, actual) in drift.items():
+        click.echo(f"{key}: stored={stored} actual={actual}")
+    if not drift:
+        click.echo('farm_stats is in sync.')
+    elif check:
+        raise SystemExit(1)
+    else:
+        click.echo('farm_stats rebuilt.')
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='List migrations and their state, apply nothing.')
+def migrate_command(status):
+    """Apply pending schema migrations from database/migrations."""
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Could not connect to database')
+
+    try:
+        if status:
+            rows = migration_status(connection)
+        else:
+            applied = migrate(connection, log=click.echo)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    finally:
+        release_db_connection(connection)
+
+    if not status:
+        click.echo(f"Applied {len(applied)} migration(s)." if applied else 'Schema is up to date.')
+        return
+    for version, name, state, applied_at in rows:
+        when = applied_at.strftime('%Y-%m-%d %H:%M:%S') if applied_at else ''
+        click.echo(f"{version:04d}  {name or '?':<30} {state:<8} {when}")
+    if any(state != 'applied' for _, _, state, _ in rows):
+        raise SystemExit(1)
+
+@app.cli.command('partitions')
+@click.option('--ensure', is_flag=True, help='Create the monthly partitions up to PARTITION_MONTHS_AHEAD months ahead.')
+@click.option('--check-pruning', is_flag=True,
+              help='EXPLAIN ANALYZE the date-bounded queries and fail if they read too many partitions.')
+def partitions_command(ensure, check_pruning):
+    """Show the monthly partitions of the date-keyed tables."""
+    try:
+        with db() as cursor:
+            created = ensure_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD) if ensure else None
+            status = partition_status(cursor)
+            checks = check_pruning_queries(cursor) if check_pruning else []
+    except DatabaseUnavailable:
+        raise click.ClickException('Could not connect to database')
+    
+    if created is not None:
+        click.echo(f"Created {created} partition(s).")
+    for row in status:
+        click.echo(f"{row['table_name']:<15} {row['months']:>4} months  {row['first_month'] or '-'} .. "
+                   f"{row['last_month'] or '-'}  history~{row['history_rows']:,}  "
+                   f"future~{row['future_rows']:,}  {row['size']}")
+    if not status:
+        click.echo('No partitioned tables (run flask --app app migrate).')
+    for check in checks:
+        click.echo(f"{'ok ' if check['ok'] else 'BAD'} {check['name']:<34} scanned {len(check['read'])} of "
+                   f"{check['partitions']} partitions ({len(check['expected'])} in range, "
+                   f"{check['removed_at_runtime']} pruned at run time), {check['ms']:.2f} ms")
+        if check['outside']:
+            click.echo(f"    outside the range: {', '.join(check['outside'])}")
+    if any(not check['ok'] for check in checks):
+        raise SystemExit(1)
+
+@app.cli.command('sensor-rollup')
+@click.option('--every', type=float, default=None, help='Keep running, rolling up every SECONDS.')
+def sensor_rollup_command(every):
+    """Fold new sensor readings into the 5-minute, hourly and daily rollups."""
+    while True:
+        try:
+            written = rollup()
+        except DatabaseUnavailable:
+            raise click.ClickException('Could not connect to database')
+        if written is None:
+            click.echo('Sensor rollups are up to date.')
+        else:
+            click.echo('Rolled up ' + ', '.join(f"{count} {level} bucket(s)" for level, count in written.items()) + '.')
+        if every is None:
+            return
+        time.sleep(every)
+
+@app.cli.command('unused-indexes')
+@click.option('--max-scans', default=0, show_default=True, help='Flag indexes scanned at most this many times.')
+def unused_indexes_command(max_scans):
+    """List non-unique indexes the workload has not used since the last stats reset."""
+    try:
+        with db() as cursor:
+            rows = unused_indexes(cursor, max_scans=max_scans)
+    except DatabaseUnavailable:
+        raise click.ClickException('Could not connect to database')
+    
+    if not rows:
+        click.echo('Every index has been used.')
+        return
+    since = rows[0]['stats_since']
+    click.echo(f"Statistics collected since {since:%Y-%m-%d %H:%M}" if since else
+               'Statistics collected since the cluster was initialised')
+    for row in rows:
+        click.echo(f"{row['index_name']:<45} {row['table_name']:<16} {row['size']:>10}  scans={row['idx_scan']}")
+    raise SystemExit(1)
+
+@app.cli.command('slow-queries')
+@click.option('--log', 'log_path', default=None, help='Log file (default: SLOW_QUERY_LOG).')
+@click.option('--top', default=20, show_default=True, help='Number of fingerprints to show.')
+@click.option('--sort', type=click.Choice(['total', 'count', 'max', 'mean']), default='total', show_default=True)
+@click.option('--plans', is_flag=True, help='Print the latest captured plan of each fingerprint.')
+def slow_queries_command(log_path, top, sort, plans):
+    """Summarise the slow-query log by normalized query fingerprint."""
+    log_path = log_path or slow_query_log.path
+    records = list(read_log(log_path))
+    if not records:
+        click.echo(f"No entries in {log_path}")
+        return
+    
+    groups = summarize(records)
+    sort_key = {'total': 'total_ms', 'count': 'count', 'max': 'max_ms', 'mean': 'mean_ms'}[sort]
+    groups.sort(key=lambda group: group[sort_key], reverse=True)
+    click.echo(f"{len(records)} entries, {len(groups)} fingerprints in {log_path}\n")
+    click.echo(f"{'fingerprint':<12} {'count':>6} {'errors':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}  routes")
+    for group in groups[:top]:
+        click.echo(f"{group['fingerprint']:<12} {group['count']:>6} {group['errors']:>6} "
+                   f"{group['total_ms']:>10.1f} {group['mean_ms']:>9.1f} {group['max_ms']:>9.1f}  "
+                   f"{', '.join(group['routes'])}")
+        click.echo(f"    {group['sql'][:160]}")
+    
+    if plans:
+        latest = {}
+        for record in records:
+            if record.get('plan'):
+                latest[record['fingerprint']] = record['plan']
+        for group in groups[:top]:
+            if group['fingerprint'] in latest:
+                click.echo(f"\n-- {group['fingerprint']}")
+                click.echo(json.dumps(latest[group['fingerprint']], indent=2))
+
+@app.cli.command('import-csv')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_SPECS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Validate and stage the rows, then roll back.')
+def import_csv_command(kind, path, dry_run):
+    """Bulk-load harvest, sales, planting, operations or task records from a CSV file."""
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Could not connect to database')
+    
+    started = datetime.now()
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = import_csv(connection, kind, f, dry_run=dry_run)
+    finally:
+        release_db_connection(connection)
+    elapsed = (datetime.now() - started).total_seconds()
+    
+    for error in report['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if report['error_count'] > len(report['errors']):
+        click.echo(f"... {report['error_count'] - len(report['errors'])} more errors", err=True)
+    action = 'validated' if dry_run else 'imported'
+    click.echo(f"{report['inserted']} of {report['rows']} rows {action}, "
+               f"{report['error_count']} errors, {elapsed:.2f}s")
+    if report['error_count']:
+        raise SystemExit(1)
+
+@app.cli.command('generate-data')
+@click.option('--rows', default='1m', show_default=True, help='Total rows across all tables: 100k, 10m or a number.')
+@click.option('--table', 'overrides', multiple=True, metavar='TABLE=ROWS', help='Set one table\'s row count.')
+@click.option('--workers', default=0, help='Writer processes (default: one per CPU).')
+@click.option('--batch-size', default=100000, show_default=True, help='Rows per COPY batch.')
+@click.option('--seed', default=1, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--years', default=3, show_default=True, help='Years of history, ending today.')
+def generate_data_command(rows, overrides, workers, batch_size, seed, years):
+    """Append synthetic plantings, harvests, sales, field logs and tasks via COPY."""
+    # NumPy is only needed for this command
+    from datagen import GENERATORS, generate, plan_counts
+    
+    if not DATABASE_URL:
+        raise click.ClickException('DATABASE_URL is not set')
+    table_rows = {}
+    for override in overrides:
+        table, _, count = override.partition('=')
+        if table not in GENERATORS or not count:
+            raise click.BadParameter(f"expected TABLE=ROWS with TABLE one of {', '.join(GENERATORS)}",
+                                     param_hint='--table')
+        table_rows[table] = parse_scale(count)
+    counts = plan_counts(parse_scale(rows), overrides=table_rows)
+    
+    started = datetime.now()
+    written = generate(DATABASE_URL, counts, seed=seed, workers=workers or None, batch_size=batch_size,
+                       days=years * 365,
+                       progress=lambda table, done, total: click.echo(f"  {table}: {done:,}/{total:,}", err=True))
+    elapsed = (datetime.now() - started).total_seconds()
+    
+    total = sum(written.values())
+    for table, count in written.items():
+        click.echo(f"{table}: {count:,} rows")
+    click.echo(f"{total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 0.001):,.0f} rows/s)")
+
+@app.cli.group()
+def bench():
+    """Seed a benchmark database and measure every route."""
+
+@bench.command('seed')
+@click.option('--scale', default='1k', show_default=True,
+              help='Harvest rows: 1k, 100k, 1m, 10m or a number; other tables scale with it.')
+@click.option('--seed', default=0.42, show_default=True, help='Random seed (-1..1) for reproducible data.')
+@click.option('--yes', is_flag=True, help='Do not ask before replacing the existing records.')
+def bench_seed_command(scale, seed, yes):
+    """Replace the farm records with generated data at the given scale."""
+    harvest_rows = parse_scale(scale)
+    if not yes:
+        click.confirm(f'This deletes ALL farm records in the DATABASE_URL database and loads '
+                      f'{harvest_rows:,} harvest rows. Continue?', abort=True)
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Could not connect to database')
+    
+    started = datetime.now()
+    try:
+        sizes = seed_database(connection, harvest_rows, seed=seed)
+    finally:
+        release_db_connection(connection)
+    result_cache.clear()
+    elapsed = (datetime.now() - started).total_seconds()
+    for table, rows in sizes.items():
+        click.echo(f"{table}: {rows:,} rows")
+    click.echo(f"Seeded in {elapsed:.1f}s")
+
+@bench.command('run')
+@click.option('--requests', default=50, show_default=True, help='Requests per read route.')
+@click.option('--concurrency', default=4, show_default=True, help='Concurrent clients for read routes.')
+@click.option('--writes', default=20, show_default=True, help='Write-path iterations (0 skips them).')
+@click.option('--cache/--no-cache', default=False, show_default=True,
+              help='Keep the read-view result cache on while measuring.')
+@click.option('--save', 'save_path', type=click.Path(dir_okay=False), help='Write the results as a JSON baseline.')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='Fail if p95 latency regresses against this baseline.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed p95 growth as a fraction.')
+def bench_run_command(requests, concurrency, writes, cache, save_path, baseline_path, tolerance):
+    """Drive every route and report throughput and p50/p95/p99 latency."""
+    max_entries = result_cache.max_entries
+    if not cache:
+        result_cache.max_entries = 0
+    try:
+        results = run_benchmark(app, requests=requests, concurrency=concurrency, write_iterations=writes,
+                                progress=lambda name: click.echo(f"  {name}...", err=True))
+    finally:
+        result_cache.max_entries = max_entries
+    results['meta']['cache'] = cache
+    
+    click.echo(f"rows: " + ', '.join(f"{table}={n:,}" for table, n in results['meta']['rows'].items()))
+    click.echo(f"{'route':<24} {'count':>6} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, route in results['routes'].items():
+        click.echo(f"{name:<24} {route['count']:>6} {route['errors']:>6} {route['rps']:>9.1f} "
+                   f"{route['p50_ms']:>9.2f} {route['p95_ms']:>9.2f} {route['p99_ms']:>9.2f}")
+    
+    if save_path:
+        save_results(results, save_path)
+        click.echo(f"Saved baseline to {save_path}")
+    if baseline_path:
+        baseline = load_results(baseline_path)
+        if baseline['meta'].get('rows') != results['meta']['rows']:
+            click.echo('Warning: row counts differ from the baseline run.', err=True)
+        regressions = compare(results, baseline, tolerance=tolerance)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}", err=True)
+        if regressions:
+            raise SystemExit(1)
+        click.echo(f"No regressions against {baseline_path}")
+
+@bench.command('indexes')
+@click.option('--runs', default=3, show_default=True, help='Timed EXPLAIN ANALYZE runs per query.')
+@click.option('--plans', is_flag=True, help='Print the scan nodes of each plan.')
+@click.option('--set', 'settings', multiple=True, metavar='NAME=VALUE',
+              help='Planner setting for the runs, e.g. random_page_cost=1.1 (repeatable).')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def bench_indexes_command(runs, plans, settings, yes):
+    """Time the report and list queries with and without the index pack."""
+    try:
+        settings = dict(setting.split('=', 1) for setting in settings)
+    except ValueError:
+        raise click.BadParameter('expected NAME=VALUE', param_hint='--set')
+    if not yes:
+        click.confirm('The "before" runs drop the index pack inside a rolled-back transaction, '
+                      'locking the tables meanwhile. Continue?', abort=True)
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Could not connect to database')
+    
+    try:
+        results = compare_index_pack(connection, runs=runs, settings=settings)
+    finally:
+        release_db_connection(connection)
+    if results['missing']:
+        click.echo(f"Not installed (run migrations): {', '.join(results['missing'])}", err=True)
+    click.echo(f"{'query':<38} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, result in results['queries'].items():
+        before, after = result['before'], result['after']
+        speedup = before['ms'] / after['ms'] if after['ms'] else float('inf')
+        click.echo(f"{name:<38} {before['ms']:>10.2f} {after['ms']:>10.2f} {speedup:>7.1f}x")
+        if plans:
+            click.echo(f"    before: {'; '.join(before['scans'])}")
+            click.echo(f"    after:  {'; '.join(after['scans'])}")
 
 if __name__ == '__main__':
     print("Initializing connection pool...")
     init_pool()
     print("Initializing database...")
     init_db()
+    change_listener.start()
+    if write_queue is not None:
+        write_queue.start()
     print("Starting Flask server on http://0.0.0.0:5000")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,355 @@
+import json
+import math
+import platform
+import threading
+import time
+import uuid
+from datetime import date, datetime
+
+from psycopg2 import extras
+
+from db import db
+from farm_stats import reconcile_farm_stats
+from pagination import count_rows, encode_cursor
+from partitions import ensure_partitions
+
+# Load/benchmark harness for the Flask app.
+#
+# `seed_database` fills the domain tables at a given scale (harvest rows;
+# the other tables are sized relative to it) with reproducible random data
+# generated inside Postgres.  `run_benchmark` drives every view through
+# Flask test clients with an admin session - first pages, deep keyset
+# pages, filtered lists, the type-ahead, index and reports - plus the
+# add/start/finish/delete write paths, and reports latency percentiles and
+# throughput per route.  Results can be saved as JSON baselines and
+# compared against later runs.
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000, '10m': 10000000}
+
+SEED_TABLES = ('harvest', 'sales', 'operations', 'employee_tasks', 'inventory', 'tomato_plants')
+
+VARIETIES = ['Roma', 'Cherry', 'Beefsteak', 'Heirloom', 'Plum', 'Grape']
+VARIETY_DAYS = [75, 60, 85, 80, 70, 65]
+
+# Generated dates fall in 2022-2025
+SEED_FIRST_DATE = date(2022, 1, 1)
+SEED_LAST_DATE = date(2025, 12, 31)
+
+
+def parse_scale(text):
+    text = str(text).strip().lower().replace('_', '')
+    if text in SCALES:
+        return SCALES[text]
+    multiplier = 1
+    if text[-1:] in ('k', 'm'):
+        multiplier = 1000 if text[-1] == 'k' else 1000000
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+
+def table_sizes(harvest_rows):
+    return {
+        'tomato_plants': max(10, harvest_rows // 10),
+        'harvest': harvest_rows,
+        'sales': max(10, harvest_rows // 5),
+        'operations': max(10, harvest_rows // 10),
+        'employee_tasks': max(10, harvest_rows // 100),
+        'inventory': max(10, min(5000, harvest_rows // 100)),
+    }
+
+
+def seed_database(connection, harvest_rows, seed=0.42):
+    # Replaces the contents of the domain tables.  Runs in one transaction;
+    # TRUNCATE bypasses the farm_stats triggers, so the counters are rebuilt
+    # at the end.
+    sizes = table_sizes(harvest_rows)
+    cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
+    cursor.execute(f"TRUNCATE {', '.join(SEED_TABLES)} RESTART IDENTITY CASCADE")
+    ensure_partitions(cursor, SEED_FIRST_DATE, SEED_LAST_DATE)
+    cursor.execute("SELECT setseed(%s)", (seed,))
+    cursor.execute("""
+        INSERT INTO tomato_plants
+        (variety, planting_date, expected_harvest_date, status, field_location, quantity, notes)
+        SELECT (%s::text[])[k], d, d + (%s::int[])[k],
+               (ARRAY['Planted', 'Growing', 'Flowering', 'Fruiting', 'Harvested'])[1 + floor(random() * 5)::int],
+               'Field ' || chr(65 + floor(random() * 8)::int),
+               1 + floor(random() * 200)::int, ''
+        FROM (SELECT 1 + floor(random() * 6)::int AS k,
+                     DATE '2022-01-01' + floor(random() * 1460)::int AS d
+              FROM generate_series(1, %s)) s
+    """, (VARIETIES, VARIETY_DAYS, sizes['tomato_plants']))
+    cursor.execute("""
+        INSERT INTO harvest (plant_id, harvest_date, quantity, unit, quality_grade, notes)
+        SELECT 1 + floor(random() * %s)::int,
+               DATE '2022-03-01' + floor(random() * 1400)::int,
+               round((1 + random() * 49)::numeric, 2),
+               CASE WHEN random() < 0.9 THEN 'kg' ELSE 'crates' END,
+               (ARRAY['Grade A', 'Grade A', 'Grade A', 'Grade B', 'Grade B', 'Grade C'])[1 + floor(random() * 6)::int],
+               ''
+        FROM generate_series(1, %s)
+    """, (sizes['tomato_plants'], sizes['harvest']))
+    cursor.execute("""
+        INSERT INTO sales
+        (sale_date, customer_name, quantity, unit, price_per_unit, total_amount, payment_status, notes)
+        SELECT d, 'Customer ' || (1 + floor(random() * 500)::int), q, 'kg', p, round(q * p, 2),
+               CASE WHEN random() < 0.8 THEN 'Paid' ELSE 'Pending' END, ''
+        FROM (SELECT DATE '2022-03-01' + floor(random() * 1400)::int AS d,
+                     round((5 + random() * 95)::numeric, 2) AS q,
+                     round((20 + random() * 80)::numeric, 2) AS p
+              FROM generate_series(1, %s)) s
+    """, (sizes['sales'],))
+    cursor.execute("""
+        INSERT INTO operations
+        (operation_type, operation_date, field_location, description, cost, performed_by, notes)
+        SELECT (ARRAY['Spraying', 'Weeding', 'Irrigation', 'Fertilizing', 'Pruning'])[1 + floor(random() * 5)::int],
+               DATE '2022-01-01' + floor(random() * 1460)::int,
+               'Field ' || chr(65 + floor(random() * 8)::int),
+               'Routine work', round((random() * 500)::numeric, 2),
+               'Worker ' || (1 + floor(random() * 10)::int), ''
+        FROM generate_series(1, %s)
+    """, (sizes['operations'],))
+    cursor.execute("""
+        INSERT INTO employee_tasks
+        (employee_number, task_date, task_type, field_location, description, estimated_hours, status)
+        SELECT 1 + floor(random() * 10)::int,
+               DATE '2022-01-01' + floor(random() * 1460)::int,
+               (ARRAY['Planting', 'Harvesting', 'Weeding', 'Irrigation', 'Spraying'])[1 + floor(random() * 5)::int],
+               'Field ' || chr(65 + floor(random() * 8)::int),
+               'Scheduled work', round((1 + random() * 7)::numeric, 1),
+               (ARRAY['Pending', 'In Progress', 'Completed'])[1 + floor(random() * 3)::int]
+        FROM generate_series(1, %s)
+    """, (sizes['employee_tasks'],))
+    cursor.execute("""
+        INSERT INTO inventory (item_name, category, quantity, unit, min_quantity, supplier)
+        SELECT (ARRAY['Seeds', 'Fertilizer', 'Pesticide', 'Tool', 'Stake'])[1 + g %% 5] || ' ' || g,
+               (ARRAY['Seeds', 'Fertilizers', 'Pesticides', 'Equipment', 'Supplies'])[1 + g %% 5],
+               round((random() * 1000)::numeric, 2), 'units', round((random() * 100)::numeric, 2),
+               'Supplier ' || (1 + g %% 20)
+        FROM generate_series(1, %s) g
+    """, (sizes['inventory'],))
+    reconcile_farm_stats(cursor)
+    cursor.close()
+    connection.commit()
+
+    connection.autocommit = True
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"VACUUM ANALYZE {', '.join(SEED_TABLES)}")
+        cursor.close()
+    finally:
+        connection.autocommit = False
+    return sizes
+
+
+def _deep_cursor(cursor, table, key_columns, descending=True, depth=0.9):
+    # Keyset cursor positioned `depth` of the way through the list
+    estimate, _ = count_rows(cursor, table)
+    offset = int((estimate or 0) * depth)
+    direction = 'DESC' if descending else 'ASC'
+    cursor.execute(f"SELECT {', '.join(key_columns)} FROM {table} "
+                   f"ORDER BY {', '.join(f'{c} {direction}' for c in key_columns)} OFFSET %s LIMIT 1",
+                   (offset,))
+    row = cursor.fetchone()
+    return encode_cursor(list(row.values())) if row else None
+
+
+def read_scenarios():
+    # (name, path) pairs; deep pages seek to 90% of each list
+    with db() as cursor:
+        deep = {
+            'planting': _deep_cursor(cursor, 'tomato_plants', ['planting_date', 'id']),
+            'harvesting': _deep_cursor(cursor, 'harvest', ['harvest_date', 'id']),
+            'inventory': _deep_cursor(cursor, 'inventory', ['item_name', 'id'], descending=False),
+            'operations': _deep_cursor(cursor, 'operations', ['operation_date', 'id']),
+            'sales': _deep_cursor(cursor, 'sales', ['sale_date', 'id']),
+        }
+        cursor.execute("SELECT max(sale_date) AS last FROM sales")
+        last_sale = cursor.fetchone()['last']
+
+    scenarios = [('index', '/'), ('reports', '/reports'), ('employee_tasks', '/employee_tasks'),
+                 ('plants_search', '/plants/search?q=Roma+2023')]
+    for view in ('planting', 'harvesting', 'inventory', 'operations', 'sales'):
+        scenarios.append((view, f'/{view}'))
+        if deep[view]:
+            scenarios.append((f'{view}_deep', f'/{view}?after={deep[view]}'))
+    scenarios.append(('operations_filtered', '/operations?operation_type=Spraying'))
+    if last_sale:
+        month = last_sale.replace(day=1).isoformat()
+        scenarios.append(('sales_filtered', f'/sales?payment_status=Pending&start_date={month}'))
+    return scenarios
+
+
+def _admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_type'] = 'admin'
+        session['username'] = 'Benchmark'
+    return client
+
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _summary(latencies, errors, wall_seconds):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'rps': round(len(values) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(_percentile(values, 50) * 1000, 3),
+        'p95_ms': round(_percentile(values, 95) * 1000, 3),
+        'p99_ms': round(_percentile(values, 99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def _run_read(app, path, requests, concurrency, warmup):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        client = _admin_client(app)
+        for _ in range(warmup):
+            client.get(path)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(latencies, errors[0], time.perf_counter() - started)
+
+
+def _lookup_id(table, column, marker):
+    with db() as cursor:
+        cursor.execute(f"SELECT max(id) AS id FROM {table} WHERE {column} = %s", (marker,))
+        return cursor.fetchone()['id']
+
+
+def _run_writes(app, iterations):
+    # One iteration adds a record of every kind, walks the new task through
+    # start/finish, then deletes everything it created.
+    client = _admin_client(app)
+    latencies = {}
+    errors = {}
+    wall = {}
+    today = datetime.now().date().isoformat()
+
+    def timed(name, path, data=None):
+        started = time.perf_counter()
+        response = client.post(path, data=data or {})
+        elapsed = time.perf_counter() - started
+        latencies.setdefault(name, []).append(elapsed)
+        wall[name] = wall.get(name, 0.0) + elapsed
+        # Handlers redirect on success and failure alike; failures flash an error
+        failed = response.status_code >= 400
+        if not failed:
+            with client.session_transaction() as session:
+                flashes = session.pop('_flashes', [])
+            failed = any(category == 'error' for category, _ in flashes)
+        errors[name] = errors.get(name, 0) + (1 if failed else 0)
+
+    for _ in range(iterations):
+        marker = f"bench-{uuid.uuid4().hex[:12]}"
+        timed('add_planting', '/planting/add', {'variety': 'Roma', 'planting_date': today,
+                                                'field_location': 'Bench', 'quantity': '5', 'notes': marker})
+        plant_id = _lookup_id('tomato_plants', 'notes', marker)
+        timed('add_harvest', '/harvesting/add', {'plant_id': str(plant_id), 'harvest_date': today,
+                                                 'quantity': '12.5', 'notes': marker})
+        timed('add_inventory', '/inventory/add', {'item_name': marker, 'category': 'Supplies',
+                                                  'quantity': '10', 'unit': 'units', 'supplier': marker})
+        timed('add_operation', '/operations/add', {'operation_type': 'Weeding', 'operation_date': today,
+                                                   'description': marker})
+        timed('add_sale', '/sales/add', {'sale_date': today, 'quantity': '3', 'price_per_unit': '40',
+                                         'notes': marker})
+        timed('add_employee_task', '/employee_tasks/add', {'employee_number': '3', 'task_date': today,
+                                                           'task_type': 'Weeding', 'description': marker})
+        task_id = _lookup_id('employee_tasks', 'description', marker)
+        timed('start_task', f'/employee_tasks/start/{task_id}')
+        timed('finish_task', f'/employee_tasks/finish/{task_id}')
+
+        timed('delete_employee_task', f'/employee_tasks/delete/{task_id}')
+        timed('delete_sale', f"/sales/delete/{_lookup_id('sales', 'notes', marker)}")
+        timed('delete_operation', f"/operations/delete/{_lookup_id('operations', 'description', marker)}")
+        timed('delete_inventory', f"/inventory/delete/{_lookup_id('inventory', 'supplier', marker)}")
+        timed('delete_harvest', f"/harvesting/delete/{_lookup_id('harvest', 'notes', marker)}")
+        timed('delete_planting', f'/planting/delete/{plant_id}')
+
+    return {name: _summary(values, errors[name], wall[name]) for name, values in latencies.items()}
+
+
+def run_benchmark(app, requests=50, concurrency=4, warmup=2, write_iterations=20, progress=None):
+    with db() as cursor:
+        cursor.execute(" UNION ALL ".join(
+            f"SELECT '{table}' AS name, count(*) AS n FROM {table}" for table in SEED_TABLES))
+        rows = {row['name']: row['n'] for row in cursor.fetchall()}
+
+    results = {}
+    for name, path in read_scenarios():
+        if progress:
+            progress(name)
+        results[name] = _run_read(app, path, requests, concurrency, warmup)
+    if write_iterations:
+        if progress:
+            progress('write paths')
+        results.update(_run_writes(app, write_iterations))
+
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'requests': requests,
+            'concurrency': concurrency,
+            'write_iterations': write_iterations,
+            'rows': rows,
+        },
+        'routes': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.25, min_delta_ms=5.0):
+    # p95 may grow by `tolerance` (fraction) and at least min_delta_ms
+    # before it counts as a regression; new errors always do
+    regressions = []
+    for name, base in baseline['routes'].items():
+        now = current['routes'].get(name)
+        if now is None:
+            continue
+        limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + min_delta_ms)
+        if now['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {now['p95_ms']:.1f}ms > {limit:.1f}ms "
+                               f"(baseline {base['p95_ms']:.1f}ms)")
+        if now['errors'] > base['errors']:
+            regressions.append(f"{name}: {now['errors']} errors (baseline {base['errors']})")
+    return regressions
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
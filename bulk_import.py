@@ -0,0 +1,370 @@
+import csv
+import io
+import math
+import re
+from datetime import date, time
+from decimal import ROUND_HALF_UP, Decimal
+
+# Bulk CSV import for harvest, sales, planting, operations and employee
+# task records.
+#
+# The CSV is parsed as a stream and validated chunk by chunk.  Valid rows
+# are written in COPY text format into a temporary staging table, and the
+# staging table is merged into the real table with one INSERT ... SELECT in
+# the same transaction, so an import is all-or-nothing for the valid rows
+# and the farm_stats triggers fire once.  Invalid rows are skipped and
+# reported by CSV line number.
+#
+# Column names and defaults follow the add_* form handlers in app.py.
+# The JSON bulk-write API (bulk_write.py) validates its records with the
+# same specs through validate_record().
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+# DECIMAL(10,2) columns hold values below 10^8 after rounding to cents;
+# INT columns hold int4
+MAX_DECIMAL = 1e8
+CENT = Decimal('0.01')
+INT_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(value, default=''):
+    return value if value else default
+
+
+def _required_text(value):
+    if not value:
+        raise RowError('is required')
+    return value
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise RowError(f"'{value}' is not a YYYY-MM-DD date")
+
+
+def _required_date(value):
+    if not value:
+        raise RowError('is required')
+    return _date(value)
+
+
+def _optional_date(value):
+    return _date(value) if value else None
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"'{value}' is not a number")
+    if not math.isfinite(number):
+        raise RowError(f"'{value}' is not a number")
+    if abs(number) >= MAX_DECIMAL or _overflows_cents(str(value)):
+        raise RowError(f"'{value}' is out of range")
+    return number
+
+
+def _overflows_cents(text):
+    # Postgres rounds half away from zero to the column's two decimals, so
+    # 99999999.995 no longer fits
+    return abs(Decimal(text).quantize(CENT, rounding=ROUND_HALF_UP)) >= MAX_DECIMAL
+
+
+def _required_number(value):
+    if not value:
+        raise RowError('is required')
+    _number(value)
+    return value
+
+
+def _optional_int(value, default=None):
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise RowError(f"'{value}' is not a whole number")
+    if not INT_RANGE[0] <= number <= INT_RANGE[1]:
+        raise RowError(f"'{value}' is out of range")
+    return str(number)
+
+
+def _optional_number(default):
+    def parse(value):
+        if not value:
+            return default
+        _number(value)
+        return value
+    return parse
+
+
+def _optional_time(value):
+    if not value:
+        return None
+    try:
+        return time.fromisoformat(value).isoformat()
+    except ValueError:
+        raise RowError(f"'{value}' is not a HH:MM time")
+
+
+def _employee_number(value):
+    number = _optional_int(value)
+    if number is None:
+        raise RowError('is required')
+    if not 1 <= int(number) <= 10:
+        raise RowError(f"'{value}' is not between 1 and 10")
+    return number
+
+
+def _sale_total(row):
+    # Same arithmetic as add_sale(): float(quantity) * float(price_per_unit)
+    total = float(row['quantity']) * float(row['price_per_unit'])
+    if abs(total) >= MAX_DECIMAL or _overflows_cents(repr(total)):
+        raise RowError('is out of range')
+    return repr(total)
+
+
+IMPORT_SPECS = {
+    'harvest': {
+        'table': 'harvest',
+        'fields': [
+            ('plant_id', 'plant_id', _optional_int),
+            ('harvest_date', 'harvest_date', _required_date),
+            ('quantity', 'quantity', _required_number),
+            ('unit', 'unit', lambda v: _text(v, 'kg')),
+            ('quality_grade', 'quality_grade', lambda v: _text(v, 'Grade A')),
+            ('notes', 'notes', _text),
+        ],
+    },
+    'sales': {
+        'table': 'sales',
+        'fields': [
+            ('sale_date', 'sale_date', _required_date),
+            ('customer_name', 'customer_name', _text),
+            ('quantity', 'quantity', _required_number),
+            ('unit', 'unit', lambda v: _text(v, 'kg')),
+            ('price_per_unit', 'price_per_unit', _required_number),
+            ('payment_status', 'payment_status', lambda v: _text(v, 'Pending')),
+            ('notes', 'notes', _text),
+        ],
+        'computed': [
+            ('total_amount', _sale_total),
+        ],
+    },
+    'planting': {
+        'table': 'tomato_plants',
+        'fields': [
+            ('variety', 'variety', _required_text),
+            ('planting_date', 'planting_date', _required_date),
+            ('expected_harvest', 'expected_harvest_date', _optional_date),
+            ('field_location', 'field_location', _text),
+            ('quantity', 'quantity', lambda v: _optional_int(v, '1')),
+            ('status', 'status', lambda v: _text(v, 'Growing')),
+            ('notes', 'notes', _text),
+        ],
+    },
+    'operations': {
+        'table': 'operations',
+        'fields': [
+            ('operation_type', 'operation_type', _required_text),
+            ('operation_date', 'operation_date', _required_date),
+            ('field_location', 'field_location', _text),
+            ('description', 'description', _required_text),
+            ('cost', 'cost', _optional_number('0')),
+            ('performed_by', 'performed_by', _text),
+            ('notes', 'notes', _text),
+        ],
+    },
+    'employee_tasks': {
+        'table': 'employee_tasks',
+        'fields': [
+            ('employee_number', 'employee_number', _employee_number),
+            ('task_date', 'task_date', _required_date),
+            ('task_type', 'task_type', _required_text),
+            ('field_location', 'field_location', _text),
+            ('description', 'description', _required_text),
+            ('start_time', 'start_time', _optional_time),
+            ('estimated_hours', 'estimated_hours', _optional_number(None)),
+            ('status', 'status', lambda v: _text(v, 'Pending')),
+        ],
+    },
+}
+
+REQUIRED_PARSERS = (_required_text, _required_date, _required_number, _employee_number)
+
+
+_COPY_SPECIALS = re.compile(r'[\\\t\n\r]')
+
+
+def _copy_escape(value):
+    if value is None:
+        return '\\N'
+    if _COPY_SPECIALS.search(value) is None:
+        return value
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                 .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def spec_columns(spec):
+    return [column for _, column, _ in spec['fields']] + [column for column, _ in spec.get('computed', [])]
+
+
+def _row_plan(spec, header, max_lengths):
+    # (csv index or None, header, column, parser, max length) per field
+    positions = {name.strip(): index for index, name in enumerate(header)}
+    return [(positions.get(name), name, column, parse, max_lengths.get(column))
+            for name, column, parse in spec['fields']]
+
+
+def column_limits(cursor, table):
+    # {column: max length} for the table's varchar columns
+    cursor.execute("""
+        SELECT column_name, character_maximum_length
+        FROM information_schema.columns
+        WHERE table_name = %s AND character_maximum_length IS NOT NULL
+    """, (table,))
+    return dict(cursor.fetchall())
+
+
+def validate_row(spec, plan, raw):
+    values = []
+    for index, header, column, parse, limit in plan:
+        value = raw[index].strip() if index is not None and index < len(raw) else ''
+        try:
+            value = parse(value)
+        except RowError as e:
+            raise RowError(f"{header}: {e}")
+        if limit and value and len(value) > limit:
+            raise RowError(f"{header}: longer than {limit} characters")
+        values.append(value)
+    computed = spec.get('computed')
+    if computed:
+        named = dict(zip((column for _, _, column, _, _ in plan), values))
+        for column, compute in computed:
+            try:
+                values.append(compute(named))
+            except RowError as e:
+                raise RowError(f"{column}: {e}")
+    return values
+
+
+def record_plan(spec, max_lengths):
+    # A plan for validate_record(): JSON records carry the CSV header names
+    # as keys
+    return _row_plan(spec, [name for name, _, _ in spec['fields']], max_lengths)
+
+
+def validate_record(spec, plan, record):
+    # record: a JSON object.  Numbers are accepted as their text, null or a
+    # missing key as an empty value; returns the column values.
+    raw = []
+    for _, name, _, _, _ in plan:
+        value = record.get(name)
+        if value is None:
+            value = ''
+        elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise RowError(f"{name}: must be a string or a number")
+        raw.append(str(value))
+    return validate_row(spec, plan, raw)
+
+
+def import_csv(connection, kind, stream, dry_run=False, chunk_size=CHUNK_SIZE):
+    # stream: a text file object.  Returns a report dict; the caller owns
+    # the connection, and the import is committed here unless dry_run.
+    spec = IMPORT_SPECS[kind]
+    columns = spec_columns(spec)
+    report = {'kind': kind, 'rows': 0, 'inserted': 0, 'error_count': 0, 'errors': [], 'dry_run': dry_run}
+
+    def add_error(line, message):
+        report['error_count'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'error': message})
+
+    reader = csv.reader(stream)
+    header = [name.strip() for name in next(reader, [])]
+    missing = [name for name, _, parse in spec['fields']
+               if parse in REQUIRED_PARSERS and name not in header]
+    if missing:
+        add_error(1, 'missing required column(s): ' + ', '.join(missing))
+        return report
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE TEMP TABLE import_staging ON COMMIT DROP AS
+            SELECT {', '.join(columns)} FROM {spec['table']} WITH NO DATA
+        """)
+        cursor.execute("ALTER TABLE import_staging ADD COLUMN line_no INT")
+        plan = _row_plan(spec, header, column_limits(cursor, spec['table']))
+        copy_sql = f"COPY import_staging ({', '.join(columns)}, line_no) FROM STDIN"
+
+        buffer = io.StringIO()
+        buffered = 0
+        for raw in reader:
+            if not raw:
+                continue
+            report['rows'] += 1
+            # line_num counts physical lines, so quoted newlines stay right
+            line = reader.line_num
+            try:
+                values = validate_row(spec, plan, raw)
+            except RowError as e:
+                add_error(line, str(e))
+                continue
+            values.append(str(line))
+            buffer.write('\t'.join(map(_copy_escape, values)))
+            buffer.write('\n')
+            buffered += 1
+            if buffered >= chunk_size:
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+                buffer = io.StringIO()
+                buffered = 0
+        if buffered:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+
+        merge_filter = ''
+        if kind == 'harvest':
+            # Report dangling plant ids instead of failing the whole merge
+            cursor.execute("""
+                SELECT s.line_no, s.plant_id FROM import_staging s
+                WHERE s.plant_id IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM tomato_plants p WHERE p.id = s.plant_id)
+                ORDER BY s.line_no
+            """)
+            for line, plant_id in cursor.fetchall():
+                add_error(line, f"plant_id: plant {plant_id} does not exist")
+            merge_filter = """
+                WHERE s.plant_id IS NULL
+                   OR EXISTS (SELECT 1 FROM tomato_plants p WHERE p.id = s.plant_id)
+            """
+
+        cursor.execute(f"""
+            INSERT INTO {spec['table']} ({', '.join(columns)})
+            SELECT {', '.join('s.' + column for column in columns)}
+            FROM import_staging s
+            {merge_filter}
+            ORDER BY s.line_no
+        """)
+        report['inserted'] = cursor.rowcount
+
+        if dry_run:
+            connection.rollback()
+        else:
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
@@ -0,0 +1,117 @@
+from psycopg2 import extras
+
+from bulk_import import IMPORT_SPECS, RowError, column_limits, record_plan, spec_columns, validate_record
+
+# JSON bulk writes for the field tablets.
+#
+# A batch of records (harvest, sales, planting, operations or
+# employee_tasks) is validated as a whole with the CSV import specs; if any
+# record is invalid nothing is written and the errors are returned by array
+# index.  A valid batch is inserted with one multi-row INSERT (execute_values)
+# in the caller's transaction, so it costs a handful of round trips and the
+# farm_stats statement triggers fire once.
+#
+# Records may carry an idempotency_key.  Keys are claimed in the
+# idempotency_keys table (migration 0005) before the insert; a key that is
+# already taken - a retried upload, or a concurrent one that committed
+# first - skips its record and returns the id it was stored under.
+
+MAX_RECORDS = 1000
+MAX_KEY_LENGTH = 200
+KEY_RETENTION_DAYS = 7
+
+
+def _parse_records(cursor, spec, records):
+    # (values, keys, errors) for the batch
+    plan = record_plan(spec, column_limits(cursor, spec['table']))
+    values = []
+    keys = []
+    errors = []
+    seen = set()
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'error': 'must be a JSON object'})
+            continue
+        key = record.get('idempotency_key')
+        if key is not None:
+            if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+                errors.append({'index': index, 'error': f'idempotency_key: must be 1-{MAX_KEY_LENGTH} characters'})
+                continue
+            if key in seen:
+                errors.append({'index': index, 'error': f"idempotency_key: '{key}' repeats in this batch"})
+                continue
+            seen.add(key)
+        try:
+            values.append(validate_record(spec, plan, record))
+        except RowError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        keys.append(key)
+    return values, keys, errors
+
+
+def _missing_plants(cursor, spec, values):
+    # (index, plant_id) for harvest records whose plant does not exist
+    position = spec_columns(spec).index('plant_id')
+    plant_ids = {int(row[position]) for row in values if row[position] is not None}
+    if not plant_ids:
+        return []
+    cursor.execute("SELECT id FROM tomato_plants WHERE id = ANY(%s)", (list(plant_ids),))
+    found = {row[0] for row in cursor.fetchall()}
+    return [(index, row[position]) for index, row in enumerate(values)
+            if row[position] is not None and int(row[position]) not in found]
+
+
+def write_records(cursor, kind, records):
+    # cursor: a plain cursor in the caller's transaction.  Returns
+    # {'kind', 'ids', 'created', 'duplicates', 'errors'}; ids follow the
+    # order of records and nothing is written when errors is not empty.
+    spec = IMPORT_SPECS[kind]
+    result = {'kind': kind, 'ids': [], 'created': 0, 'duplicates': 0, 'errors': []}
+    values, keys, errors = _parse_records(cursor, spec, records)
+    if not errors and kind == 'harvest':
+        errors = [{'index': index, 'error': f'plant_id: plant {plant_id} does not exist'}
+                  for index, plant_id in _missing_plants(cursor, spec, values)]
+    if errors:
+        result['errors'] = errors
+        return result
+
+    claimed = set()
+    existing = {}
+    keyed = [key for key in keys if key is not None]
+    if keyed:
+        cursor.execute("DELETE FROM idempotency_keys WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+                       (KEY_RETENTION_DAYS,))
+        # A key claimed by a concurrent, uncommitted batch blocks here until
+        # that batch commits (key taken) or rolls back (key claimed)
+        claimed = {row[0] for row in extras.execute_values(cursor, """
+            INSERT INTO idempotency_keys (kind, key) VALUES %s
+            ON CONFLICT DO NOTHING RETURNING key
+        """, [(kind, key) for key in keyed], page_size=MAX_RECORDS, fetch=True)}
+        taken = [key for key in keyed if key not in claimed]
+        if taken:
+            cursor.execute("SELECT key, record_id FROM idempotency_keys WHERE kind = %s AND key = ANY(%s)",
+                           (kind, taken))
+            existing = dict(cursor.fetchall())
+
+    new = [index for index, key in enumerate(keys) if key is None or key in claimed]
+    ids = [existing.get(key) for key in keys]
+    if new:
+        columns = spec_columns(spec)
+        returned = extras.execute_values(cursor, f"""
+            INSERT INTO {spec['table']} ({', '.join(columns)}) VALUES %s RETURNING id
+        """, [values[index] for index in new], page_size=MAX_RECORDS, fetch=True)
+        for index, (record_id,) in zip(new, returned):
+            ids[index] = record_id
+        stored = [(kind, keys[index], ids[index]) for index in new if keys[index] is not None]
+        if stored:
+            extras.execute_values(cursor, """
+                UPDATE idempotency_keys k SET record_id = v.record_id
+                FROM (VALUES %s) AS v(kind, key, record_id)
+                WHERE k.kind = v.kind AND k.key = v.key
+            """, stored, page_size=MAX_RECORDS)
+
+    result['ids'] = ids
+    result['created'] = len(new)
+    result['duplicates'] = len(keys) - len(new)
+    return result
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+# In-process result cache for the read views.
+#
+# Entries are keyed by route, request parameters and the current version
+# of every table the view reads.  Write handlers call bump() after they
+# commit, which changes the key, so a result computed before a write can
+# never be served after it.  Superseded entries are simply never hit
+# again and age out through LRU eviction or their TTL.
+#
+# Versions live in this process only; with several worker processes the
+# TTL bounds how long another worker's write can go unnoticed.
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def key(self, route, params, tables):
+        # Snapshot the versions *before* the query runs: a write that lands
+        # mid-query bumps the version and orphans this key.
+        if hasattr(params, 'items'):
+            try:
+                params = params.items(multi=True)
+            except TypeError:
+                params = params.items()
+        with self._lock:
+            versions = tuple((table, self._versions.get(table, 0)) for table in sorted(tables))
+        return (route, tuple(sorted(params)), versions)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'table_versions': dict(self._versions)
+            }
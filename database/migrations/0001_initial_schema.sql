@@ -0,0 +1,324 @@
+
+-- Tomato Farm Management System Database Schema
+-- PostgreSQL Database
+--
+-- Migration 0001: the original schema.  Every statement is idempotent so
+-- databases created before migrations existed can adopt it unchanged.
+
+CREATE TABLE IF NOT EXISTS farmers (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    contact VARCHAR(50),
+    email VARCHAR(100),
+    address TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tomato_plants (
+    id SERIAL PRIMARY KEY,
+    variety VARCHAR(100) NOT NULL,
+    planting_date DATE NOT NULL,
+    expected_harvest_date DATE,
+    status VARCHAR(50) DEFAULT 'Growing',
+    field_location VARCHAR(100),
+    quantity INT DEFAULT 1,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS harvest (
+    id SERIAL PRIMARY KEY,
+    plant_id INT,
+    harvest_date DATE NOT NULL,
+    quantity DECIMAL(10,2) NOT NULL,
+    unit VARCHAR(20) DEFAULT 'kg',
+    quality_grade VARCHAR(20),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (plant_id) REFERENCES tomato_plants(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS inventory (
+    id SERIAL PRIMARY KEY,
+    item_name VARCHAR(100) NOT NULL,
+    category VARCHAR(50),
+    quantity DECIMAL(10,2) NOT NULL,
+    unit VARCHAR(20),
+    min_quantity DECIMAL(10,2) DEFAULT 0,
+    supplier VARCHAR(100),
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS sales (
+    id SERIAL PRIMARY KEY,
+    sale_date DATE NOT NULL,
+    customer_name VARCHAR(100),
+    quantity DECIMAL(10,2) NOT NULL,
+    unit VARCHAR(20) DEFAULT 'kg',
+    price_per_unit DECIMAL(10,2),
+    total_amount DECIMAL(10,2),
+    payment_status VARCHAR(50) DEFAULT 'Pending',
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS operations (
+    id SERIAL PRIMARY KEY,
+    operation_type VARCHAR(50) NOT NULL,
+    operation_date DATE NOT NULL,
+    field_location VARCHAR(100),
+    description TEXT,
+    cost DECIMAL(10,2) DEFAULT 0,
+    performed_by VARCHAR(100),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS spraying (
+    id SERIAL PRIMARY KEY,
+    spray_date DATE NOT NULL,
+    chemical_name VARCHAR(100),
+    quantity_used DECIMAL(10,2),
+    unit VARCHAR(20),
+    target_pest VARCHAR(100),
+    field_location VARCHAR(100),
+    applicator VARCHAR(100),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS weeding (
+    id SERIAL PRIMARY KEY,
+    weeding_date DATE NOT NULL,
+    field_location VARCHAR(100),
+    method VARCHAR(50),
+    labor_hours DECIMAL(5,2),
+    workers INT,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS irrigation (
+    id SERIAL PRIMARY KEY,
+    irrigation_date DATE NOT NULL,
+    field_location VARCHAR(100),
+    water_volume DECIMAL(10,2),
+    unit VARCHAR(20) DEFAULT 'liters',
+    duration_minutes INT,
+    method VARCHAR(50),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keyset pagination indexes for the list views (sort key + id tiebreaker)
+CREATE INDEX IF NOT EXISTS idx_tomato_plants_planting_date_id ON tomato_plants (planting_date, id);
+CREATE INDEX IF NOT EXISTS idx_harvest_harvest_date_id ON harvest (harvest_date, id);
+CREATE INDEX IF NOT EXISTS idx_inventory_item_name_id ON inventory (item_name, id);
+CREATE INDEX IF NOT EXISTS idx_operations_operation_date_id ON operations (operation_date, id);
+CREATE INDEX IF NOT EXISTS idx_sales_sale_date_id ON sales (sale_date, id);
+
+-- Trigram index for the plant type-ahead on the harvest form.  The
+-- expression must match PLANT_SEARCH_TEXT in app.py.  If pg_trgm cannot
+-- be installed the search still works, just without the index.
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm not available: %', SQLERRM;
+END $$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS idx_tomato_plants_search_trgm ON tomato_plants
+            USING gin ((variety::text || ' ' || COALESCE(field_location::text, '')) gin_trgm_ops);
+    END IF;
+END $$;
+
+-- Dashboard counters, kept up to date by the triggers below so the home
+-- page reads one row instead of aggregating four tables.
+CREATE TABLE IF NOT EXISTS farm_stats (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    total_plants BIGINT NOT NULL DEFAULT 0,
+    total_harvest DECIMAL(14,2) NOT NULL DEFAULT 0,
+    inventory_items BIGINT NOT NULL DEFAULT 0,
+    total_sales DECIMAL(14,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Seed from the existing data the first time only
+INSERT INTO farm_stats (id, total_plants, total_harvest, inventory_items, total_sales)
+SELECT 1,
+       (SELECT COUNT(*) FROM tomato_plants),
+       (SELECT COALESCE(SUM(quantity), 0) FROM harvest WHERE unit = 'kg'),
+       (SELECT COUNT(*) FROM inventory),
+       (SELECT COALESCE(SUM(total_amount), 0) FROM sales)
+WHERE NOT EXISTS (SELECT 1 FROM farm_stats);
+
+-- Statement-level triggers with transition tables: a multi-row write
+-- touches farm_stats once, not once per row, and a statement that matched
+-- no rows does not touch it at all, so it never waits on that one hot row.
+CREATE OR REPLACE FUNCTION farm_stats_tomato_plants() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        UPDATE farm_stats SET total_plants = total_plants + (SELECT COUNT(*) FROM new_rows),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE farm_stats SET total_plants = total_plants - (SELECT COUNT(*) FROM old_rows),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION farm_stats_harvest() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE farm_stats SET total_harvest = total_harvest +
+                                  (SELECT COALESCE(SUM(quantity), 0) FROM new_rows WHERE unit = 'kg'),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE farm_stats SET total_harvest = total_harvest -
+                                  (SELECT COALESCE(SUM(quantity), 0) FROM old_rows WHERE unit = 'kg'),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION farm_stats_inventory() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        UPDATE farm_stats SET inventory_items = inventory_items + (SELECT COUNT(*) FROM new_rows),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE farm_stats SET inventory_items = inventory_items - (SELECT COUNT(*) FROM old_rows),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION farm_stats_sales() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE farm_stats SET total_sales = total_sales +
+                                  (SELECT COALESCE(SUM(total_amount), 0) FROM new_rows),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE farm_stats SET total_sales = total_sales -
+                                  (SELECT COALESCE(SUM(total_amount), 0) FROM old_rows),
+                              updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS farm_stats_insert ON tomato_plants;
+CREATE TRIGGER farm_stats_insert AFTER INSERT ON tomato_plants
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_tomato_plants();
+DROP TRIGGER IF EXISTS farm_stats_delete ON tomato_plants;
+CREATE TRIGGER farm_stats_delete AFTER DELETE ON tomato_plants
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_tomato_plants();
+
+DROP TRIGGER IF EXISTS farm_stats_insert ON harvest;
+CREATE TRIGGER farm_stats_insert AFTER INSERT ON harvest
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_harvest();
+DROP TRIGGER IF EXISTS farm_stats_update ON harvest;
+CREATE TRIGGER farm_stats_update AFTER UPDATE ON harvest
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_harvest();
+DROP TRIGGER IF EXISTS farm_stats_delete ON harvest;
+CREATE TRIGGER farm_stats_delete AFTER DELETE ON harvest
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_harvest();
+
+DROP TRIGGER IF EXISTS farm_stats_insert ON inventory;
+CREATE TRIGGER farm_stats_insert AFTER INSERT ON inventory
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_inventory();
+DROP TRIGGER IF EXISTS farm_stats_delete ON inventory;
+CREATE TRIGGER farm_stats_delete AFTER DELETE ON inventory
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_inventory();
+
+DROP TRIGGER IF EXISTS farm_stats_insert ON sales;
+CREATE TRIGGER farm_stats_insert AFTER INSERT ON sales
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_sales();
+DROP TRIGGER IF EXISTS farm_stats_update ON sales;
+CREATE TRIGGER farm_stats_update AFTER UPDATE ON sales
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_sales();
+DROP TRIGGER IF EXISTS farm_stats_delete ON sales;
+CREATE TRIGGER farm_stats_delete AFTER DELETE ON sales
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_stats_sales();
+
+-- Create users table for admin accounts
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    full_name VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Insert default admin user (email: admin@daevtech.com, password: admin123)
+INSERT INTO users (email, password, full_name) 
+VALUES ('admin@daevtech.com', 'admin123', 'Admin User')
+ON CONFLICT (email) DO NOTHING;
+
+-- Insert sample inventory data into an empty inventory only
+INSERT INTO inventory (item_name, category, quantity, unit, min_quantity, supplier)
+SELECT * FROM (VALUES
+('Tomato Seeds - Roma', 'Seeds', 50, 'packets', 10, 'AgriSupply Co'),
+('Tomato Seeds - Cherry', 'Seeds', 30, 'packets', 10, 'AgriSupply Co'),
+('NPK Fertilizer', 'Fertilizer', 100, 'kg', 20, 'Farm Supplies Ltd'),
+('Organic Compost', 'Fertilizer', 500, 'kg', 100, 'Green Earth'),
+('Pesticide - Insect Control', 'Pesticide', 25, 'liters', 5, 'CropCare Inc'),
+('Fungicide', 'Pesticide', 15, 'liters', 5, 'CropCare Inc'),
+('Watering Hoses', 'Equipment', 10, 'units', 2, 'FarmTools')
+) AS sample (item_name, category, quantity, unit, min_quantity, supplier)
+WHERE NOT EXISTS (SELECT 1 FROM inventory);
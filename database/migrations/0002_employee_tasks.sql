@@ -0,0 +1,21 @@
+-- Migration 0002: employee task board (previously created by init_db()).
+-- The clock-in/clock-out columns were added later, so databases with an
+-- older employee_tasks table get them here.
+
+CREATE TABLE IF NOT EXISTS employee_tasks (
+    id SERIAL PRIMARY KEY,
+    employee_number INTEGER NOT NULL CHECK (employee_number BETWEEN 1 AND 10),
+    task_date DATE NOT NULL,
+    task_type VARCHAR(100) NOT NULL,
+    field_location VARCHAR(200),
+    description TEXT NOT NULL,
+    start_time TIME,
+    estimated_hours DECIMAL(4,1),
+    status VARCHAR(50) DEFAULT 'Pending',
+    actual_start_time TIMESTAMP,
+    actual_finish_time TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE employee_tasks ADD COLUMN IF NOT EXISTS actual_start_time TIMESTAMP;
+ALTER TABLE employee_tasks ADD COLUMN IF NOT EXISTS actual_finish_time TIMESTAMP;
@@ -0,0 +1,32 @@
+-- Migration 0003: indexes for the report queries, the filtered list views
+-- and foreign-key maintenance.  `flask --app app bench indexes` shows the
+-- plans and timings with and without them; `flask --app app unused-indexes`
+-- lists indexes the workload never touches.
+
+-- harvest.plant_id references tomato_plants with ON DELETE SET NULL.
+-- Without an index every plant delete scans the whole harvest table.
+CREATE INDEX IF NOT EXISTS idx_harvest_plant_id ON harvest (plant_id);
+
+-- Reports only count kg harvests: the field-performance join (by plant_id)
+-- and the grade distribution (by quality_grade) read just these columns,
+-- so both can use an index-only scan of the kg rows.  The planner prefers
+-- it over the heap scan with SSD costs (random_page_cost around 1.1).
+CREATE INDEX IF NOT EXISTS idx_harvest_kg_plant ON harvest (plant_id)
+    INCLUDE (quantity, quality_grade) WHERE unit = 'kg';
+
+-- Outstanding payments: the sales list filtered to Pending seeks on
+-- (sale_date, id) among pending rows only.
+CREATE INDEX IF NOT EXISTS idx_sales_pending_sale_date_id ON sales (sale_date, id)
+    INCLUDE (total_amount) WHERE payment_status = 'Pending';
+
+-- Covering version of the planting_date keyset index: the harvest-form
+-- type-ahead and the dashboard's recent plantings become index-only scans.
+CREATE INDEX IF NOT EXISTS idx_tomato_plants_planting_date_id_cover ON tomato_plants (planting_date, id)
+    INCLUDE (variety, field_location, quantity);
+DROP INDEX IF EXISTS idx_tomato_plants_planting_date_id;
+
+CREATE INDEX IF NOT EXISTS idx_tomato_plants_status ON tomato_plants (status);
+
+-- Task board order: newest day first, employees ascending within a day
+CREATE INDEX IF NOT EXISTS idx_employee_tasks_task_date_employee
+    ON employee_tasks (task_date DESC, employee_number);
@@ -0,0 +1,219 @@
+-- Migration 0004: monthly range partitioning of the append-mostly,
+-- date-keyed tables.
+--
+-- Each table becomes a partitioned table with one partition per month
+-- (harvest_2025_06 holds June 2025) between two catch-all partitions:
+-- <table>_history (MINVALUE up to the first month) and <table>_future (the
+-- month after the last one up to MAXVALUE), so an insert never fails for
+-- want of a partition.  A DEFAULT partition would do the same job but
+-- stops the planner from reading the partitions in order, which the
+-- newest-first list pages depend on.
+--
+-- farm_ensure_partitions() carves upcoming months out of _future (and
+-- older ones out of _history), moving any rows already there; the app
+-- calls it at startup and `flask --app app partitions --ensure` can run it
+-- from cron.
+--
+-- The primary key becomes (id, <date column>) because a partitioned table
+-- can only enforce uniqueness on keys that include the partition key; ids
+-- still come from the table's sequence.  Existing rows are copied into the
+-- new layout inside this migration's transaction, which holds an exclusive
+-- lock on each table while it is rewritten.
+
+-- Partition key column of a partitioned table
+CREATE OR REPLACE FUNCTION farm_partition_key(parent regclass) RETURNS name AS $$
+    SELECT a.attname
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent;
+$$ LANGUAGE sql STABLE;
+
+-- The finite bound of a catch-all partition
+CREATE OR REPLACE FUNCTION farm_partition_bound(partition regclass) RETURNS date AS $$
+    SELECT substring(pg_get_expr(relpartbound, oid) FROM '(\d{4}-\d{2}-\d{2})')::date
+    FROM pg_class WHERE oid = partition;
+$$ LANGUAGE sql STABLE;
+
+-- Creates the partition holding `month`.  A month still covered by
+-- _history or _future is split out of it together with the months between
+-- it and the catch-all's bound, keeping the ranges contiguous; their rows
+-- move into the new partitions.  Returns the number of partitions created.
+CREATE OR REPLACE FUNCTION farm_create_partition(parent text, month date) RETURNS integer AS $$
+DECLARE
+    lower_bound date := date_trunc('month', month)::date;
+    upper_bound date := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    history text := parent || '_history';
+    future text := parent || '_future';
+    key_column name := farm_partition_key(parent::regclass);
+    catch_all text;
+    split_from date;
+    split_to date;
+    current_month date;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    IF to_regclass(parent || '_' || to_char(lower_bound, 'YYYY_MM')) IS NOT NULL THEN
+        RETURN 0;
+    END IF;
+
+    IF to_regclass(future) IS NOT NULL AND lower_bound >= farm_partition_bound(future::regclass) THEN
+        catch_all := future;
+        split_from := farm_partition_bound(future::regclass);
+        split_to := upper_bound;
+    ELSIF to_regclass(history) IS NOT NULL AND lower_bound < farm_partition_bound(history::regclass) THEN
+        catch_all := history;
+        split_from := lower_bound;
+        split_to := farm_partition_bound(history::regclass);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       parent || '_' || to_char(lower_bound, 'YYYY_MM'), parent, lower_bound, upper_bound);
+        RETURN 1;
+    END IF;
+
+    -- Rows are moved partition to partition, so the statement triggers on
+    -- the parent (farm_stats) do not see them
+    EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, catch_all);
+    current_month := split_from;
+    WHILE current_month < split_to LOOP
+        partition_name := parent || '_' || to_char(current_month, 'YYYY_MM');
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, parent, current_month, (current_month + INTERVAL '1 month')::date);
+        EXECUTE format('INSERT INTO %I SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+                       partition_name, catch_all, key_column, current_month,
+                       key_column, (current_month + INTERVAL '1 month')::date);
+        created := created + 1;
+        current_month := (current_month + INTERVAL '1 month')::date;
+    END LOOP;
+    EXECUTE format('DELETE FROM %I WHERE %I >= %L AND %I < %L',
+                   catch_all, key_column, split_from, key_column, split_to);
+    IF catch_all = future THEN
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (MAXVALUE)',
+                       parent, future, split_to);
+    ELSE
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)',
+                       parent, history, split_from);
+    END IF;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Creates the missing monthly partitions of one table between two dates
+-- (by month, inclusive); returns how many were created
+CREATE OR REPLACE FUNCTION farm_create_partitions(parent text, first_month date, last_month date)
+RETURNS integer AS $$
+DECLARE
+    month date := date_trunc('month', first_month)::date;
+    created integer := 0;
+BEGIN
+    WHILE month <= last_month LOOP
+        created := created + farm_create_partition(parent, month);
+        month := (month + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The same for every partitioned table in the schema
+CREATE OR REPLACE FUNCTION farm_ensure_partitions(first_month date, last_month date) RETURNS integer AS $$
+DECLARE
+    parent text;
+    created integer := 0;
+BEGIN
+    FOR parent IN
+        SELECT c.relname FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relnamespace = current_schema()::regnamespace AND NOT c.relispartition
+        ORDER BY c.relname
+    LOOP
+        created := created + farm_create_partitions(parent, first_month, last_month);
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rewrites a plain table as a monthly partitioned one, keeping its columns,
+-- defaults, sequence, secondary indexes, triggers and foreign keys.
+-- Returns the number of rows copied, or NULL if it was already partitioned.
+CREATE OR REPLACE FUNCTION farm_partition_by_month(parent text, key_column text, months_ahead integer)
+RETURNS bigint AS $$
+DECLARE
+    old_name text := parent || '_unpartitioned';
+    index_defs text[];
+    trigger_defs text[];
+    foreign_keys text[];
+    index_name text;
+    statement text;
+    serial_sequence text := pg_get_serial_sequence(parent, 'id');
+    first_month date;
+    last_month date;
+    copied bigint;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass(parent)) = 'p' THEN
+        RETURN NULL;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE confrelid = parent::regclass) THEN
+        RAISE EXCEPTION 'cannot partition %: other tables reference it', parent;
+    END IF;
+
+    -- Definitions are captured while they still name `parent`, so they
+    -- apply unchanged to the new partitioned table
+    SELECT array_agg(pg_get_indexdef(indexrelid)) INTO index_defs
+    FROM pg_index WHERE indrelid = parent::regclass AND NOT indisprimary;
+    SELECT array_agg(pg_get_triggerdef(oid)) INTO trigger_defs
+    FROM pg_trigger WHERE tgrelid = parent::regclass AND NOT tgisinternal;
+    SELECT array_agg(format('ALTER TABLE %I ADD CONSTRAINT %I %s', parent, conname, pg_get_constraintdef(oid)))
+    INTO foreign_keys
+    FROM pg_constraint WHERE conrelid = parent::regclass AND contype = 'f';
+
+    -- Index names are schema-wide, so the old secondary indexes go first
+    FOR index_name IN
+        SELECT indexrelid::regclass::text FROM pg_index
+        WHERE indrelid = parent::regclass AND NOT indisprimary
+    LOOP
+        EXECUTE 'DROP INDEX ' || index_name;
+    END LOOP;
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', parent, old_name);
+    EXECUTE format('ALTER TABLE %I RENAME CONSTRAINT %I TO %I', old_name, parent || '_pkey', old_name || '_pkey');
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE '
+                   'INCLUDING COMMENTS) PARTITION BY RANGE (%I)', parent, old_name, key_column);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, %I)', parent, key_column);
+
+    -- Monthly partitions from the oldest row (or this month) to
+    -- months_ahead months from now, with the catch-alls either side
+    EXECUTE format('SELECT date_trunc(''month'', MIN(%I))::date, MAX(%I) FROM %I',
+                   key_column, key_column, old_name)
+        INTO first_month, last_month;
+    first_month := LEAST(COALESCE(first_month, CURRENT_DATE), date_trunc('month', CURRENT_DATE)::date);
+    last_month := date_trunc('month', GREATEST(COALESCE(last_month, CURRENT_DATE),
+                                               CURRENT_DATE + make_interval(months => months_ahead)))::date;
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (MINVALUE) TO (%L)',
+                   parent || '_history', parent, first_month);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (MAXVALUE)',
+                   parent || '_future', parent, (last_month + INTERVAL '1 month')::date);
+    PERFORM farm_create_partitions(parent, first_month, last_month);
+
+    -- No triggers exist on the new table yet, so farm_stats is untouched
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', parent, old_name);
+    GET DIAGNOSTICS copied = ROW_COUNT;
+
+    IF serial_sequence IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', serial_sequence, parent);
+    END IF;
+    EXECUTE format('DROP TABLE %I', old_name);
+
+    FOREACH statement IN ARRAY COALESCE(index_defs, '{}') || COALESCE(trigger_defs, '{}')
+                                || COALESCE(foreign_keys, '{}') LOOP
+        EXECUTE statement;
+    END LOOP;
+    EXECUTE format('ANALYZE %I', parent);
+    RETURN copied;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT farm_partition_by_month('harvest', 'harvest_date', 3);
+SELECT farm_partition_by_month('sales', 'sale_date', 3);
+SELECT farm_partition_by_month('operations', 'operation_date', 3);
+SELECT farm_partition_by_month('irrigation', 'irrigation_date', 3);
+SELECT farm_partition_by_month('spraying', 'spray_date', 3);
+SELECT farm_partition_by_month('weeding', 'weeding_date', 3);
@@ -0,0 +1,17 @@
+-- Migration 0005: idempotency keys for the JSON bulk-write API.
+--
+-- A client sends an idempotency_key with each record it uploads; the key
+-- is claimed in the same transaction that inserts the record, so a retried
+-- upload finds the key taken and gets the original record id back instead
+-- of inserting the row again.  Keys are pruned after KEY_RETENTION_DAYS
+-- (bulk_write.py).
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    kind VARCHAR(50) NOT NULL,
+    key VARCHAR(200) NOT NULL,
+    record_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at);
@@ -0,0 +1,59 @@
+-- Migration 0006: change tracking for the /sync delta feed (sync.py).
+--
+-- Every domain table gets updated_at: the column default stamps inserts
+-- and a BEFORE UPDATE row trigger restamps updates, both with the
+-- transaction's start time (CURRENT_TIMESTAMP), which is what lets /sync
+-- tell which changes can no longer be joined by a slower, still-open
+-- transaction.  Existing rows are stamped with the time of this migration.
+-- (updated_at, id) indexes make a sync read only the changed rows.
+--
+-- Deletes leave a row in sync_tombstones through a statement-level
+-- trigger.  On the partitioned tables statement triggers belong to the
+-- parent only, so rows moved between partitions by farm_create_partition()
+-- (a direct INSERT and DELETE on the partitions) neither restamp nor leave
+-- tombstones; neither does TRUNCATE.
+
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INTEGER NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_at_id ON sync_tombstones (deleted_at, id);
+
+CREATE OR REPLACE FUNCTION sync_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_record_tombstones() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO sync_tombstones (table_name, record_id)
+    SELECT TG_TABLE_NAME, id FROM old_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    table_name text;
+BEGIN
+    FOREACH table_name IN ARRAY ARRAY['tomato_plants', 'harvest', 'inventory', 'sales', 'operations',
+                                      'spraying', 'weeding', 'irrigation', 'employee_tasks'] LOOP
+        EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL '
+                       'DEFAULT CURRENT_TIMESTAMP', table_name);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (updated_at, id)',
+                       'idx_' || table_name || '_updated_at_id', table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS sync_updated_at ON %I', table_name);
+        EXECUTE format('CREATE TRIGGER sync_updated_at BEFORE UPDATE ON %I '
+                       'FOR EACH ROW EXECUTE FUNCTION sync_touch_updated_at()', table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS sync_tombstones ON %I', table_name);
+        EXECUTE format('CREATE TRIGGER sync_tombstones AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION sync_record_tombstones()', table_name);
+        -- Statistics for the new column, so the planner walks the index
+        EXECUTE format('ANALYZE %I (updated_at)', table_name);
+    END LOOP;
+END $$;
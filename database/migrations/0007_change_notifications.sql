@@ -0,0 +1,89 @@
+-- Migration 0007: NOTIFY on changes, for the live dashboards (live.py).
+--
+-- Every event goes to the farm_changes channel as a small JSON payload and
+-- is delivered when the writing transaction commits:
+--   {"event": "stats", "stats": {...}}    the farm_stats counters
+--   {"event": "tasks", "op": ..., "tasks": [...]}    employee task rows,
+--       or "tasks": null when a statement touched more than 20
+--   {"event": "change", "table": ..., "op": ...}    any other domain table
+-- Triggers are statement-level except on the single farm_stats row, so a
+-- bulk write sends one event, not one per row.
+
+CREATE OR REPLACE FUNCTION farm_notify_stats() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('farm_changes', json_build_object(
+        'event', 'stats',
+        'stats', json_build_object('total_plants', NEW.total_plants, 'total_harvest', NEW.total_harvest,
+                                   'inventory_items', NEW.inventory_items, 'total_sales', NEW.total_sales)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS farm_notify_stats ON farm_stats;
+CREATE TRIGGER farm_notify_stats AFTER INSERT OR UPDATE ON farm_stats
+    FOR EACH ROW EXECUTE FUNCTION farm_notify_stats();
+
+CREATE OR REPLACE FUNCTION farm_notify_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('farm_changes', json_build_object(
+        'event', 'change', 'table', TG_TABLE_NAME, 'op', lower(TG_OP)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Just what the task board shows that can change after a task is created;
+-- times are formatted like the template's strftime('%I:%M %p')
+CREATE OR REPLACE FUNCTION farm_notify_tasks() RETURNS trigger AS $$
+DECLARE
+    tasks json;
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT COUNT(*), json_agg(json_build_object('id', id, 'employee_number', employee_number))
+        INTO changed, tasks
+        FROM (SELECT * FROM old_rows LIMIT 21) r;
+    ELSE
+        SELECT COUNT(*), json_agg(json_build_object(
+                   'id', id, 'employee_number', employee_number, 'status', status,
+                   'started', to_char(actual_start_time, 'HH12:MI AM'),
+                   'finished', to_char(actual_finish_time, 'HH12:MI AM')))
+        INTO changed, tasks
+        FROM (SELECT * FROM new_rows LIMIT 21) r;
+    END IF;
+    IF changed = 0 THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('farm_changes', json_build_object(
+        'event', 'tasks', 'table', TG_TABLE_NAME, 'op', lower(TG_OP),
+        'tasks', CASE WHEN changed > 20 THEN NULL ELSE tasks END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS farm_notify_insert ON employee_tasks;
+CREATE TRIGGER farm_notify_insert AFTER INSERT ON employee_tasks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_notify_tasks();
+DROP TRIGGER IF EXISTS farm_notify_update ON employee_tasks;
+CREATE TRIGGER farm_notify_update AFTER UPDATE ON employee_tasks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_notify_tasks();
+DROP TRIGGER IF EXISTS farm_notify_delete ON employee_tasks;
+CREATE TRIGGER farm_notify_delete AFTER DELETE ON employee_tasks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION farm_notify_tasks();
+
+DO $$
+DECLARE
+    table_name text;
+BEGIN
+    FOREACH table_name IN ARRAY ARRAY['tomato_plants', 'harvest', 'inventory', 'sales', 'operations',
+                                      'spraying', 'weeding', 'irrigation'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS farm_notify_change ON %I', table_name);
+        EXECUTE format('CREATE TRIGGER farm_notify_change AFTER INSERT OR UPDATE OR DELETE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION farm_notify_change()', table_name);
+    END LOOP;
+END $$;
@@ -0,0 +1,64 @@
+-- Migration 0008: irrigation controller and soil sensor readings, with
+-- 5-minute, hourly and daily rollups.
+--
+-- Sensors report about once a second per valve, far more often than the
+-- irrigation/spraying/weeding logs are written (one row per job, with
+-- sync and change-notification triggers on every write).  Readings get
+-- their own narrow, append-only table: no primary key, no triggers, no
+-- btree index, 16 bytes of data per row.  It is partitioned by month like
+-- the logs (farm_ensure_partitions() picks it up) and indexed with BRIN,
+-- which stays a few pages per month because readings arrive in time order.
+--
+-- sensor_rollup_5m/_1h/_1d hold the reading count, sum, min and max per
+-- field, metric and bucket (buckets in UTC).  sensors.py rebuilds them
+-- level by level; sensor_rollup_state.dirty_from is the earliest reading
+-- time not yet rolled up, lowered by ingestion and cleared by the rollup.
+
+CREATE TABLE IF NOT EXISTS sensors (
+    id SERIAL PRIMARY KEY,
+    sensor_key VARCHAR(100) NOT NULL UNIQUE,
+    field_location VARCHAR(100) NOT NULL,
+    metric VARCHAR(50) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS sensor_readings (
+    reading_at TIMESTAMPTZ NOT NULL,
+    sensor_id INTEGER NOT NULL,
+    value REAL NOT NULL
+) PARTITION BY RANGE (reading_at);
+
+DO $$
+BEGIN
+    IF to_regclass('sensor_readings_history') IS NULL THEN
+        EXECUTE format('CREATE TABLE sensor_readings_history PARTITION OF sensor_readings '
+                       'FOR VALUES FROM (MINVALUE) TO (%L)', date_trunc('month', CURRENT_DATE)::date);
+        EXECUTE format('CREATE TABLE sensor_readings_future PARTITION OF sensor_readings '
+                       'FOR VALUES FROM (%L) TO (MAXVALUE)',
+                       (date_trunc('month', CURRENT_DATE) + INTERVAL '4 months')::date);
+        PERFORM farm_create_partitions('sensor_readings', CURRENT_DATE,
+                                       (CURRENT_DATE + INTERVAL '3 months')::date);
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_sensor_readings_reading_at ON sensor_readings USING brin (reading_at);
+
+CREATE TABLE IF NOT EXISTS sensor_rollup_5m (
+    field_location VARCHAR(100) NOT NULL,
+    metric VARCHAR(50) NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    readings INTEGER NOT NULL,
+    total DOUBLE PRECISION NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    PRIMARY KEY (field_location, metric, bucket)
+);
+CREATE TABLE IF NOT EXISTS sensor_rollup_1h (LIKE sensor_rollup_5m INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS sensor_rollup_1d (LIKE sensor_rollup_5m INCLUDING ALL);
+
+CREATE TABLE IF NOT EXISTS sensor_rollup_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    dirty_from TIMESTAMPTZ,
+    rolled_up_at TIMESTAMPTZ
+);
+INSERT INTO sensor_rollup_state (id) VALUES (1) ON CONFLICT DO NOTHING;
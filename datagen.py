@@ -0,0 +1,376 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import numpy as np
+import psycopg2
+from psycopg2 import extras
+
+from partitions import ensure_partitions
+
+# Synthetic farm data generator.
+#
+# Rows are generated column-wise with NumPy in batches and streamed into
+# Postgres with COPY by a pool of worker processes, each on its own
+# connection.  Every batch draws from its own seeded generator, so a run
+# is reproducible no matter how batches are scheduled.
+#
+# Plantings get ids reserved up front so harvests can reference them by
+# plant_id; harvests are written once all plantings are committed.
+# Varieties and their days-to-harvest match the data-days attributes in
+# templates/planting.html used by calculateHarvestDate() in script.js.
+
+VARIETIES = ['Roma', 'Cherry', 'Beefsteak', 'Heirloom', 'Plum', 'Grape']
+VARIETY_DAYS = np.array([75, 60, 85, 80, 70, 65], dtype=np.int32)
+FIELDS = ['Field A', 'Field B', 'Field C', 'Field D', 'Field E', 'Nursery 1', 'Nursery 2']
+EMPLOYEES = [f'Employee {i}' for i in range(1, 11)]
+
+# Share of the total row count per table
+DEFAULT_MIX = {
+    'tomato_plants': 0.08,
+    'harvest': 0.45,
+    'sales': 0.15,
+    'operations': 0.08,
+    'spraying': 0.06,
+    'weeding': 0.06,
+    'irrigation': 0.07,
+    'employee_tasks': 0.05,
+}
+
+BATCH_SIZE = 100000
+NULL = '\\N'
+
+_worker = {}
+
+
+def plan_counts(total_rows, mix=DEFAULT_MIX, overrides=None):
+    counts = {table: int(total_rows * share) for table, share in mix.items()}
+    counts.update(overrides or {})
+    return counts
+
+
+# -- column helpers ---------------------------------------------------------
+
+def _pick(rng, choices, n, p=None):
+    return np.asarray(choices, dtype=object)[rng.choice(len(choices), size=n, p=p)]
+
+
+def _dates(start, day_offsets):
+    return (np.datetime64(start, 'D') + day_offsets.astype('timedelta64[D]')).astype(str)
+
+
+def _money(values):
+    return np.round(values, 2).astype(str)
+
+
+def _seasonal_days(rng, n, days, peak_doy, strength, start):
+    # Day offsets in [0, days) weighted by 1 + strength * cos(distance to peak)
+    doy = (np.arange(days) + start.timetuple().tm_yday) % 365
+    weights = 1 + strength * np.cos(2 * np.pi * (doy - peak_doy) / 365.0)
+    weights /= weights.sum()
+    return rng.choice(days, size=n, p=weights)
+
+
+# -- tables -----------------------------------------------------------------
+
+def _gen_tomato_plants(rng, n, offset, options):
+    variety, planting_day = options['plants'][0][offset:offset + n], options['plants'][1][offset:offset + n]
+    start, today = options['start'], options['today_offset']
+    expected_day = planting_day + VARIETY_DAYS[variety]
+    status = np.select(
+        [expected_day + 45 < today, expected_day < today, planting_day + 40 < today, planting_day + 14 < today],
+        ['Harvested', 'Fruiting', 'Flowering', 'Growing'], 'Planted')
+    ids = options['plant_first_id'] + offset + np.arange(n)
+    columns = ['id', 'variety', 'planting_date', 'expected_harvest_date', 'status', 'field_location', 'quantity']
+    return columns, [
+        ids.astype(str),
+        np.asarray(VARIETIES, dtype=object)[variety],
+        _dates(start, planting_day),
+        _dates(start, expected_day),
+        status,
+        _pick(rng, FIELDS, n),
+        rng.integers(10, 500, size=n).astype(str),
+    ]
+
+
+def _gen_harvest(rng, n, offset, options):
+    start = options['start']
+    plant_ids, expected_days = options['harvest_plants']
+    if len(plant_ids):
+        index = rng.integers(0, len(plant_ids), size=n)
+        plant_id = plant_ids[index].astype(str)
+        # Picked over the six weeks after the expected harvest date
+        harvest_day = expected_days[index] + rng.integers(0, 45, size=n)
+    else:
+        plant_id = np.full(n, NULL, dtype=object)
+        harvest_day = _seasonal_days(rng, n, options['days'], 220, 0.8, start)
+    columns = ['plant_id', 'harvest_date', 'quantity', 'unit', 'quality_grade']
+    return columns, [
+        plant_id,
+        _dates(start, harvest_day),
+        _money(rng.gamma(2.0, 6.0, size=n) + 0.5),
+        _pick(rng, ['kg', 'crates', 'lbs', 'tons'], n, [0.85, 0.08, 0.05, 0.02]),
+        _pick(rng, ['Premium', 'Grade A', 'Grade B', 'Grade C'], n, [0.10, 0.45, 0.30, 0.15]),
+    ]
+
+
+def _gen_sales(rng, n, offset, options):
+    start = options['start']
+    day = _seasonal_days(rng, n, options['days'], 220, 0.8, start)
+    doy = (day + start.timetuple().tm_yday) % 365
+    # Prices dip when the harvest peaks
+    price = 60 - 20 * np.cos(2 * np.pi * (doy - 220) / 365.0) + rng.normal(0, 5, size=n)
+    price = np.round(np.clip(price, 15, 120), 2)
+    quantity = np.round(rng.gamma(2.0, 25.0, size=n) + 1, 2)
+    customers = rng.zipf(1.6, size=n) % 300 + 1
+    columns = ['sale_date', 'customer_name', 'quantity', 'unit', 'price_per_unit', 'total_amount',
+               'payment_status']
+    return columns, [
+        _dates(start, day),
+        np.char.add('Customer ', customers.astype(str)),
+        quantity.astype(str),
+        _pick(rng, ['kg', 'crates', 'lbs', 'boxes'], n, [0.80, 0.10, 0.05, 0.05]),
+        price.astype(str),
+        _money(quantity * price),
+        _pick(rng, ['Paid', 'Pending', 'Partial'], n, [0.75, 0.18, 0.07]),
+    ]
+
+
+OPERATION_TYPES = ['Spraying', 'Weeding', 'Irrigation', 'Fertilizing', 'Pruning', 'Mulching', 'Staking', 'Other']
+OPERATION_DESCRIPTIONS = ['Pesticide application', 'Row weeding', 'Scheduled watering', 'NPK top dressing',
+                          'Sucker removal', 'Straw mulch', 'Stake and tie plants', 'General maintenance']
+
+
+def _gen_operations(rng, n, offset, options):
+    start = options['start']
+    kind = rng.choice(len(OPERATION_TYPES), size=n, p=[0.18, 0.18, 0.22, 0.14, 0.10, 0.06, 0.06, 0.06])
+    columns = ['operation_type', 'operation_date', 'field_location', 'description', 'cost', 'performed_by']
+    return columns, [
+        np.asarray(OPERATION_TYPES, dtype=object)[kind],
+        _dates(start, _seasonal_days(rng, n, options['days'], 170, 0.6, start)),
+        _pick(rng, FIELDS, n),
+        np.asarray(OPERATION_DESCRIPTIONS, dtype=object)[kind],
+        _money(rng.gamma(2.0, 40.0, size=n)),
+        _pick(rng, EMPLOYEES, n),
+    ]
+
+
+def _gen_spraying(rng, n, offset, options):
+    start = options['start']
+    columns = ['spray_date', 'chemical_name', 'quantity_used', 'unit', 'target_pest', 'field_location',
+               'applicator']
+    return columns, [
+        _dates(start, _seasonal_days(rng, n, options['days'], 190, 0.7, start)),
+        _pick(rng, ['Neem Oil', 'Copper Fungicide', 'Spinosad', 'Bt Spray', 'Mancozeb'], n),
+        _money(rng.gamma(2.0, 2.5, size=n) + 0.1),
+        _pick(rng, ['liters', 'kg'], n, [0.8, 0.2]),
+        _pick(rng, ['Aphids', 'Whiteflies', 'Hornworms', 'Early Blight', 'Late Blight', 'Spider Mites'], n),
+        _pick(rng, FIELDS, n),
+        _pick(rng, EMPLOYEES, n),
+    ]
+
+
+def _gen_weeding(rng, n, offset, options):
+    start = options['start']
+    columns = ['weeding_date', 'field_location', 'method', 'labor_hours', 'workers']
+    return columns, [
+        _dates(start, _seasonal_days(rng, n, options['days'], 150, 0.6, start)),
+        _pick(rng, FIELDS, n),
+        _pick(rng, ['Manual', 'Mechanical', 'Herbicide', 'Mulching'], n, [0.5, 0.25, 0.1, 0.15]),
+        _money(rng.gamma(2.0, 2.0, size=n) + 0.5),
+        rng.integers(1, 7, size=n).astype(str),
+    ]
+
+
+def _gen_irrigation(rng, n, offset, options):
+    start = options['start']
+    minutes = rng.integers(15, 240, size=n)
+    columns = ['irrigation_date', 'field_location', 'water_volume', 'unit', 'duration_minutes', 'method']
+    return columns, [
+        _dates(start, _seasonal_days(rng, n, options['days'], 200, 0.9, start)),
+        _pick(rng, FIELDS, n),
+        _money(minutes * rng.uniform(20, 60, size=n)),
+        np.full(n, 'liters', dtype=object),
+        minutes.astype(str),
+        _pick(rng, ['Drip', 'Sprinkler', 'Furrow'], n, [0.6, 0.3, 0.1]),
+    ]
+
+
+TASK_TYPES = ['Irrigation', 'Weeding', 'Fertilizing', 'Spraying', 'Pruning', 'Harvesting', 'Planting',
+              'Inspection', 'Maintenance', 'Other']
+
+
+def _gen_employee_tasks(rng, n, offset, options):
+    start, today = options['start'], options['today_offset']
+    # Mostly past work plus a few weeks of scheduled tasks
+    day = rng.integers(0, options['days'] + 21, size=n)
+    start_minute = rng.integers(6 * 60, 16 * 60, size=n) // 15 * 15
+    hours = rng.integers(2, 17, size=n) / 2.0
+    past = day < today
+    status = np.where(past, np.where(rng.random(n) < 0.95, 'Completed', 'In Progress'),
+                      np.where(day == today, 'In Progress', 'Pending'))
+    started_at = (np.datetime64(start, 's') + day.astype('timedelta64[D]')
+                  + (start_minute + rng.integers(-15, 30, size=n)).astype('timedelta64[m]'))
+    finished_at = started_at + (hours * 60 + rng.integers(-30, 60, size=n)).astype('timedelta64[m]')
+    has_start = status != 'Pending'
+    columns = ['employee_number', 'task_date', 'task_type', 'field_location', 'description', 'start_time',
+               'estimated_hours', 'status', 'actual_start_time', 'actual_finish_time']
+    kind = _pick(rng, TASK_TYPES, n)
+    return columns, [
+        rng.integers(1, 11, size=n).astype(str),
+        _dates(start, day),
+        kind,
+        _pick(rng, FIELDS, n),
+        np.char.add(kind.astype(str), ' duties'),
+        np.char.add(np.char.add(np.char.zfill((start_minute // 60).astype(str), 2), ':'),
+                    np.char.zfill((start_minute % 60).astype(str), 2)),
+        hours.astype(str),
+        status,
+        np.where(has_start, started_at.astype(str), NULL),
+        np.where(status == 'Completed', finished_at.astype(str), NULL),
+    ]
+
+
+GENERATORS = {
+    'tomato_plants': _gen_tomato_plants,
+    'harvest': _gen_harvest,
+    'sales': _gen_sales,
+    'operations': _gen_operations,
+    'spraying': _gen_spraying,
+    'weeding': _gen_weeding,
+    'irrigation': _gen_irrigation,
+    'employee_tasks': _gen_employee_tasks,
+}
+
+
+# -- writing ----------------------------------------------------------------
+
+def copy_text(values):
+    # Generated values never contain tabs, newlines or backslashes other
+    # than the \N NULL marker, so no COPY escaping is needed
+    return '\n'.join(map('\t'.join, zip(*[column.tolist() for column in values]))) + '\n'
+
+
+def _init_worker(dsn, options):
+    _worker['dsn'] = dsn
+    _worker['options'] = options
+    _worker['connection'] = None
+
+
+def _write_batch(table, offset, size, seed):
+    options = _worker['options']
+    rng = np.random.default_rng([seed, list(GENERATORS).index(table), offset])
+    columns, values = GENERATORS[table](rng, size, offset, options)
+    buffer = io.StringIO(copy_text(values))
+    connection = _worker['connection']
+    if connection is None or connection.closed:
+        connection = _worker['connection'] = psycopg2.connect(_worker['dsn'])
+    cursor = connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return table, size
+
+
+def _reserve_ids(cursor, table, count):
+    # Claims count consecutive ids from the table's serial sequence
+    cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(f"""
+        SELECT setval(pg_get_serial_sequence(%s, 'id'),
+                      GREATEST(nextval(pg_get_serial_sequence(%s, 'id')),
+                               (SELECT COALESCE(MAX(id), 0) + 1 FROM {table})) + %s - 1)
+    """, (table, table, count))
+    return cursor.fetchone()[0] - count + 1
+
+
+def generate(dsn, counts, seed=1, workers=None, batch_size=BATCH_SIZE, start=None, days=3 * 365,
+             progress=None):
+    # counts: {table: rows}.  Returns {table: rows written}.
+    today = date.today()
+    start = start or today - timedelta(days=days)
+    rng = np.random.default_rng(seed)
+    plant_count = counts.get('tomato_plants', 0)
+    options = {
+        'start': start,
+        'days': days,
+        'today_offset': (today - start).days,
+        'plant_first_id': 0,
+        'plants': (np.zeros(0, np.int8), np.zeros(0, np.int32)),
+        'harvest_plants': (np.zeros(0, np.int64), np.zeros(0, np.int32)),
+    }
+
+    connection = psycopg2.connect(dsn)
+    try:
+        # Monthly partitions for the whole range, so rows do not pile up in
+        # the catch-all partitions
+        cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
+        ensure_partitions(cursor, start, today)
+        connection.commit()
+        cursor.close()
+
+        cursor = connection.cursor()
+        if plant_count:
+            # Spring planting peak with a smaller late-summer round
+            planting_day = np.concatenate([
+                _seasonal_days(rng, plant_count - plant_count // 4, days, 100, 0.9, start),
+                _seasonal_days(rng, plant_count // 4, days, 220, 0.9, start)])
+            rng.shuffle(planting_day)
+            variety = rng.integers(0, len(VARIETIES), size=plant_count).astype(np.int8)
+            options['plants'] = (variety, planting_day.astype(np.int32))
+            options['plant_first_id'] = _reserve_ids(cursor, 'tomato_plants', plant_count)
+            connection.commit()
+            first = options['plant_first_id']
+            options['harvest_plants'] = (np.arange(first, first + plant_count),
+                                         (planting_day + VARIETY_DAYS[variety]).astype(np.int32))
+        elif counts.get('harvest'):
+            cursor.execute("SELECT id, expected_harvest_date - %s FROM tomato_plants "
+                           "WHERE expected_harvest_date IS NOT NULL", (start,))
+            rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+            options['harvest_plants'] = (rows[:, 0], rows[:, 1].astype(np.int32))
+            connection.rollback()
+        cursor.close()
+    finally:
+        connection.close()
+
+    def batches(table):
+        total = counts.get(table, 0)
+        return [(table, offset, min(batch_size, total - offset), seed) for offset in range(0, total, batch_size)]
+
+    written = {table: 0 for table in counts}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             initializer=_init_worker, initargs=(dsn, options)) as pool:
+        def run(jobs):
+            futures = [pool.submit(_write_batch, *job) for job in jobs]
+            try:
+                for future in as_completed(futures):
+                    table, size = future.result()
+                    written[table] += size
+                    if progress:
+                        progress(table, written[table], counts[table])
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        # Harvests reference plantings, so they go after those are committed
+        first_wave = [job for table in GENERATORS if table != 'harvest' for job in batches(table)]
+        run(first_wave)
+        run(batches('harvest'))
+
+    analyzed = [table for table in counts if counts[table]]
+    if analyzed:
+        connection = psycopg2.connect(dsn)
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(f"ANALYZE {', '.join(analyzed)}")
+            cursor.close()
+        finally:
+            connection.close()
+    return written
@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, extras
+
+from metrics import InstrumentedConnection
+
+# Thread-safe PostgreSQL connection pool.
+#
+# Checkout blocks for up to DB_POOL_TIMEOUT seconds when every connection
+# is busy, so a burst of requests queues briefly instead of failing.  Idle
+# connections are pinged before reuse once they have been idle for
+# DB_POOL_PING_INTERVAL seconds, and connections that come back broken
+# are discarded and replaced on demand.
+#
+# Route handlers use the context manager:
+#
+#     with db() as cursor:
+#         cursor.execute(...)
+#
+# which commits on success, rolls back on error and always returns the
+# connection to the pool.
+
+
+class PoolError(Exception):
+    pass
+
+
+class DatabaseUnavailable(PoolError):
+    pass
+
+
+# Every connection busy for the whole wait: to a request that is the same
+# outage as an unreachable database, so it is caught (and answered with a
+# 503) as DatabaseUnavailable
+class PoolTimeout(DatabaseUnavailable):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=5.0, ping_interval=1.0, connection_factory=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError('Invalid pool size: min=%s max=%s' % (minconn, maxconn))
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connection_factory = connection_factory
+        self._cond = threading.Condition()
+        self._idle = deque()          # (connection, returned_at)
+        self._in_use = set()
+        self._size = 0                # open + being opened
+        self._closed = False
+        self._waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        try:
+            return psycopg2.connect(self.dsn, connection_factory=self.connection_factory)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _healthy(self, connection, idle_since):
+        if connection.closed:
+            return False
+        if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if self.ping_interval is not None and time.monotonic() - idle_since >= self.ping_interval:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                connection.rollback()
+            except Exception:
+                return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise DatabaseUnavailable('Connection pool is closed')
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.maxconn:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            raise PoolTimeout('No database connection available after %.1fs' % timeout)
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    connection, idle_since = None, None
+                    self._size += 1
+
+            # Connect and ping outside the lock
+            if connection is None:
+                connection = self._connect()
+            elif not self._healthy(connection, idle_since):
+                self._discard(connection)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use.add(connection)
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            return connection
+
+    def putconn(self, connection, discard=False):
+        with self._cond:
+            if connection not in self._in_use:
+                return
+            self._in_use.discard(connection)
+
+        if not discard and not connection.closed:
+            status = connection.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except Exception:
+                    discard = True
+        if discard or connection.closed or self._closed:
+            self._discard(connection)
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+                'wait_seconds_avg': (self.wait_seconds_total / self.checkouts) if self.checkouts else 0.0
+            }
+
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+connection_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool():
+    global connection_pool
+    with _pool_lock:
+        if DATABASE_URL and not connection_pool:
+            try:
+                connection_pool = ConnectionPool(
+                    DATABASE_URL,
+                    minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+                    maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+                    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+                    ping_interval=float(os.environ.get('DB_POOL_PING_INTERVAL', 1)),
+                    connection_factory=InstrumentedConnection
+                )
+                print("Database connection pool created successfully!")
+            except Exception as e:
+                print(f"Error creating connection pool: {e}")
+    return connection_pool
+
+
+def pool_stats():
+    return connection_pool.stats() if connection_pool else None
+
+
+def checkout():
+    # Raises DatabaseUnavailable, or PoolTimeout when every connection
+    # stayed busy
+    pool = connection_pool or init_pool()
+    if not pool:
+        raise DatabaseUnavailable('Database not configured or unreachable')
+    try:
+        return pool.getconn()
+    except PoolError:
+        raise
+    except Exception as e:
+        raise DatabaseUnavailable(str(e))
+
+
+def get_db_connection():
+    # Manual checkout for long-lived uses (streams, imports); returns None
+    # instead of raising, pair with release_db_connection()
+    try:
+        return checkout()
+    except PoolError as e:
+        print(f"Error getting database connection: {e}")
+        return None
+
+
+def release_db_connection(conn):
+    if connection_pool and conn:
+        connection_pool.putconn(conn)
+
+
+@contextmanager
+def db(cursor_factory=extras.RealDictCursor):
+    connection = checkout()
+    try:
+        cursor = connection.cursor(cursor_factory=cursor_factory)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+        connection.commit()
+    except BaseException:
+        try:
+            connection.rollback()
+        except Exception:
+            connection_pool.putconn(connection, discard=True)
+            raise
+        connection_pool.putconn(connection)
+        raise
+    else:
+        connection_pool.putconn(connection)
@@ -0,0 +1,208 @@
+import json
+import queue
+import threading
+import zlib
+
+# Streaming CSV / NDJSON export of the domain tables.
+#
+# CSV comes straight out of COPY (SELECT ...) TO STDOUT: a worker thread
+# runs the COPY into a small bounded queue and the response generator
+# drains it, so memory stays flat and the first rows go out as soon as
+# Postgres produces them.  NDJSON is built by Postgres (row_to_json) and
+# read through a server-side cursor in batches.
+#
+# The status line has gone out before the first row, so a failure midway
+# cannot turn into an error response.  The stream logs it and raises
+# ExportAborted instead, and the server drops the connection without the
+# final chunk: clients see an incomplete transfer, never a short file that
+# looks complete.  NDJSON streams also end with an {"error": ...} line.
+
+EXPORT_TABLES = {
+    'harvest': {
+        'date_column': 'harvest_date',
+        'columns': ['id', 'plant_id', 'harvest_date', 'quantity', 'unit', 'quality_grade', 'notes', 'created_at'],
+    },
+    'sales': {
+        'date_column': 'sale_date',
+        'columns': ['id', 'sale_date', 'customer_name', 'quantity', 'unit', 'price_per_unit', 'total_amount',
+                    'payment_status', 'notes', 'created_at'],
+    },
+    'operations': {
+        'date_column': 'operation_date',
+        'columns': ['id', 'operation_type', 'operation_date', 'field_location', 'description', 'cost',
+                    'performed_by', 'notes', 'created_at'],
+    },
+    'employee_tasks': {
+        'date_column': 'task_date',
+        'columns': ['id', 'employee_number', 'task_date', 'task_type', 'field_location', 'description',
+                    'start_time', 'estimated_hours', 'status', 'actual_start_time', 'actual_finish_time',
+                    'created_at'],
+    },
+    'inventory': {
+        'date_column': 'last_updated',
+        'columns': ['id', 'item_name', 'category', 'quantity', 'unit', 'min_quantity', 'supplier', 'last_updated'],
+    },
+    'tomato_plants': {
+        'date_column': 'planting_date',
+        'columns': ['id', 'variety', 'planting_date', 'expected_harvest_date', 'status', 'field_location',
+                    'quantity', 'notes', 'created_at'],
+    },
+}
+
+QUEUE_CHUNKS = 16
+CHUNK_BYTES = 64 * 1024
+NDJSON_BATCH = 2000
+
+_DONE = object()
+
+
+class ExportAborted(Exception):
+    pass
+
+
+def build_export_query(table, columns=None, start_date=None, end_date=None):
+    # Returns (sql, params) or raises ValueError for unknown columns.
+    # Column names are checked against the whitelist above, never
+    # interpolated from the request directly.
+    spec = EXPORT_TABLES[table]
+    columns = columns or spec['columns']
+    unknown = [column for column in columns if column not in spec['columns']]
+    if unknown:
+        raise ValueError('Unknown column(s): ' + ', '.join(unknown))
+
+    date_column = spec['date_column']
+    where = []
+    params = []
+    if start_date:
+        where.append(f"{date_column} >= %s")
+        params.append(start_date)
+    if end_date:
+        # Inclusive end date, also for the timestamp column
+        where.append(f"{date_column} < %s::date + 1")
+        params.append(end_date)
+
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {date_column}, id"
+    return sql, params
+
+
+class _QueueWriter:
+    # File-like target for copy_expert that hands ~64KB chunks to the
+    # response generator; put() blocks when the client falls behind.
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            return
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.parts and not self.cancelled.is_set():
+            self.chunks.put(b''.join(self.parts))
+        self.parts = []
+        self.size = 0
+
+
+def stream_csv(connect, release, sql, params, log=print):
+    connection = connect()
+    if not connection:
+        log("Export failed: no database connection")
+        raise ExportAborted('No database connection')
+    chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    finished = threading.Event()
+    failures = []
+
+    def run_copy():
+        try:
+            cursor = connection.cursor()
+            copy_sql = "COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)".format(
+                cursor.mogrify(sql, params).decode('utf-8'))
+            writer = _QueueWriter(chunks, cancelled)
+            cursor.copy_expert(copy_sql, writer)
+            writer.flush()
+            cursor.close()
+        except Exception as e:
+            if not cancelled.is_set():
+                failures.append(e)
+        finally:
+            finished.set()
+            chunks.put(_DONE)
+
+    worker = threading.Thread(target=run_copy, name='export-copy', daemon=True)
+    worker.start()
+    sent = 0
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            sent += len(chunk)
+            yield chunk
+        if failures:
+            log(f"Export failed after {sent} bytes: {str(failures[0]).strip()}")
+            raise ExportAborted(str(failures[0]).strip())
+    finally:
+        if not finished.is_set():
+            # Client went away mid-export: stop the COPY and unblock the
+            # worker before the connection goes back to the pool
+            cancelled.set()
+            connection.cancel()
+            while chunks.get() is not _DONE:
+                pass
+        worker.join()
+        try:
+            connection.rollback()
+        except Exception:
+            # A late cancel can hit the rollback; drop that connection
+            connection.close()
+        release(connection)
+
+
+def stream_ndjson(connect, release, sql, params, log=print):
+    connection = connect()
+    if not connection:
+        log("Export failed: no database connection")
+        yield (json.dumps({'error': 'No database connection'}) + '\n').encode('utf-8')
+        raise ExportAborted('No database connection')
+    sent = 0
+    try:
+        cursor = connection.cursor(name='export_ndjson')
+        cursor.itersize = NDJSON_BATCH
+        cursor.execute(f"SELECT row_to_json(t)::text FROM ({sql}) t", params)
+        while True:
+            rows = cursor.fetchmany(NDJSON_BATCH)
+            if not rows:
+                break
+            sent += len(rows)
+            yield ('\n'.join(row[0] for row in rows) + '\n').encode('utf-8')
+        cursor.close()
+    except Exception as e:
+        log(f"Export failed after {sent} rows: {str(e).strip()}")
+        yield (json.dumps({'error': f'Export failed after {sent} rows'}) + '\n').encode('utf-8')
+        raise ExportAborted(str(e).strip()) from e
+    finally:
+        connection.rollback()
+        release(connection)
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # Propagate a client disconnect so the export releases its connection
+        chunks.close()
@@ -0,0 +1,60 @@
+# Dashboard counters stored in the single-row farm_stats table.
+#
+# The triggers created in database/migrations/0001_initial_schema.sql keep
+# the row current on every insert/update/delete; reconcile_farm_stats()
+# rebuilds it from the source tables in case it ever drifts (TRUNCATE,
+# manual fixes, restores).
+
+STAT_KEYS = ('total_plants', 'total_harvest', 'inventory_items', 'total_sales')
+
+ACTUAL_STATS_SQL = """
+    SELECT (SELECT COUNT(*) FROM tomato_plants) as total_plants,
+           (SELECT COALESCE(SUM(quantity), 0) FROM harvest WHERE unit = 'kg') as total_harvest,
+           (SELECT COUNT(*) FROM inventory) as inventory_items,
+           (SELECT COALESCE(SUM(total_amount), 0) FROM sales) as total_sales
+"""
+
+
+def read_farm_stats(cursor):
+    cursor.execute("""
+        SELECT total_plants, total_harvest, inventory_items, total_sales
+        FROM farm_stats
+        WHERE id = 1
+    """)
+    result = cursor.fetchone()
+    if not result:
+        return {'total_plants': 0, 'total_harvest': 0, 'inventory_items': 0, 'total_sales': 0}
+    return {
+        'total_plants': result['total_plants'],
+        'total_harvest': float(result['total_harvest']),
+        'inventory_items': result['inventory_items'],
+        'total_sales': float(result['total_sales'])
+    }
+
+
+def farm_stats_drift(cursor):
+    # Returns {stat: (stored, actual)} for every counter that disagrees
+    cursor.execute("SELECT * FROM farm_stats WHERE id = 1")
+    stored = cursor.fetchone() or {}
+    cursor.execute(ACTUAL_STATS_SQL)
+    actual = cursor.fetchone()
+    return {key: (stored.get(key), actual[key]) for key in STAT_KEYS if stored.get(key) != actual[key]}
+
+
+def reconcile_farm_stats(cursor):
+    # SHARE mode blocks writers (and so their triggers) for the duration of
+    # the rebuild, so no delta can be applied on top of a stale recount.
+    cursor.execute("LOCK TABLE tomato_plants, harvest, inventory, sales IN SHARE MODE")
+    drift = farm_stats_drift(cursor)
+    cursor.execute(f"""
+        INSERT INTO farm_stats (id, total_plants, total_harvest, inventory_items, total_sales, updated_at)
+        SELECT 1, total_plants, total_harvest, inventory_items, total_sales, CURRENT_TIMESTAMP
+        FROM ({ACTUAL_STATS_SQL}) actual
+        ON CONFLICT (id) DO UPDATE SET
+            total_plants = EXCLUDED.total_plants,
+            total_harvest = EXCLUDED.total_harvest,
+            inventory_items = EXCLUDED.inventory_items,
+            total_sales = EXCLUDED.total_sales,
+            updated_at = EXCLUDED.updated_at
+    """)
+    return drift
@@ -0,0 +1,213 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# Yield forecast per variety and field.
+#
+# The model is a yield-by-age curve per (variety, field) group: the kg
+# harvested per plant in each week after planting.  The rate for week w is
+# the kg harvested at age w over the plants that have lived past week w,
+# so young plantings add to the curve without dragging it down.  Groups
+# with little history are shrunk toward their variety's curve, and
+# varieties toward the whole farm's.  The forecast then looks up every
+# active planting's curve at its coming ages, times its plant count, in
+# one NumPy gather over all plantings, and sums per week.
+#
+# The harvest sums per (group, age) are the expensive part (a join of
+# harvest and tomato_plants), so they are kept between calls and topped up
+# with the harvests past the highest id already counted.  Plantings are
+# re-read on every call: two grouped scans of tomato_plants.  Edited or
+# deleted harvests, and ones committed after a higher id was counted, are
+# only picked up by the full rebuild every REBUILD_SECONDS.
+
+ACTIVE_STATUS = 'Growing'
+MAX_AGE_WEEKS = 52
+HORIZON_WEEKS = 12
+PRIOR_PLANTS = 50.0
+REBUILD_SECONDS = 3600
+KG_PER_UNIT = {'kg': 1.0, 'lbs': 0.45359237, 'tons': 1000.0}
+UNASSIGNED = 'Unassigned'
+
+GROUP_COLUMNS = f"p.variety, COALESCE(NULLIF(p.field_location, ''), '{UNASSIGNED}') as field_location"
+
+
+class YieldForecaster:
+    def __init__(self, rebuild_seconds=REBUILD_SECONDS):
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._reset()
+        self.rebuilds = 0
+        self.updates = 0
+
+    def _reset(self):
+        self._groups = {}                                      # (variety, field) -> row
+        self._harvest_kg = np.zeros((0, MAX_AGE_WEEKS))        # kg by group and age week
+        self._last_harvest_id = 0
+        self._built_at = None
+
+    def _group_rows(self, keys):
+        # Row indices for (variety, field) keys, adding rows for new groups
+        rows = np.empty(len(keys), dtype=np.int64)
+        for index, key in enumerate(keys):
+            row = self._groups.get(key)
+            if row is None:
+                row = self._groups[key] = len(self._groups)
+            rows[index] = row
+        missing = len(self._groups) - len(self._harvest_kg)
+        if missing:
+            self._harvest_kg = np.vstack([self._harvest_kg, np.zeros((missing, MAX_AGE_WEEKS))])
+        return rows
+
+    def _load_harvests(self, cursor):
+        # Adds the harvests past the last counted id to the sums
+        cursor.execute("SELECT COALESCE(MAX(id), 0) as last_id FROM harvest")
+        last_id = cursor.fetchone()['last_id']
+        if last_id <= self._last_harvest_id:
+            return 0
+        cursor.execute(f"""
+            SELECT {GROUP_COLUMNS},
+                   (h.harvest_date - p.planting_date) / 7 as age,
+                   SUM(h.quantity * u.factor)::float8 as kg
+            FROM harvest h
+            JOIN tomato_plants p ON p.id = h.plant_id
+            JOIN unnest(%s::text[], %s::float8[]) u(unit, factor) ON u.unit = h.unit
+            WHERE h.id > %s AND h.id <= %s
+              AND h.harvest_date >= p.planting_date
+              AND h.harvest_date < p.planting_date + %s
+            GROUP BY 1, 2, 3
+        """, (list(KG_PER_UNIT), list(KG_PER_UNIT.values()), self._last_harvest_id, last_id,
+              MAX_AGE_WEEKS * 7))
+        sums = cursor.fetchall()
+        if sums:
+            rows = self._group_rows([(row['variety'], row['field_location']) for row in sums])
+            ages = np.fromiter((row['age'] for row in sums), dtype=np.int64, count=len(sums))
+            kg = np.fromiter((row['kg'] for row in sums), dtype=np.float64, count=len(sums))
+            np.add.at(self._harvest_kg, (rows, ages), kg)
+        self._last_harvest_id = last_id
+        return len(sums)
+
+    def _load_plantings(self, cursor):
+        # (plants by group and age week for the exposure, active plantings
+        # as columns: group rows, age in days, plant counts)
+        cursor.execute(f"""
+            SELECT {GROUP_COLUMNS},
+                   LEAST((CURRENT_DATE - p.planting_date) / 7, %s) as age,
+                   SUM(COALESCE(p.quantity, 1))::float8 as plants
+            FROM tomato_plants p
+            WHERE p.planting_date <= CURRENT_DATE
+            GROUP BY 1, 2, 3
+        """, (MAX_AGE_WEEKS,))
+        planted = cursor.fetchall()
+        cursor.execute(f"""
+            SELECT {GROUP_COLUMNS},
+                   CURRENT_DATE - p.planting_date as age_days,
+                   SUM(COALESCE(p.quantity, 1))::float8 as plants,
+                   COUNT(*) as plantings
+            FROM tomato_plants p
+            WHERE p.status = %s
+            GROUP BY 1, 2, 3
+        """, (ACTIVE_STATUS,))
+        active = cursor.fetchall()
+
+        planted_rows = self._group_rows([(row['variety'], row['field_location']) for row in planted])
+        active_rows = self._group_rows([(row['variety'], row['field_location']) for row in active])
+        by_age = np.zeros((len(self._groups), MAX_AGE_WEEKS + 1))
+        np.add.at(by_age, (planted_rows, np.fromiter((row['age'] for row in planted), dtype=np.int64,
+                                                     count=len(planted))),
+                  np.fromiter((row['plants'] for row in planted), dtype=np.float64, count=len(planted)))
+        # Plants that have lived through week w: planted more than w weeks ago
+        exposure = np.cumsum(by_age[:, ::-1], axis=1)[:, ::-1][:, 1:]
+        active_columns = (
+            active_rows,
+            np.fromiter((row['age_days'] for row in active), dtype=np.int64, count=len(active)),
+            np.fromiter((row['plants'] for row in active), dtype=np.float64, count=len(active)),
+            sum(row['plantings'] for row in active)
+        )
+        return exposure, active_columns
+
+    def _curves(self, exposure):
+        # kg per plant by group and age week, shrunk toward the variety and
+        # the farm curves by PRIOR_PLANTS plants' worth of weight
+        kg = self._harvest_kg
+        varieties = sorted({variety for variety, _ in self._groups})
+        variety_of = np.empty(len(self._groups), dtype=np.int64)
+        for (variety, _), row in self._groups.items():
+            variety_of[row] = varieties.index(variety)
+
+        farm = kg.sum(axis=0) / np.maximum(exposure.sum(axis=0), 1.0)
+        variety_kg = np.zeros((len(varieties), MAX_AGE_WEEKS))
+        variety_exposure = np.zeros((len(varieties), MAX_AGE_WEEKS))
+        np.add.at(variety_kg, variety_of, kg)
+        np.add.at(variety_exposure, variety_of, exposure)
+        variety = (variety_kg + PRIOR_PLANTS * farm) / (variety_exposure + PRIOR_PLANTS)
+        return (kg + PRIOR_PLANTS * variety[variety_of]) / (exposure + PRIOR_PLANTS)
+
+    def refresh(self, cursor):
+        # Full rebuild when due, otherwise only the new harvests
+        if self._built_at is None or time.monotonic() - self._built_at > self.rebuild_seconds:
+            self._reset()
+            self._load_harvests(cursor)
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+        elif self._load_harvests(cursor):
+            self.updates += 1
+
+    def forecast(self, cursor, weeks=HORIZON_WEEKS):
+        # kg expected per week from today for the active plantings, in
+        # total and per (variety, field) group
+        with self._lock:
+            self.refresh(cursor)
+            exposure, (rows, age_days, plants, plantings) = self._load_plantings(cursor)
+            curves = self._curves(exposure)
+            groups = sorted(self._groups, key=self._groups.get)
+            last_harvest_id = self._last_harvest_id
+
+        # Week j covers days [7j, 7j + 7) from today; ages outside the
+        # curve (not yet planted, or past MAX_AGE_WEEKS) yield nothing
+        ages = (age_days[:, None] + 7 * np.arange(weeks)[None, :]) // 7
+        inside = (ages >= 0) & (ages < MAX_AGE_WEEKS)
+        expected = np.where(inside, curves[rows[:, None], np.clip(ages, 0, MAX_AGE_WEEKS - 1)], 0.0)
+        expected *= plants[:, None]
+        by_group = np.zeros((len(groups), weeks))
+        np.add.at(by_group, rows, expected)
+        group_plants = np.bincount(rows, weights=plants, minlength=len(groups))
+
+        today = date.today()
+        result = {
+            'start': today.isoformat(),
+            'weeks': [{'week_start': (today + timedelta(days=7 * week)).isoformat(),
+                       'kg': round(float(kg), 2)} for week, kg in enumerate(by_group.sum(axis=0))],
+            'total_kg': round(float(by_group.sum()), 2),
+            'active_plantings': int(plantings),
+            'active_plants': int(plants.sum()),
+            'groups': [],
+            'harvests_through_id': int(last_harvest_id)
+        }
+        for row in np.argsort(-by_group.sum(axis=1), kind='stable'):
+            if not group_plants[row]:
+                continue
+            variety, field_location = groups[row]
+            result['groups'].append({
+                'variety': variety,
+                'field_location': field_location,
+                'active_plants': int(group_plants[row]),
+                'kg_per_plant': round(float(curves[row].sum()), 3),
+                'peak_week': int(np.argmax(curves[row])),
+                'total_kg': round(float(by_group[row].sum()), 2),
+                'weekly_kg': [round(float(kg), 2) for kg in by_group[row]]
+            })
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'groups': len(self._groups),
+                'harvests_through_id': self._last_harvest_id,
+                'rebuilds': self.rebuilds,
+                'updates': self.updates
+            }
+
+
+forecaster = YieldForecaster()
@@ -0,0 +1,191 @@
+import statistics
+
+# Index pack benchmark and unused-index check.
+#
+# `compare_index_pack` runs the workload below under EXPLAIN (ANALYZE,
+# BUFFERS) twice: once inside a transaction that drops the indexes added by
+# migration 0003 (restoring the index it replaced), and once as-is.  Both
+# transactions are rolled back, so the schema and data are unchanged, but
+# the DROP INDEX holds an exclusive lock on the tables while the "before"
+# half runs: use a bench database.
+#
+# `unused_indexes` reads pg_stat_user_indexes for indexes that have not
+# been scanned since the statistics were last reset, summed per parent
+# index on partitioned tables.
+
+INDEX_PACK = (
+    'idx_harvest_plant_id',
+    'idx_harvest_kg_plant',
+    'idx_sales_pending_sale_date_id',
+    'idx_tomato_plants_planting_date_id_cover',
+    'idx_tomato_plants_status',
+    'idx_employee_tasks_task_date_employee',
+)
+
+# Indexes the pack replaced, recreated for the "before" measurements
+REPLACED_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_tomato_plants_planting_date_id ON tomato_plants (planting_date, id)",
+)
+
+# (name, sql) pairs mirroring the queries in app.py and report_engine.py.
+# Write statements are measured inside the rolled-back transaction.
+WORKLOAD = (
+    ('reports: field performance', """
+        SELECT p.field_location,
+               COUNT(p.id) as plant_count,
+               COALESCE(SUM(h.quantity), 0) as total_harvest
+        FROM tomato_plants p
+        LEFT JOIN harvest h ON p.id = h.plant_id AND h.unit = 'kg'
+        WHERE p.field_location IS NOT NULL AND p.field_location != ''
+        GROUP BY p.field_location
+        ORDER BY total_harvest DESC
+    """),
+    ('reports: quality distribution', """
+        SELECT quality_grade,
+               SUM(quantity) as total_quantity,
+               (SUM(quantity) * 100.0 / NULLIF(SUM(SUM(quantity)) OVER (), 0)) as percentage
+        FROM harvest
+        WHERE unit = 'kg'
+        GROUP BY quality_grade
+        ORDER BY total_quantity DESC
+    """),
+    ('sales: pending first page', """
+        SELECT * FROM sales WHERE payment_status = 'Pending'
+        ORDER BY sale_date DESC, id DESC LIMIT 11
+    """),
+    ('sales: pending total', """
+        SELECT COALESCE(SUM(total_amount), 0) FROM sales WHERE payment_status = 'Pending'
+    """),
+    ('index: recent plantings', """
+        SELECT 'Planting' as type, planting_date as date,
+               variety || ' - ' || quantity || ' plants' as details
+        FROM tomato_plants
+        ORDER BY planting_date DESC LIMIT 5
+    """),
+    ('harvest form: plant search by month', """
+        SELECT id, variety, planting_date, field_location FROM tomato_plants
+        WHERE planting_date >= date_trunc('month', CURRENT_DATE) - INTERVAL '1 month'
+          AND planting_date < date_trunc('month', CURRENT_DATE)
+        ORDER BY planting_date DESC, id DESC LIMIT 10
+    """),
+    ('plants: count by status', """
+        SELECT COUNT(*) FROM tomato_plants WHERE status = 'Growing'
+    """),
+    ('employee tasks: board', """
+        SELECT * FROM employee_tasks
+        WHERE task_date >= date_trunc('week', CURRENT_DATE)::date
+          AND task_date <= date_trunc('week', CURRENT_DATE)::date + 6
+        ORDER BY task_date DESC, employee_number ASC
+    """),
+    ('planting: delete (FK check)', """
+        DELETE FROM tomato_plants WHERE id = (SELECT MAX(id) FROM tomato_plants)
+    """),
+)
+
+
+def _plan_ms(plan):
+    # Execution time including AFTER triggers (the FK actions run there)
+    return plan['Execution Time'] + sum(trigger['Time'] for trigger in plan.get('Triggers', []))
+
+
+def _scans(node, found=None):
+    found = [] if found is None else found
+    if 'Relation Name' in node or 'Index Name' in node:
+        label = node['Node Type']
+        if 'Index Name' in node:
+            label += f" using {node['Index Name']}"
+        elif 'Relation Name' in node:
+            label += f" on {node['Relation Name']}"
+        found.append(label)
+    for child in node.get('Plans', []):
+        _scans(child, found)
+    return found
+
+
+def _measure(cursor, workload, runs):
+    results = {}
+    for name, sql in workload:
+        timings = []
+        plan = None
+        # First run warms the cache and is not counted
+        for _ in range(runs + 1):
+            cursor.execute("SAVEPOINT bench_query")
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+            plan = cursor.fetchone()[0][0]
+            cursor.execute("ROLLBACK TO SAVEPOINT bench_query")
+            timings.append(_plan_ms(plan))
+        results[name] = {
+            'ms': statistics.median(timings[1:]),
+            'scans': _scans(plan['Plan']),
+            'shared_hit': plan['Plan'].get('Shared Hit Blocks', 0),
+            'shared_read': plan['Plan'].get('Shared Read Blocks', 0)
+        }
+    return results
+
+
+def _apply_settings(cursor, settings):
+    # Planner settings such as random_page_cost, for this transaction only
+    for name, value in (settings or {}).items():
+        cursor.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+
+
+def compare_index_pack(connection, workload=WORKLOAD, runs=3, settings=None):
+    # {name: {'before': {...}, 'after': {...}}}; missing pack indexes are
+    # reported in 'missing' and simply absent from both runs
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)", (list(INDEX_PACK),))
+        present = [row[0] for row in cursor.fetchall()]
+        connection.rollback()
+
+        _apply_settings(cursor, settings)
+        for name in present:
+            cursor.execute(f"DROP INDEX {name}")
+        for statement in REPLACED_INDEXES:
+            cursor.execute(statement)
+        before = _measure(cursor, workload, runs)
+        connection.rollback()
+
+        _apply_settings(cursor, settings)
+        after = _measure(cursor, workload, runs)
+        connection.rollback()
+    finally:
+        cursor.close()
+    return {
+        'missing': [name for name in INDEX_PACK if name not in present],
+        'queries': {name: {'before': before[name], 'after': after[name]} for name, _ in workload}
+    }
+
+
+def unused_indexes(cursor, max_scans=0):
+    # Non-unique indexes scanned at most max_scans times since the last
+    # stats reset, biggest first.  Unique and primary-key indexes enforce
+    # constraints and are never reported.  On a partitioned table only the
+    # parent index is reported, with the scans and size of all its
+    # partitions' indexes: the months created ahead of time and _history
+    # are never scanned and would otherwise all show up as unused.
+    cursor.execute("""
+        WITH leaf AS (
+            SELECT COALESCE(pg_partition_root(s.indexrelid)::oid, s.indexrelid) as index_oid,
+                   s.idx_scan,
+                   pg_relation_size(s.indexrelid) as size_bytes
+            FROM pg_stat_user_indexes s
+        )
+        SELECT t.relname as table_name,
+               c.relname as index_name,
+               SUM(l.idx_scan)::bigint as idx_scan,
+               COUNT(*) as partitions,
+               SUM(l.size_bytes)::bigint as size_bytes,
+               pg_size_pretty(SUM(l.size_bytes)) as size,
+               (SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()) as stats_since
+        FROM leaf l
+        JOIN pg_class c ON c.oid = l.index_oid
+        JOIN pg_index i ON i.indexrelid = l.index_oid
+        JOIN pg_class t ON t.oid = i.indrelid
+        WHERE NOT i.indisunique
+          AND NOT i.indisprimary
+        GROUP BY t.relname, c.relname
+        HAVING SUM(l.idx_scan) <= %s
+        ORDER BY SUM(l.size_bytes) DESC, c.relname
+    """, (max_scans,))
+    return cursor.fetchall()
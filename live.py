@@ -0,0 +1,150 @@
+import json
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+# Change events for the live dashboards.
+#
+# Migration 0007's triggers NOTIFY the farm_changes channel on every write.
+# One listener thread per process holds one dedicated connection with
+# LISTEN farm_changes and fans each event out to the subscribed browsers
+# (the /events Server-Sent Events streams), however many there are, and
+# to on_event.  The app starts the thread before it serves its first
+# request, since on_event keeps its result cache current with or without
+# subscribers.  It reconnects on its own; after a reconnect subscribers get
+# a "resync" event, since anything committed while it was away was missed.
+#
+# Every subscriber has a bounded queue.  One that falls behind is cleared
+# and sent "resync" instead of holding events for ever.
+
+CHANNEL = 'farm_changes'
+RECONNECT_SECONDS = 5
+
+
+class ChangeListener:
+    def __init__(self, dsn, channel=CHANNEL, on_event=None, max_subscribers=100, queue_size=100, log=print):
+        self.dsn = dsn
+        self.channel = channel
+        self.on_event = on_event
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.log = log
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self.events = 0
+        self.reconnects = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        # A queue of events, or None when max_subscribers are connected
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = queue.Queue(self.queue_size)
+            self._subscribers.add(subscriber)
+            self._start()
+        return subscriber
+
+    def start(self):
+        # Starts (or restarts) the listener thread; on_event needs it
+        # running whether or not anyone is subscribed
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self.dsn and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name='change-listener', daemon=True)
+            self._thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def next_event(self, subscriber, timeout):
+        # The next event for a subscriber, or None after timeout seconds
+        try:
+            return subscriber.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def publish(self, event):
+        if self.on_event is not None:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                self.log(f"Change event handler failed: {e}")
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.events += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                self._resync(subscriber)
+
+    def _resync(self, subscriber):
+        with self._lock:
+            self.dropped += 1
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        subscriber.put_nowait({'event': 'resync'})
+
+    def _listen(self):
+        connection = psycopg2.connect(self.dsn)
+        connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {self.channel}")
+        cursor.close()
+        return connection
+
+    def _run(self):
+        connection = None
+        while True:
+            try:
+                if connection is None:
+                    connection = self._listen()
+                    if self.reconnects or self.events:
+                        self.publish({'event': 'resync'})
+                if select.select([connection], [], [], 5)[0]:
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            event = json.loads(notify.payload)
+                        except ValueError:
+                            continue
+                        self.publish(event)
+                else:
+                    # Quiet channel: make sure the connection is still there
+                    cursor = connection.cursor()
+                    cursor.execute("SELECT 1")
+                    cursor.close()
+            except Exception as e:
+                self.log(f"Change listener lost its connection: {e}")
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                    connection = None
+                with self._lock:
+                    self.reconnects += 1
+                time.sleep(RECONNECT_SECONDS)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'running': self._thread is not None and self._thread.is_alive(),
+                'events': self.events,
+                'reconnects': self.reconnects,
+                'dropped': self.dropped
+            }
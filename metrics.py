@@ -0,0 +1,221 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from psycopg2 import extensions, extras
+
+# Per-request database instrumentation and Prometheus text metrics.
+#
+# Pool connections are created with InstrumentedConnection, whose cursors
+# time execute()/executemany()/copy_expert() and count the rows returned.
+# The numbers accumulate in a thread-local for the current request;
+# end_request() folds them into per-route totals and a latency histogram.
+# Work handed to other threads (report sections) is counted there with
+# begin_request()/detach_request() and added back with merge_request_stats().
+# Server-side (named) cursors are timed at execute() only, rows fetched
+# later by iteration are not counted.
+#
+# An observer (slowlog.SlowQueryLog) can be attached with
+# set_query_observer(); it is called for statements slower than its
+# threshold and for statements that raise.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = threading.local()
+_observer = None
+_slow_threshold = float('inf')
+
+
+def set_query_observer(observer, threshold_seconds):
+    global _observer, _slow_threshold
+    _observer = observer
+    _slow_threshold = threshold_seconds if observer else float('inf')
+
+
+def _record(cursor, query, vars, elapsed):
+    stats = getattr(_current, 'stats', None)
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+        if cursor.name is None and cursor.rowcount > 0 and cursor.description is not None:
+            stats[2] += cursor.rowcount
+    if elapsed >= _slow_threshold:
+        _observer.observe('slow', query, vars, elapsed, getattr(_current, 'route', None))
+
+
+def _failed(query, vars, elapsed, error):
+    if _observer is not None:
+        _observer.observe('error', query, vars, elapsed, getattr(_current, 'route', None),
+                          error=f"{type(error).__name__}: {str(error).strip()}")
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception as e:
+            _failed(query, vars, perf_counter() - started, e)
+            raise
+        _record(self, query, vars, perf_counter() - started)
+        return result
+
+    def executemany(self, query, vars_list):
+        started = perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except Exception as e:
+            _failed(query, None, perf_counter() - started, e)
+            raise
+        _record(self, query, None, perf_counter() - started)
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        started = perf_counter()
+        try:
+            result = super().copy_expert(sql, file, size)
+        except Exception as e:
+            _failed(sql, None, perf_counter() - started, e)
+            raise
+        _record(self, sql, None, perf_counter() - started)
+        return result
+
+
+class InstrumentedCursor(_TimedCursorMixin, extensions.cursor):
+    pass
+
+
+class InstrumentedDictCursor(_TimedCursorMixin, extras.RealDictCursor):
+    pass
+
+
+_CURSOR_CLASSES = {
+    None: InstrumentedCursor,
+    extensions.cursor: InstrumentedCursor,
+    extras.RealDictCursor: InstrumentedDictCursor,
+}
+
+
+class InstrumentedConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory')
+        kwargs['cursor_factory'] = _CURSOR_CLASSES.get(factory, factory)
+        return super().cursor(*args, **kwargs)
+
+
+def begin_request(route=None):
+    # [queries, db seconds, rows]
+    _current.stats = [0, 0.0, 0]
+    _current.route = route
+    _current.started = perf_counter()
+
+
+def request_stats():
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        return None
+    return {
+        'queries': stats[0],
+        'db_seconds': stats[1],
+        'rows': stats[2],
+        'seconds': perf_counter() - _current.started
+    }
+
+
+def current_route():
+    return getattr(_current, 'route', None)
+
+
+def detach_request():
+    # Ends a worker thread's stats without recording a request; the caller
+    # folds them into the request that spawned the work
+    stats = request_stats()
+    _current.stats = None
+    return stats
+
+
+def merge_request_stats(stats):
+    # Adds a worker's queries, time and rows to the current request
+    current = getattr(_current, 'stats', None)
+    if current is not None and stats is not None:
+        current[0] += stats['queries']
+        current[1] += stats['db_seconds']
+        current[2] += stats['rows']
+
+
+class RouteMetrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}   # (route, method, status) -> count
+        self._routes = {}     # (route, method) -> [bucket counts..., sum, count, queries, db seconds, rows]
+
+    def observe(self, route, method, status, stats):
+        key = (route, method)
+        index = bisect_left(self.buckets, stats['seconds'])
+        size = len(self.buckets)
+        with self._lock:
+            self._requests[(route, method, status)] = self._requests.get((route, method, status), 0) + 1
+            entry = self._routes.get(key)
+            if entry is None:
+                entry = self._routes[key] = [0] * (size + 1) + [0.0, 0, 0, 0.0, 0]
+            entry[index] += 1
+            entry[size + 1] += stats['seconds']
+            entry[size + 2] += 1
+            entry[size + 3] += stats['queries']
+            entry[size + 4] += stats['db_seconds']
+            entry[size + 5] += stats['rows']
+
+    def render(self, extra=()):
+        # Prometheus text exposition format 0.0.4; extra holds
+        # (name, type, help, value) samples such as the pool gauges
+        with self._lock:
+            requests = dict(self._requests)
+            routes = {key: list(entry) for key, entry in self._routes.items()}
+        size = len(self.buckets)
+        lines = [
+            '# HELP farm_http_requests_total HTTP requests by route, method and status.',
+            '# TYPE farm_http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'farm_http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP farm_http_request_duration_seconds Request latency by route.',
+            '# TYPE farm_http_request_duration_seconds histogram',
+        ]
+        for (route, method), entry in sorted(routes.items()):
+            labels = f'route="{route}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(f'farm_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'farm_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry[size + 2]}')
+            lines.append(f'farm_http_request_duration_seconds_sum{{{labels}}} {entry[size + 1]}')
+            lines.append(f'farm_http_request_duration_seconds_count{{{labels}}} {entry[size + 2]}')
+
+        for name, offset, help_text in (
+                ('farm_db_queries_total', 3, 'Database statements executed, by route.'),
+                ('farm_db_seconds_total', 4, 'Time spent in database calls, by route.'),
+                ('farm_db_rows_total', 5, 'Rows returned by database calls, by route.')):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (route, method), entry in sorted(routes.items()):
+                lines.append(f'{name}{{route="{route}",method="{method}"}} {entry[size + offset]}')
+
+        for name, kind, help_text, value in extra:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def end_request(route_metrics, route, method, status):
+    # Returns the request's stats, or None if begin_request() was not called
+    stats = request_stats()
+    _current.stats = None
+    if stats is not None:
+        route_metrics.observe(route, method, status, stats)
+    return stats
+
+
+def server_timing(stats):
+    return (f'db;desc="{stats["queries"]} queries";dur={stats["db_seconds"] * 1000:.2f}, '
+            f'total;dur={stats["seconds"] * 1000:.2f}')
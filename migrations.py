@@ -0,0 +1,155 @@
+import hashlib
+import os
+import re
+import time
+from collections import namedtuple
+
+import psycopg2
+from psycopg2 import errors, extensions
+
+# Versioned schema migrations.
+#
+# Migrations are the NNNN_name.sql files in database/migrations, applied in
+# version order.  Each one runs in its own transaction together with the
+# INSERT that records it in schema_migrations, so a failed migration leaves
+# nothing behind and is retried on the next start.  The recorded SHA-256
+# checksum catches files edited after they were applied: add a new
+# migration instead of changing an old one.
+#
+# Startup cost when nothing is pending is one SELECT of schema_migrations.
+# Otherwise the runner takes a session advisory lock, so when several
+# workers boot together one migrates while the others wait and then find
+# nothing left to do.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'migrations')
+
+# pg_advisory_lock key shared by every process migrating this database
+LOCK_KEY = 7250431
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+Migration = namedtuple('Migration', 'version name path checksum')
+
+
+class MigrationError(Exception):
+    pass
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    seen = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in seen:
+            raise MigrationError(f'Duplicate migration version {version}: {seen[version]} and {filename}')
+        seen[version] = filename
+        path = os.path.join(directory, filename)
+        with open(path, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        migrations.append(Migration(version, match.group(2), path, checksum))
+    return sorted(migrations)
+
+
+def _applied(connection):
+    # {version: (checksum, applied_at)}, or None before the first migration
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT version, checksum, applied_at FROM schema_migrations")
+        return {version: (checksum, applied_at) for version, checksum, applied_at in cursor.fetchall()}
+    except errors.UndefinedTable:
+        return None
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def _check_checksums(migrations, applied):
+    for migration in migrations:
+        recorded = applied.get(migration.version)
+        if recorded and recorded[0] != migration.checksum:
+            raise MigrationError(f'Migration {os.path.basename(migration.path)} was changed after it '
+                                 f'was applied (checksum mismatch); add a new migration instead')
+
+
+def pending_migrations(connection, migrations=None):
+    migrations = load_migrations() if migrations is None else migrations
+    applied = _applied(connection) or {}
+    _check_checksums(migrations, applied)
+    return [migration for migration in migrations if migration.version not in applied]
+
+
+def migration_status(connection, migrations=None):
+    # [(version, name, state, applied_at)] with state applied, pending,
+    # changed (file edited since) or missing (recorded but no file)
+    migrations = load_migrations() if migrations is None else migrations
+    applied = _applied(connection) or {}
+    status = []
+    for migration in migrations:
+        recorded = applied.get(migration.version)
+        if recorded is None:
+            state = 'pending'
+        elif recorded[0] != migration.checksum:
+            state = 'changed'
+        else:
+            state = 'applied'
+        status.append((migration.version, migration.name, state, recorded[1] if recorded else None))
+    known = {migration.version for migration in migrations}
+    for version in sorted(set(applied) - known):
+        status.append((version, None, 'missing', applied[version][1]))
+    return sorted(status, key=lambda row: row[0])
+
+
+def migrate(connection, migrations=None, log=print):
+    # Applies pending migrations; returns the ones applied by this call
+    migrations = load_migrations() if migrations is None else migrations
+    applied = _applied(connection)
+    if applied is not None:
+        _check_checksums(migrations, applied)
+        if all(migration.version in applied for migration in migrations):
+            return []
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+    connection.commit()
+    done = []
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                checksum CHAR(64) NOT NULL,
+                execution_ms INTEGER,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        connection.commit()
+
+        # Re-read under the lock: another worker may have migrated meanwhile
+        for migration in pending_migrations(connection, migrations):
+            with open(migration.path, encoding='utf-8') as f:
+                sql = f.read()
+            log(f"Applying migration {os.path.basename(migration.path)}...")
+            started = time.perf_counter()
+            try:
+                cursor.execute(sql)
+                cursor.execute("""
+                    INSERT INTO schema_migrations (version, name, checksum, execution_ms)
+                    VALUES (%s, %s, %s, %s)
+                """, (migration.version, migration.name, migration.checksum,
+                      int((time.perf_counter() - started) * 1000)))
+                connection.commit()
+            except psycopg2.Error as e:
+                connection.rollback()
+                raise MigrationError(f'Migration {os.path.basename(migration.path)} failed: '
+                                     f'{str(e).strip()}') from e
+            done.append(migration)
+    finally:
+        if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+        connection.commit()
+        cursor.close()
+    return done
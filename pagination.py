@@ -0,0 +1,124 @@
+import base64
+import json
+from datetime import date, datetime
+
+# Keyset (seek) pagination helpers for the list views.
+#
+# Instead of LIMIT/OFFSET every page seeks straight to its first row using
+# the sort key of the previous page's last row, so page N costs the same as
+# page 1 as long as the sort key is backed by an index.  The sort key is
+# handed to the browser as an opaque, URL-safe token.
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+def keyset_page(cursor, select_sql, key_columns, params=(), where=None,
+                descending=True, after=None, before=None, per_page=10):
+    # select_sql must not contain WHERE/ORDER BY/LIMIT; extra filters go in
+    # `where` so they can be combined with the seek predicate.
+    clauses = list(where or [])
+    args = list(params)
+
+    going_back = bool(before)
+    values = decode_cursor(before if going_back else after)
+    if values is not None and len(values) != len(key_columns):
+        values = None
+
+    # Walking backwards flips both the seek comparison and the sort order;
+    # the rows are reversed again below so the page always reads top-down.
+    scan_descending = descending != going_back
+    if values is not None:
+        placeholders = ', '.join(['%s'] * len(key_columns))
+        clauses.append("({}) {} ({})".format(', '.join(key_columns),
+                                              '<' if scan_descending else '>',
+                                              placeholders))
+        args.extend(values)
+        # Redundant bound on the leading column: partition pruning cannot
+        # use the row comparison above
+        clauses.append("{} {} %s".format(key_columns[0], '<=' if scan_descending else '>='))
+        args.append(values[0])
+
+    sql = select_sql
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    direction = 'DESC' if scan_descending else 'ASC'
+    sql += " ORDER BY " + ", ".join(f"{col} {direction}" for col in key_columns)
+    sql += " LIMIT %s"
+    args.append(per_page + 1)
+
+    cursor.execute(sql, args)
+    rows = cursor.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if going_back:
+        rows.reverse()
+
+    if going_back:
+        has_prev, has_next = has_more, values is not None
+    else:
+        has_prev, has_next = values is not None, has_more
+
+    names = [col.split('.')[-1] for col in key_columns]
+    next_cursor = None
+    prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor([rows[-1][name] for name in names])
+    if rows and has_prev:
+        prev_cursor = encode_cursor([rows[0][name] for name in names])
+
+    return {
+        'rows': rows,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    }
+
+
+def count_rows(cursor, table, mode='estimate', where=None, params=()):
+    # mode: 'exact' runs COUNT(*), 'estimate' reads the planner statistics
+    # from pg_class (cheap, refreshed by autovacuum/ANALYZE), anything else
+    # skips the total entirely.  Returns (count, is_estimate).  The table
+    # estimate is meaningless once filters apply, so filtered views only
+    # get a total on ?count=exact.
+    if mode == 'exact':
+        sql = f"SELECT COUNT(*) as count FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        cursor.execute(sql, list(params))
+        result = cursor.fetchone()
+        return (result['count'] if result else 0), False
+
+    if mode == 'estimate' and not where:
+        # A partitioned table has no statistics of its own; add up its
+        # partitions' instead
+        cursor.execute("""
+            SELECT CASE WHEN c.relkind = 'p' THEN
+                       (SELECT SUM(part.reltuples) FILTER (WHERE part.reltuples >= 0)
+                        FROM pg_inherits i JOIN pg_class part ON part.oid = i.inhrelid
+                        WHERE i.inhparent = c.oid)
+                   ELSE c.reltuples END::bigint as estimate
+            FROM pg_class c
+            WHERE c.oid = to_regclass(%s)
+        """, (table,))
+        result = cursor.fetchone()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if result and result['estimate'] is not None and result['estimate'] >= 0:
+            return result['estimate'], True
+
+    return None, False
@@ -0,0 +1,211 @@
+import re
+from datetime import date, timedelta
+
+from report_engine import CUTOFF_6_MONTHS, MONTHLY_SALES_SQL
+
+# Monthly partition maintenance and pruning checks.
+#
+# Migration 0004 partitions the tables below by month and installs the
+# farm_*partition* SQL functions; this module is the Python side.
+# ensure_partitions() creates the months a writer is about to need: the
+# `partitions --ensure` command (run it from cron) for the next few months,
+# bulk loaders for their date range.  App startup only checks that next
+# month exists and runs it when it does not.  check_pruning() runs the date-bounded queries of the app
+# under EXPLAIN ANALYZE and checks that each one only scanned partitions
+# in its date range.
+
+PARTITIONED_TABLES = {
+    'harvest': 'harvest_date',
+    'sales': 'sale_date',
+    'operations': 'operation_date',
+    'irrigation': 'irrigation_date',
+    'spraying': 'spray_date',
+    'weeding': 'weeding_date',
+    'sensor_readings': 'reading_at',
+}
+
+MONTHS_AHEAD = 3
+
+# pg_advisory_xact_lock key for partition upkeep
+PARTITION_LOCK = 7250432
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_partitions(cursor, first=None, last=None, months_ahead=MONTHS_AHEAD):
+    # Creates the missing monthly partitions from first's month through
+    # last's (default: this month through months_ahead months from now);
+    # returns how many were created.  Splitting a catch-all detaches it
+    # (ACCESS EXCLUSIVE on the parent), so concurrent callers take turns
+    # on a transaction advisory lock and the later ones find nothing to do.
+    today = date.today()
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK,))
+    cursor.execute("SELECT farm_ensure_partitions(%s, %s) as created",
+                   (first or today, last or add_months(today, months_ahead)))
+    return cursor.fetchone()['created']
+
+
+def missing_partitions(cursor, month=None):
+    # Partitioned tables without a partition for month (default: next
+    # month); a catalog lookup, cheap enough for every startup
+    cursor.execute("""
+        SELECT c.relname FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relnamespace = current_schema()::regnamespace AND NOT c.relispartition
+          AND to_regclass(c.relname || '_' || to_char(%s::date, 'YYYY_MM')) IS NULL
+        ORDER BY c.relname
+    """, (month or add_months(date.today(), 1),))
+    return [row['relname'] for row in cursor.fetchall()]
+
+
+def partition_status(cursor):
+    # One row per partitioned table: monthly partition count and range,
+    # estimated rows in the catch-alls and total size
+    cursor.execute("""
+        SELECT p.relname as table_name,
+               COUNT(*) FILTER (WHERE c.relname ~ '_\\d{4}_\\d{2}$') as months,
+               MIN(substring(c.relname FROM '(\\d{4}_\\d{2})$')) as first_month,
+               MAX(substring(c.relname FROM '(\\d{4}_\\d{2})$')) as last_month,
+               COALESCE(SUM(GREATEST(c.reltuples, 0)) FILTER (WHERE c.relname = p.relname || '_history'), 0)::bigint
+                   as history_rows,
+               COALESCE(SUM(GREATEST(c.reltuples, 0)) FILTER (WHERE c.relname = p.relname || '_future'), 0)::bigint
+                   as future_rows,
+               pg_size_pretty(SUM(pg_total_relation_size(c.oid))) as size
+        FROM pg_partitioned_table pt
+        JOIN pg_class p ON p.oid = pt.partrelid
+        JOIN pg_inherits i ON i.inhparent = p.oid
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE p.relnamespace = current_schema()::regnamespace
+        GROUP BY p.relname
+        ORDER BY p.relname
+    """)
+    return cursor.fetchall()
+
+
+def _page_floor(cursor, table, column, before=None, rows=11):
+    # Key of the last row on a newest-first page of `rows` rows (starting at
+    # before), which is as far back as that page has to read; None when the
+    # table holds fewer rows
+    where = f"WHERE {column} <= %s" if before is not None else ""
+    cursor.execute(f"SELECT {column} as day FROM {table} {where} ORDER BY {column} DESC LIMIT 1 OFFSET %s",
+                   ((before,) if before is not None else ()) + (rows - 1,))
+    row = cursor.fetchone()
+    return row['day'] if row else None
+
+
+def pruning_checks(cursor, today=None):
+    # (name, table, sql, params, first, last) for the date-bounded queries
+    # the app runs; params follow the app's own filters.  first..last
+    # (inclusive, None for open) is the key range the query may read: its
+    # filter, narrowed for newest-first pages to the months down to the
+    # page's last row.
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    last_month = add_months(today, -1)
+    year_ago = today - timedelta(days=365)
+    cursor.execute(f"SELECT {CUTOFF_6_MONTHS} as cutoff")
+    six_months_ago = cursor.fetchone()['cutoff']
+    return [
+        ('reports: six-month sales trend', 'sales', MONTHLY_SALES_SQL, (), six_months_ago, None),
+        ('harvesting: first page', 'harvest', """
+            SELECT h.*, p.variety as plant_variety
+            FROM harvest h
+            LEFT JOIN tomato_plants p ON h.plant_id = p.id
+            ORDER BY h.harvest_date DESC, h.id DESC LIMIT 11
+        """, (), _page_floor(cursor, 'harvest', 'harvest_date'), None),
+        ('harvesting: page a year back', 'harvest', """
+            SELECT * FROM harvest
+            WHERE harvest_date <= %s AND (harvest_date, id) < (%s, %s)
+            ORDER BY harvest_date DESC, id DESC LIMIT 11
+        """, (year_ago, year_ago, 2 ** 31 - 1), _page_floor(cursor, 'harvest', 'harvest_date', year_ago), year_ago),
+        ('sales: last month filter', 'sales', """
+            SELECT * FROM sales
+            WHERE sale_date >= %s AND sale_date <= %s
+            ORDER BY sale_date DESC, id DESC LIMIT 11
+        """, (last_month, month_start - timedelta(days=1)), last_month, month_start - timedelta(days=1)),
+        ('operations: first page', 'operations', """
+            SELECT * FROM operations ORDER BY operation_date DESC, id DESC LIMIT 11
+        """, (), _page_floor(cursor, 'operations', 'operation_date'), None),
+        ('export: irrigation this month', 'irrigation', """
+            SELECT * FROM irrigation WHERE irrigation_date >= %s AND irrigation_date < %s::date + 1
+            ORDER BY irrigation_date, id
+        """, (month_start, today), month_start, today),
+        ('export: spraying this month', 'spraying', """
+            SELECT * FROM spraying WHERE spray_date >= %s AND spray_date < %s::date + 1
+            ORDER BY spray_date, id
+        """, (month_start, today), month_start, today),
+        ('export: weeding this month', 'weeding', """
+            SELECT * FROM weeding WHERE weeding_date >= %s AND weeding_date < %s::date + 1
+            ORDER BY weeding_date, id
+        """, (month_start, today), month_start, today),
+    ]
+
+
+_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def _bound_date(value):
+    return None if value in ('MINVALUE', 'MAXVALUE') else date.fromisoformat(value.strip("'")[:10])
+
+
+def _partition_ranges(cursor, table):
+    # {partition: (lower, upper)}, upper exclusive and None when unbounded
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) as bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    ranges = {}
+    for row in cursor.fetchall():
+        match = _BOUND.search(row['bound'] or '')
+        ranges[row['relname']] = (_bound_date(match.group(1)), _bound_date(match.group(2))) if match else (None, None)
+    return ranges
+
+
+def _in_range(bounds, first, last):
+    lower, upper = bounds
+    return (upper is None or first is None or upper > first) and (lower is None or last is None or lower <= last)
+
+
+def _partition_scans(node, partitions, scans):
+    # Adds up per partition in the plan how often it was scanned, and the
+    # partitions pruned while executing (Subplans Removed); a partition
+    # pruned at planning is not in the plan at all
+    scans['removed'] += node.get('Subplans Removed', 0)
+    if node.get('Relation Name') in partitions:
+        relation = node['Relation Name']
+        scans['loops'][relation] = scans['loops'].get(relation, 0) + node.get('Actual Loops', 0)
+    for child in node.get('Plans', []):
+        _partition_scans(child, partitions, scans)
+    return scans
+
+
+def check_pruning(cursor, checks=None):
+    # A check passes when every partition the query scanned (Actual Loops
+    # > 0, whether or not it found rows) lies in the check's key range.
+    # Empty months in range, like the ones created ahead of time, may be
+    # probed; a plan that probes months outside it does not prune.
+    results = []
+    for name, table, sql, params, first, last in checks or pruning_checks(cursor):
+        ranges = _partition_ranges(cursor, table)
+        expected = {partition for partition, bounds in ranges.items() if _in_range(bounds, first, last)}
+        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()['QUERY PLAN'][0]
+        scans = _partition_scans(plan['Plan'], ranges, {'loops': {}, 'removed': 0})
+        read = {partition for partition, loops in scans['loops'].items() if loops > 0}
+        results.append({
+            'name': name,
+            'table': table,
+            'partitions': len(ranges),
+            'read': sorted(read),
+            'expected': sorted(expected),
+            'outside': sorted(read - expected),
+            'planned': len(scans['loops']),
+            'removed_at_runtime': scans['removed'],
+            'ms': plan['Execution Time'] + plan['Planning Time'],
+            'ok': bool(ranges) and read <= expected
+        })
+    return results
@@ -0,0 +1,249 @@
+from forecast import forecaster
+
+# Report engine for the /reports page.
+#
+# Each table is scanned once: headline numbers come from FILTER aggregates
+# and the per-group breakdowns ride along in the same statement through
+# GROUPING SETS, so a full report is one query per table (plus the
+# plants/harvest join for field performance).  Sales is the exception, see
+# sales_metrics() and monthly_sales().
+#
+# The sections do not depend on each other; report_executor.py runs them
+# in parallel on separate pooled connections and assemble_report() puts
+# together whatever finished.
+
+# A date, not a timestamp, so it can prune the monthly sales partitions
+CUTOFF_6_MONTHS = "(CURRENT_DATE - INTERVAL '6 months')::date"
+
+MONTHLY_SALES_SQL = f"""
+    SELECT TO_CHAR(sale_date, 'YYYY-MM') as month,
+           SUM(total_amount) as total_sales,
+           SUM(quantity) as total_quantity
+    FROM sales
+    WHERE sale_date >= {CUTOFF_6_MONTHS}
+    GROUP BY TO_CHAR(sale_date, 'YYYY-MM')
+    ORDER BY month DESC
+"""
+
+# Weeks of the yield forecast shown on the page
+FORECAST_WEEKS = 8
+
+# Every table the report reads, for cache invalidation
+REPORT_TABLES = ('tomato_plants', 'harvest', 'sales', 'operations', 'employee_tasks', 'inventory')
+
+
+def empty_report():
+    return {
+        'production': {
+            'total_plants': 0,
+            'active_plants': 0,
+            'total_harvest': 0,
+            'avg_harvest_per_plant': 0
+        },
+        'financial': {
+            'total_sales': 0,
+            'total_operations_cost': 0,
+            'net_income': 0,
+            'pending_payments': 0
+        },
+        'quality_distribution': [],
+        'operations_summary': [],
+        'field_performance': [],
+        'employee_summary': [],
+        'monthly_sales': [],
+        'inventory': {'total_items': 0, 'low_stock': 0},
+        'low_stock_items': [],
+        'forecast': None,
+        'section_errors': {}
+    }
+
+
+def plant_metrics(cursor):
+    cursor.execute("""
+        SELECT COUNT(*) as total_plants,
+               COUNT(*) FILTER (WHERE status = 'Growing') as active_plants
+        FROM tomato_plants
+    """)
+    result = cursor.fetchone()
+    return {
+        'total_plants': result['total_plants'],
+        'active_plants': result['active_plants']
+    }
+
+
+def harvest_metrics(cursor):
+    # The grade percentages divide by the window total over the grouped
+    # rows, which replaces the correlated re-scan of harvest.
+    cursor.execute("""
+        SELECT quality_grade,
+               SUM(quantity) as total_quantity,
+               (SUM(quantity) * 100.0 / NULLIF(SUM(SUM(quantity)) OVER (), 0)) as percentage
+        FROM harvest
+        WHERE unit = 'kg'
+        GROUP BY quality_grade
+        ORDER BY total_quantity DESC
+    """)
+    quality_distribution = cursor.fetchall()
+    total_harvest = sum(row['total_quantity'] for row in quality_distribution)
+    return {
+        'total_harvest': float(total_harvest),
+        'quality_distribution': quality_distribution
+    }
+
+
+def sales_metrics(cursor):
+    # The all-time total is the trigger-maintained farm_stats counter and
+    # pending payments come from the partial Pending index, so neither
+    # grows with years of history.
+    cursor.execute("""
+        SELECT (SELECT total_sales FROM farm_stats WHERE id = 1) as all_time_sales,
+               (SELECT COALESCE(SUM(total_amount), 0) FROM sales
+                WHERE payment_status = 'Pending') as pending_payments
+    """)
+    totals = cursor.fetchone()
+    return {
+        'total_sales': float(totals['all_time_sales'] or 0),
+        'pending_payments': float(totals['pending_payments'])
+    }
+
+
+def monthly_sales(cursor):
+    # sales is partitioned by month: only the six-month window is read
+    cursor.execute(MONTHLY_SALES_SQL)
+    return cursor.fetchall()
+
+
+def operations_metrics(cursor):
+    cursor.execute("""
+        SELECT operation_type,
+               COUNT(*) as count,
+               COALESCE(SUM(cost), 0) as total_cost,
+               GROUPING(operation_type) as is_total
+        FROM operations
+        GROUP BY GROUPING SETS ((operation_type), ())
+        ORDER BY is_total DESC, count DESC
+    """)
+    rows = cursor.fetchall()
+    totals = rows[0]
+    operations_summary = [
+        {'operation_type': row['operation_type'], 'count': row['count'], 'total_cost': row['total_cost']}
+        for row in rows[1:]
+    ]
+    return {
+        'total_operations_cost': float(totals['total_cost']),
+        'operations_summary': operations_summary
+    }
+
+
+def field_performance(cursor):
+    cursor.execute("""
+        SELECT p.field_location,
+               COUNT(p.id) as plant_count,
+               COALESCE(SUM(h.quantity), 0) as total_harvest
+        FROM tomato_plants p
+        LEFT JOIN harvest h ON p.id = h.plant_id AND h.unit = 'kg'
+        WHERE p.field_location IS NOT NULL AND p.field_location != ''
+        GROUP BY p.field_location
+        ORDER BY total_harvest DESC
+    """)
+    return cursor.fetchall()
+
+
+def employee_summary(cursor):
+    cursor.execute("""
+        SELECT employee_number,
+               COUNT(*) as total_tasks,
+               COUNT(*) FILTER (WHERE status = 'Completed') as completed,
+               COUNT(*) FILTER (WHERE status = 'In Progress') as in_progress,
+               COUNT(*) FILTER (WHERE status = 'Pending') as pending
+        FROM employee_tasks
+        GROUP BY employee_number
+        ORDER BY employee_number
+    """)
+    return cursor.fetchall()
+
+
+def inventory_metrics(cursor):
+    # One row per low-stock item plus the () grand-total row.
+    cursor.execute("""
+        SELECT item_name, quantity, unit, min_quantity,
+               COUNT(*) as total_items,
+               COUNT(*) FILTER (WHERE quantity <= min_quantity) as low_stock,
+               GROUPING(id) as is_total
+        FROM inventory
+        GROUP BY GROUPING SETS ((id, item_name, quantity, unit, min_quantity), ())
+        HAVING GROUPING(id) = 1 OR bool_and(quantity <= min_quantity)
+        ORDER BY is_total DESC, (quantity - min_quantity)
+    """)
+    rows = cursor.fetchall()
+    totals = rows[0]
+    low_stock_items = [
+        {'item_name': row['item_name'], 'quantity': row['quantity'],
+         'unit': row['unit'], 'min_quantity': row['min_quantity']}
+        for row in rows[1:]
+    ]
+    return {
+        'inventory': {'total_items': totals['total_items'], 'low_stock': totals['low_stock']},
+        'low_stock_items': low_stock_items
+    }
+
+
+def yield_forecast(cursor):
+    # Fitted curves are kept by forecast.py and topped up with new harvests
+    return forecaster.forecast(cursor, FORECAST_WEEKS)
+
+
+# Sections in page order; each one is a function of a dict cursor and can
+# run on its own connection (see report_executor.py)
+REPORT_SECTIONS = (
+    ('plants', plant_metrics),
+    ('harvest', harvest_metrics),
+    ('sales', sales_metrics),
+    ('operations', operations_metrics),
+    ('fields', field_performance),
+    ('employees', employee_summary),
+    ('monthly_sales', monthly_sales),
+    ('inventory', inventory_metrics),
+    ('forecast', yield_forecast),
+)
+
+
+def assemble_report(results, errors=None):
+    # results maps section name to its function's return value; a missing
+    # section (failed or timed out) leaves its part of the report empty.
+    # errors maps section name to a message for the page.
+    report = empty_report()
+    report['section_errors'] = dict(errors or {})
+
+    production = report['production']
+    if 'plants' in results:
+        production['total_plants'] = results['plants']['total_plants']
+        production['active_plants'] = results['plants']['active_plants']
+    if 'harvest' in results:
+        production['total_harvest'] = results['harvest']['total_harvest']
+        report['quality_distribution'] = results['harvest']['quality_distribution']
+    if production['total_plants'] > 0:
+        production['avg_harvest_per_plant'] = production['total_harvest'] / production['total_plants']
+
+    financial = report['financial']
+    if 'sales' in results:
+        financial['total_sales'] = results['sales']['total_sales']
+        financial['pending_payments'] = results['sales']['pending_payments']
+    if 'operations' in results:
+        financial['total_operations_cost'] = results['operations']['total_operations_cost']
+        report['operations_summary'] = results['operations']['operations_summary']
+    financial['net_income'] = financial['total_sales'] - financial['total_operations_cost']
+
+    report['field_performance'] = results.get('fields', [])
+    report['employee_summary'] = results.get('employees', [])
+    report['monthly_sales'] = results.get('monthly_sales', [])
+    if 'inventory' in results:
+        report['inventory'] = results['inventory']['inventory']
+        report['low_stock_items'] = results['inventory']['low_stock_items']
+    report['forecast'] = results.get('forecast')
+    return report
+
+
+def build_report(cursor):
+    # All sections one after another on one cursor
+    return assemble_report({name: section(cursor) for name, section in REPORT_SECTIONS})
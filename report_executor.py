@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from psycopg2 import errors
+
+from db import PoolError, db
+from metrics import begin_request, current_route, detach_request, merge_request_stats
+
+# Runs independent report sections in parallel.
+#
+# Each section gets its own pooled connection and transaction on one of
+# max_workers threads, so a report takes about as long as its slowest
+# section instead of the sum of all of them.  Sections are bounded twice:
+# statement_timeout cancels a slow statement on the server (which also
+# frees its connection), and run() stops waiting after timeout seconds.
+# A section that fails or times out is returned in errors and the others
+# are kept; a late section finishes in the background and is discarded.
+#
+# Sections run in separate transactions, so their numbers can straddle a
+# concurrent write; the report is a dashboard, not a ledger.
+
+
+class ReportExecutor:
+    def __init__(self, max_workers=4, timeout=10.0, log=print):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.log = log
+        self._lock = threading.Lock()
+        self._threads = None
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def _executor(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report')
+            return self._threads
+
+    def _query(self, section):
+        with db() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                           (str(int(self.timeout * 1000)),))
+            return section(cursor)
+
+    def _run_section(self, section, route):
+        # (result, error, stats) on a worker thread; stats are the
+        # section's query counters for the request that asked for it
+        begin_request(route)
+        try:
+            return self._query(section), None, detach_request()
+        except Exception as e:
+            return None, e, detach_request()
+
+    def run(self, sections):
+        # sections: (name, function of a dict cursor) pairs.  Returns
+        # ({name: result}, {name: message}) with every name in one of them.
+        if self.max_workers <= 1:
+            return self._run_serial(sections)
+        route = current_route()
+        executor = self._executor()
+        futures = {executor.submit(self._run_section, section, route): name for name, section in sections}
+        done, _ = wait(futures, timeout=self.timeout)
+
+        results = {}
+        section_errors = {}
+        for future, name in futures.items():
+            if future not in done:
+                future.cancel()
+                section_errors[name] = self._failed(name, None)
+                continue
+            result, error, stats = future.result()
+            merge_request_stats(stats)
+            if error is None:
+                results[name] = result
+            else:
+                section_errors[name] = self._failed(name, error)
+        with self._lock:
+            self.runs += 1
+        return results, section_errors
+
+    def _run_serial(self, sections):
+        # REPORT_WORKERS=1: same timeouts and error handling on the
+        # request's own thread
+        results = {}
+        section_errors = {}
+        for name, section in sections:
+            try:
+                results[name] = self._query(section)
+            except Exception as e:
+                section_errors[name] = self._failed(name, e)
+        with self._lock:
+            self.runs += 1
+        return results, section_errors
+
+    def _failed(self, name, error):
+        # Logs the failure and returns the message shown on the page
+        timed_out = error is None or isinstance(error, errors.QueryCanceled)
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.failures += 1
+        if timed_out:
+            self.log(f"Report section {name} timed out after {self.timeout:g}s")
+            return 'timed out'
+        self.log(f"Report section {name} failed: {type(error).__name__}: {str(error).strip()}")
+        if isinstance(error, PoolError):
+            return 'could not be loaded (no database connection)'
+        return 'could not be loaded'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'timeout_seconds': self.timeout,
+                'runs': self.runs,
+                'failures': self.failures,
+                'timeouts': self.timeouts
+            }
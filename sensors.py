@@ -0,0 +1,279 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+from psycopg2 import extras
+
+from db import db
+
+# Irrigation controller and soil sensor readings (migration 0008).
+#
+# ingest() takes a batch of readings, registers sensors it has not seen
+# (a reading names its sensor, and the sensor's field and metric the first
+# time), and appends the batch to sensor_readings with one COPY.
+#
+# rollup() folds new readings into the 5-minute, hourly and daily rollups
+# per field and metric.  Ingestion records the earliest reading time of
+# each batch in sensor_rollup_state.dirty_from; rollup() clears it in a
+# short transaction of its own, then recomputes each level from the bucket
+# holding that time onward (5m from the raw readings, 1h from 5m, 1d from
+# 1h) in a second one.  A batch committed after the clear marks the state
+# dirty again, so late readings are picked up by the next run.  Rollups
+# group by the sensor's current field and metric, as registered.
+#
+# series() serves a field's metric over a time range from the finest
+# source that fits the range in max_points points: raw readings for short
+# ranges, then 5m, 1h and 1d buckets.  A coarser level is only used when
+# every finer one would return more points; 1d is the last resort.
+
+ROLLUP_LEVELS = (
+    ('5m', 'sensor_rollup_5m', 300),
+    ('1h', 'sensor_rollup_1h', 3600),
+    ('1d', 'sensor_rollup_1d', 86400),
+)
+RESOLUTIONS = ('raw',) + tuple(level for level, _, _ in ROLLUP_LEVELS)
+MAX_READINGS = 10000
+MAX_POINTS = 1000
+MAX_CLOCK_SKEW = timedelta(hours=1)
+ROLLUP_LOCK = 80080
+
+
+def parse_time(value):
+    # ISO 8601 text or epoch seconds; naive times are UTC
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str) and value.replace('.', '', 1).isdigit():
+        value = float(value)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    at = datetime.fromisoformat(value)
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+def _parse_readings(records):
+    # ([(sensor, field_location, metric, at, value, index)], errors by index)
+    readings = []
+    errors = []
+    latest = datetime.now(timezone.utc) + MAX_CLOCK_SKEW
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'error': 'must be a JSON object'})
+            continue
+        sensor = record.get('sensor')
+        if not isinstance(sensor, str) or not sensor or len(sensor) > 100:
+            errors.append({'index': index, 'error': 'sensor: must be 1-100 characters'})
+            continue
+        field_location = record.get('field_location')
+        if field_location is not None and (not isinstance(field_location, str) or not field_location
+                                           or len(field_location) > 100):
+            errors.append({'index': index, 'error': 'field_location: must be 1-100 characters'})
+            continue
+        metric = record.get('metric')
+        if metric is not None and (not isinstance(metric, str) or not metric or len(metric) > 50):
+            errors.append({'index': index, 'error': 'metric: must be 1-50 characters'})
+            continue
+        try:
+            at = parse_time(record.get('at'))
+        except (TypeError, ValueError, OverflowError, OSError):
+            errors.append({'index': index, 'error': 'at: must be an ISO 8601 time or epoch seconds'})
+            continue
+        if at > latest:
+            errors.append({'index': index, 'error': 'at: is in the future'})
+            continue
+        value = record.get('value')
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value \
+                or abs(value) > 3.4e38:
+            errors.append({'index': index, 'error': 'value: must be a number'})
+            continue
+        readings.append((sensor, field_location, metric, at, float(value), index))
+    return readings, errors
+
+
+def _sensor_ids(cursor, readings):
+    # {sensor_key: id}, registering new sensors that name their field and
+    # metric; errors for readings of unknown sensors that do not
+    cursor.execute("SELECT sensor_key, id FROM sensors WHERE sensor_key = ANY(%s)",
+                   (list({reading[0] for reading in readings}),))
+    ids = dict(cursor.fetchall())
+    new = {}
+    errors = []
+    for sensor, field_location, metric, _, _, index in readings:
+        if sensor in ids or sensor in new:
+            continue
+        if field_location is None or metric is None:
+            errors.append({'index': index, 'error': f"sensor: '{sensor}' is not registered; "
+                                                    f"send its field_location and metric"})
+            continue
+        new[sensor] = (sensor, field_location, metric)
+    if errors or not new:
+        return ids, 0, errors
+    # ON CONFLICT: a concurrent batch may register the same sensor first
+    extras.execute_values(cursor, """
+        INSERT INTO sensors (sensor_key, field_location, metric) VALUES %s
+        ON CONFLICT (sensor_key) DO NOTHING
+    """, list(new.values()))
+    cursor.execute("SELECT sensor_key, id FROM sensors WHERE sensor_key = ANY(%s)", (list(new),))
+    ids.update(cursor.fetchall())
+    return ids, len(new), []
+
+
+def ingest(cursor, records):
+    # cursor: a plain cursor in the caller's transaction.  Returns
+    # {'accepted', 'registered', 'errors'}; nothing is written when errors
+    # is not empty.
+    result = {'accepted': 0, 'registered': 0, 'errors': []}
+    readings, errors = _parse_readings(records)
+    if not errors and readings:
+        ids, result['registered'], errors = _sensor_ids(cursor, readings)
+    if errors:
+        result['errors'] = errors
+        return result
+    if not readings:
+        return result
+
+    buffer = io.StringIO()
+    for sensor, _, _, at, value, _ in readings:
+        buffer.write(f"{at.isoformat()}\t{ids[sensor]}\t{value!r}\n")
+    buffer.seek(0)
+    cursor.copy_expert("COPY sensor_readings (reading_at, sensor_id, value) FROM STDIN", buffer)
+    earliest = min(reading[3] for reading in readings)
+    # Only writes when this batch reaches further back than what is pending
+    cursor.execute("""
+        UPDATE sensor_rollup_state SET dirty_from = %s
+        WHERE id = 1 AND (dirty_from IS NULL OR dirty_from > %s)
+    """, (earliest, earliest))
+    result['accepted'] = len(readings)
+    return result
+
+
+ROLLUP_SQL = {
+    # value is REAL; summing it as such would add in float4 and carry the
+    # rounding into every level above
+    '5m': """
+        SELECT s.field_location, s.metric,
+               date_bin('5 minutes', r.reading_at, TIMESTAMPTZ '2000-01-01 00:00:00+00') as bucket,
+               COUNT(*), SUM(r.value::float8), MIN(r.value), MAX(r.value)
+        FROM sensor_readings r
+        JOIN sensors s ON s.id = r.sensor_id
+        WHERE r.reading_at >= %(start)s
+        GROUP BY 1, 2, 3
+    """,
+    '1h': """
+        SELECT field_location, metric, date_trunc('hour', bucket, 'UTC'),
+               SUM(readings), SUM(total), MIN(min_value), MAX(max_value)
+        FROM sensor_rollup_5m
+        WHERE bucket >= %(start)s
+        GROUP BY 1, 2, 3
+    """,
+    '1d': """
+        SELECT field_location, metric, date_trunc('day', bucket, 'UTC'),
+               SUM(readings), SUM(total), MIN(min_value), MAX(max_value)
+        FROM sensor_rollup_1h
+        WHERE bucket >= %(start)s
+        GROUP BY 1, 2, 3
+    """,
+}
+
+
+def _bucket_start(moment, seconds):
+    # Start of the UTC bucket of the given size holding moment
+    epoch = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    return epoch + timedelta(seconds=(moment - epoch).total_seconds() // seconds * seconds)
+
+
+def roll_up_from(cursor, dirty_from):
+    # Rebuilds every level from the bucket holding dirty_from onward, in
+    # the caller's transaction; returns {level: buckets written}
+    written = {}
+    # Concurrent runs take turns instead of upserting the same buckets
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ROLLUP_LOCK,))
+    for level, table, seconds in ROLLUP_LEVELS:
+        cursor.execute(f"""
+            INSERT INTO {table} (field_location, metric, bucket, readings, total, min_value, max_value)
+            {ROLLUP_SQL[level]}
+            ON CONFLICT (field_location, metric, bucket) DO UPDATE
+            SET readings = EXCLUDED.readings, total = EXCLUDED.total,
+                min_value = EXCLUDED.min_value, max_value = EXCLUDED.max_value
+        """, {'start': _bucket_start(dirty_from, seconds)})
+        written[level] = cursor.rowcount
+    cursor.execute("UPDATE sensor_rollup_state SET rolled_up_at = CURRENT_TIMESTAMP WHERE id = 1")
+    return written
+
+
+def rollup():
+    # Rolls up everything pending; returns {level: buckets written} or
+    # None when nothing was pending
+    with db() as cursor:
+        cursor.execute("SELECT dirty_from FROM sensor_rollup_state WHERE id = 1 FOR UPDATE")
+        dirty_from = cursor.fetchone()['dirty_from']
+        cursor.execute("UPDATE sensor_rollup_state SET dirty_from = NULL WHERE id = 1")
+    if dirty_from is None:
+        return None
+
+    try:
+        with db() as cursor:
+            return roll_up_from(cursor, dirty_from)
+    except Exception:
+        # Put the pending range back for the next run
+        with db() as cursor:
+            cursor.execute("""
+                UPDATE sensor_rollup_state SET dirty_from = LEAST(COALESCE(dirty_from, %s), %s) WHERE id = 1
+            """, (dirty_from, dirty_from))
+        raise
+
+
+def choose_resolution(start, end, sensors, max_points=MAX_POINTS):
+    # The finest source that fits the range in max_points points (raw
+    # readings count about one per second per sensor), else the coarsest
+    span = (end - start).total_seconds()
+    if span * max(sensors, 1) <= max_points:
+        return 'raw'
+    for level, _, seconds in ROLLUP_LEVELS:
+        if span / seconds <= max_points:
+            return level
+    return ROLLUP_LEVELS[-1][0]
+
+
+def series(cursor, field_location, metric, start, end, resolution=None, max_points=MAX_POINTS):
+    # Readings or buckets of one field's metric in [start, end)
+    cursor.execute("SELECT id, sensor_key FROM sensors WHERE field_location = %s AND metric = %s",
+                   (field_location, metric))
+    sensors = {row['id']: row['sensor_key'] for row in cursor.fetchall()}
+    resolution = resolution or choose_resolution(start, end, len(sensors), max_points)
+    cursor.execute("SELECT dirty_from, rolled_up_at FROM sensor_rollup_state WHERE id = 1")
+    state = cursor.fetchone() or {'dirty_from': None, 'rolled_up_at': None}
+    result = {
+        'field_location': field_location,
+        'metric': metric,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+        'sensors': sorted(sensors.values()),
+        'rolled_up_at': state['rolled_up_at'] and state['rolled_up_at'].isoformat(),
+        # Rollup buckets from here on can be missing readings until the next run
+        'pending_from': state['dirty_from'] and state['dirty_from'].isoformat(),
+        'points': []
+    }
+    if resolution == 'raw':
+        if sensors:
+            cursor.execute("""
+                SELECT reading_at, sensor_id, value FROM sensor_readings
+                WHERE reading_at >= %s AND reading_at < %s AND sensor_id = ANY(%s)
+                ORDER BY reading_at, sensor_id
+                LIMIT %s
+            """, (start, end, list(sensors), max_points + 1))
+            rows = cursor.fetchall()
+            result['truncated'] = len(rows) > max_points
+            result['points'] = [{'at': row['reading_at'].isoformat(), 'sensor': sensors[row['sensor_id']],
+                                 'value': row['value']} for row in rows[:max_points]]
+        return result
+
+    table = dict((level, table) for level, table, _ in ROLLUP_LEVELS)[resolution]
+    seconds = dict((level, seconds) for level, _, seconds in ROLLUP_LEVELS)[resolution]
+    cursor.execute(f"""
+        SELECT bucket, readings, total / readings as avg, min_value, max_value FROM {table}
+        WHERE field_location = %s AND metric = %s AND bucket >= %s AND bucket < %s
+        ORDER BY bucket
+    """, (field_location, metric, _bucket_start(start, seconds), end))
+    result['points'] = [{'bucket': row['bucket'].isoformat(), 'readings': row['readings'], 'avg': row['avg'],
+                         'min': row['min_value'], 'max': row['max_value']} for row in cursor.fetchall()]
+    return result
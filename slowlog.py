@@ -0,0 +1,277 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import psycopg2
+
+# Slow-query log.
+#
+# The instrumented cursors in metrics.py hand every statement slower than
+# SLOW_QUERY_MS (and every failed one) to SlowQueryLog.observe(), which only
+# queues it.  A single worker thread writes the JSON-lines log and, for
+# SELECTs, captures EXPLAIN (ANALYZE, BUFFERS) on its own connection inside
+# a read-only transaction.  Plan captures are rate-limited with a token
+# bucket and at most one plan per query fingerprint per PLAN_COOLDOWN.
+#
+# Log records:
+#   {"ts", "kind": "slow"|"error", "route", "ms", "fingerprint", "sql",
+#    "params", "error", "plan"}
+#
+# Parameters are logged as bound only for reads of non-sensitive tables.
+# Writes, and any statement that names a table in SENSITIVE_TABLES (users:
+# emails and password hashes), log each parameter as "?" instead, only the
+# first line of their error (the DETAIL line repeats key values), and no
+# plan, since EXPLAIN output carries the bound values.
+
+QUEUE_SIZE = 1000
+PLAN_COOLDOWN = 300
+MAX_PARAM_LENGTH = 200
+MAX_PARAMS = 50
+SENSITIVE_TABLES = ('users',)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SPACE = re.compile(r"\s+")
+_SENSITIVE = re.compile(r"\b(?:%s)\b" % '|'.join(SENSITIVE_TABLES), re.I)
+
+
+def normalize_sql(sql):
+    # Literals and placeholders become ?, IN lists collapse, whitespace folds
+    sql = _COMMENT.sub(' ', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(?+)', sql)
+    return _SPACE.sub(' ', sql).strip().lower()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize_sql(sql).encode('utf-8')).hexdigest()[:12]
+
+
+def _jsonable_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        items = list(params.items())[:MAX_PARAMS]
+        return {key: _jsonable_value(value) for key, value in items}
+    return [_jsonable_value(value) for value in list(params)[:MAX_PARAMS]]
+
+
+def _redacted_params(params):
+    # Same shape as the parameters, every value replaced by ?
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: '?' for key in list(params)[:MAX_PARAMS]}
+    return ['?' for _ in list(params)[:MAX_PARAMS]]
+
+
+def _statement_head(sql):
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+
+
+def loggable_params(sql):
+    # Whether a statement's bound values may go to the log (see above)
+    return _statement_head(sql) in ('SELECT', 'WITH') and not _SENSITIVE.search(sql)
+
+
+def _jsonable_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_jsonable_value(item) for item in value[:MAX_PARAMS]]
+    text = str(value)
+    return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + '...'
+
+
+class SlowQueryLog:
+    def __init__(self, path, threshold_ms=500, dsn=None, plans_per_minute=6,
+                 explain_timeout_ms=30000, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.threshold = threshold_ms / 1000.0
+        self.dsn = dsn
+        self.plans_per_minute = plans_per_minute
+        self.explain_timeout_ms = explain_timeout_ms
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.logged = 0
+        self.plans = 0
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._logger = None
+        self._connection = None
+        self._tokens = float(plans_per_minute)
+        self._refilled = time.monotonic()
+        self._planned = {}      # fingerprint -> monotonic time of last plan
+
+    # -- request side: must stay cheap -------------------------------------
+
+    def observe(self, kind, sql, params, elapsed, route, error=None):
+        if self._worker is None:
+            self._start()
+        try:
+            self._queue.put_nowait((time.time(), kind, sql, params, elapsed, route, error))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._start_lock:
+            if self._worker is None:
+                worker = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+                worker.start()
+                self._worker = worker
+
+    # -- worker side ---------------------------------------------------------
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+            except Exception as e:
+                logging.getLogger(__name__).warning("Slow-query log error: %s", e)
+
+    def _get_logger(self):
+        if self._logger is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            logger = logging.getLogger('farm.slow_queries')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                          backupCount=self.backup_count, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def _write(self, ts, kind, sql, params, elapsed, route, error):
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        elif not isinstance(sql, str):
+            sql = str(sql)
+        key = fingerprint(sql)
+        loggable = loggable_params(sql)
+        if error and not loggable:
+            # The DETAIL line of a constraint error repeats the values
+            error = error.strip().splitlines()[0]
+        record = {
+            'ts': datetime.fromtimestamp(ts).isoformat(timespec='milliseconds'),
+            'kind': kind,
+            'route': route,
+            'ms': round(elapsed * 1000, 2),
+            'fingerprint': key,
+            'sql': sql.strip(),
+            'params': _jsonable_params(params) if loggable else _redacted_params(params),
+            'error': error,
+            'plan': None
+        }
+        if kind == 'slow' and loggable and self._take_plan_token(key):
+            record['plan'] = self._explain(sql, params)
+        self._get_logger().info(json.dumps(record, default=str))
+        self.logged += 1
+
+    def _take_plan_token(self, key):
+        if not self.dsn or self.plans_per_minute <= 0:
+            return False
+        now = time.monotonic()
+        last = self._planned.get(key)
+        if last is not None and now - last < PLAN_COOLDOWN:
+            return False
+        self._tokens = min(float(self.plans_per_minute),
+                           self._tokens + (now - self._refilled) * self.plans_per_minute / 60.0)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        self._planned[key] = now
+        return True
+
+    def _explain(self, sql, params):
+        # ANALYZE re-runs the statement, so only SELECT/WITH and only in a
+        # read-only transaction (which also rejects data-modifying CTEs)
+        if _statement_head(sql) not in ('SELECT', 'WITH'):
+            return None
+        try:
+            if self._connection is None or self._connection.closed:
+                self._connection = psycopg2.connect(self.dsn)
+            cursor = self._connection.cursor()
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(self.explain_timeout_ms),))
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+            cursor.close()
+            self.plans += 1
+            return plan
+        except Exception as e:
+            return {'error': str(e).strip()}
+        finally:
+            if self._connection is not None and not self._connection.closed:
+                try:
+                    self._connection.rollback()
+                except Exception:
+                    self._connection.close()
+
+    def stats(self):
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'logged': self.logged,
+            'plans': self.plans,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize()
+        }
+
+
+def read_log(path):
+    # Current file plus rotated backups, oldest first
+    paths = sorted(glob.glob(glob.escape(path) + '.*'), reverse=True) + [path]
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(records):
+    groups = {}
+    for record in records:
+        group = groups.get(record['fingerprint'])
+        if group is None:
+            group = groups[record['fingerprint']] = {
+                'fingerprint': record['fingerprint'],
+                'sql': normalize_sql(record['sql']),
+                'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'routes': set(), 'plans': 0, 'last_seen': None
+            }
+        group['count'] += 1
+        if record['kind'] == 'error':
+            group['errors'] += 1
+        group['total_ms'] += record['ms']
+        group['max_ms'] = max(group['max_ms'], record['ms'])
+        group['routes'].add(record['route'] or 'background')
+        if record.get('plan'):
+            group['plans'] += 1
+        group['last_seen'] = max(group['last_seen'] or record['ts'], record['ts'])
+    for group in groups.values():
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['routes'] = sorted(group['routes'])
+    return list(groups.values())
@@ -27,8 +27,173 @@ function calculateHarvestDate() {
     }
 }
 
+// Type-ahead plant lookup for the harvest form
+function initPlantSearch() {
+    const searchInput = document.getElementById('plant_search');
+    const resultsList = document.getElementById('plant_search_results');
+    const plantIdInput = document.getElementById('plant_id');
+
+    if (!searchInput || !resultsList || !plantIdInput) {
+        return;
+    }
+
+    let debounceTimer = null;
+    let lastQuery = null;
+
+    function selectMatchingOption() {
+        const match = Array.from(resultsList.options).find(option => option.value === searchInput.value);
+        plantIdInput.value = match ? match.dataset.id : '';
+    }
+
+    searchInput.addEventListener('input', function() {
+        selectMatchingOption();
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(() => {
+            const query = searchInput.value.trim();
+            if (query === lastQuery || plantIdInput.value) {
+                return;
+            }
+            lastQuery = query;
+            fetch('/plants/search?q=' + encodeURIComponent(query))
+                .then(response => response.json())
+                .then(plants => {
+                    resultsList.innerHTML = '';
+                    plants.forEach(plant => {
+                        const option = document.createElement('option');
+                        option.value = plant.label;
+                        option.dataset.id = plant.id;
+                        resultsList.appendChild(option);
+                    });
+                    selectMatchingOption();
+                })
+                .catch(error => console.log('Plant search failed:', error));
+        }, 200);
+    });
+}
+
+// Live updates pushed by the server (/events): dashboard counters and task
+// rows are patched in place; other changes to the tables listed in the
+// page's data-live attribute show a refresh notice
+const TASK_STATUS_STYLES = {
+    'Completed': 'background: #d1fae5; color: #065f46;',
+    'In Progress': 'background: #fef3c7; color: #92400e;',
+    'Pending': 'background: #fee2e2; color: #991b1b;'
+};
+
+function showStaleNotice() {
+    if (document.getElementById('live-stale-notice')) {
+        return;
+    }
+    const notice = document.createElement('div');
+    notice.id = 'live-stale-notice';
+    notice.className = 'alert alert-success';
+    notice.innerHTML = 'This page has changed since it was loaded. <a href="">Refresh</a>';
+    const wrapper = document.querySelector('.content-wrapper');
+    wrapper.parentNode.insertBefore(notice, wrapper);
+}
+
+function setTaskTime(cell, value) {
+    if (!cell) {
+        return;
+    }
+    cell.innerHTML = value ? '' : '<span style="color: #999;">-</span>';
+    if (value) {
+        cell.textContent = value;
+    }
+}
+
+function setTaskActions(cell, task) {
+    if (!cell) {
+        return;
+    }
+    if (task.status === 'Pending' || task.status === 'In Progress') {
+        const starting = task.status === 'Pending';
+        cell.innerHTML = `<form method="POST" action="/employee_tasks/${starting ? 'start' : 'finish'}/${task.id}" style="display: inline;">` +
+            `<button type="submit" class="btn" style="font-size: 11px; padding: 4px 8px; background: ${starting ? '#22c55e' : '#3b82f6'};">` +
+            `${starting ? 'Start' : 'Finish'}</button></form>`;
+    } else {
+        cell.innerHTML = '<span style="color: #999; font-size: 11px;">Done</span>';
+    }
+}
+
+function patchTasks(change) {
+    // Returns false when the change cannot be applied to the rows on the page
+    if (!change.tasks || change.op === 'insert') {
+        return false;
+    }
+    change.tasks.forEach(task => {
+        const row = document.querySelector(`tr[data-task-id="${task.id}"]`);
+        if (!row) {
+            return;
+        }
+        if (change.op === 'delete') {
+            row.remove();
+            return;
+        }
+        const badge = row.querySelector('[data-task-status]');
+        if (badge) {
+            badge.textContent = task.status;
+            badge.style.cssText = 'padding: 4px 8px; border-radius: 4px; font-size: 12px; font-weight: 600; ' +
+                (TASK_STATUS_STYLES[task.status] || TASK_STATUS_STYLES['Pending']);
+        }
+        const select = row.querySelector('[data-task-status-select]');
+        if (select) {
+            select.value = task.status;
+        }
+        setTaskTime(row.querySelector('[data-task-started]'), task.started);
+        setTaskTime(row.querySelector('[data-task-finished]'), task.finished);
+        setTaskActions(row.querySelector('[data-task-actions]'), task);
+    });
+    return true;
+}
+
+function initLiveUpdates() {
+    const live = document.querySelector('[data-live]');
+    if (!live || !window.EventSource) {
+        return;
+    }
+    const tables = live.dataset.live.split(' ');
+    const hasTaskRows = document.querySelector('tr[data-task-id]') !== null || live.dataset.live === 'employee_tasks';
+    const source = new EventSource('/events');
+
+    source.addEventListener('stats', function(event) {
+        const stats = JSON.parse(event.data).stats;
+        Object.keys(stats).forEach(key => {
+            const element = document.querySelector(`[data-stat="${key}"]`);
+            if (element) {
+                element.textContent = stats[key];
+            }
+        });
+    });
+    source.addEventListener('tasks', function(event) {
+        const change = JSON.parse(event.data);
+        if (hasTaskRows ? !patchTasks(change) : tables.includes('employee_tasks')) {
+            showStaleNotice();
+        }
+    });
+    source.addEventListener('change', function(event) {
+        if (tables.includes(JSON.parse(event.data).table)) {
+            showStaleNotice();
+        }
+    });
+    source.addEventListener('resync', showStaleNotice);
+    window.addEventListener('beforeunload', () => source.close());
+}
+
 // Initialize page
 document.addEventListener('DOMContentLoaded', function() {
+    initPlantSearch();
+    initLiveUpdates();
+
+    // Task board: a header checkbox selects that employee's tasks
+    document.querySelectorAll('[data-task-select-all]').forEach(toggle => {
+        toggle.addEventListener('change', function() {
+            this.closest('table').querySelectorAll('input[name="ids"]').forEach(box => {
+                box.checked = this.checked;
+            });
+        });
+    });
+
     const alerts = document.querySelectorAll('.alert');
     alerts.forEach(alert => {
         setTimeout(() => {
@@ -41,7 +206,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const today = new Date().toISOString().split('T')[0];
     const dateInputs = document.querySelectorAll('input[type="date"]');
     dateInputs.forEach(input => {
-        if (!input.value && input.id !== 'expected_harvest') {
+        // Filter inputs stay empty so an untouched filter means "any date"
+        if (!input.value && input.id !== 'expected_harvest' && !input.hasAttribute('data-keep-empty')) {
             input.value = today;
         }
     });
@@ -0,0 +1,157 @@
+from pagination import decode_cursor, encode_cursor
+
+# Delta-sync feed for offline clients (GET /sync?since=<cursor>).
+#
+# Changes are the rows of SYNC_TABLES ordered by (updated_at, table, id)
+# plus the delete tombstones, merged into one stream; migration 0006 adds
+# the updated_at columns, triggers and (updated_at, id) indexes.  Each
+# source is read with an index range scan from the cursor and a LIMIT, so
+# a sync costs about the number of changes it returns, not the table size.
+#
+# updated_at is a transaction's start time, so a transaction that is still
+# open can later commit rows stamped before changes a client has already
+# seen.  The feed therefore stops at a horizon: the start of the oldest
+# transaction open in this database.  The horizon is read in its own
+# statement before the changes, so anything that commits in between is in
+# the changes' snapshot.  A long-running transaction holds the feed back
+# until it ends.
+#
+# pg_stat_activity only shows the transactions of other roles to members
+# of pg_read_all_stats (and superusers).  Without it a writer connected as
+# another role is invisible, and the horizon would move past its
+# transaction for good.  changes_since() raises HorizonUnavailable instead
+# while such a session is connected, and horizon_problem() is the check
+# the app runs at startup.
+
+SYNC_TABLES = ('employee_tasks', 'harvest', 'inventory', 'irrigation', 'operations',
+               'sales', 'spraying', 'tomato_plants', 'weeding')
+TOMBSTONES = 'sync_tombstones'
+SYNC_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class HorizonUnavailable(Exception):
+    pass
+
+
+def horizon_problem(cursor):
+    # None when this role sees every session's transaction, else why not
+    cursor.execute("SELECT current_user as role, pg_has_role('pg_read_all_stats', 'USAGE') as sees_all")
+    row = cursor.fetchone()
+    if row['sees_all']:
+        return None
+    return (f"Role {row['role']} cannot see other roles' transactions, so /sync fails while another role is "
+            f"connected to this database. Run GRANT pg_read_all_stats TO {row['role']}, or connect every "
+            f"writer as {row['role']}.")
+
+
+def parse_since(token):
+    # None for a full sync, or (updated_at, source, id)
+    if not token:
+        return None
+    values = decode_cursor(token)
+    if (values is None or len(values) != 3 or not isinstance(values[0], str)
+            or values[1] not in SYNC_TABLES + (TOMBSTONES,) or not isinstance(values[2], int)):
+        raise InvalidCursor('Invalid sync cursor')
+    return values
+
+
+def _source_query(source, since, limit):
+    # Keys of one source after the cursor, in (updated_at, id) order.  The
+    # (updated_at, source, id) position is compared per source: sources
+    # named before the cursor's only resume after its timestamp, those
+    # named after it also at its timestamp.
+    if source == TOMBSTONES:
+        select = f"SELECT '{TOMBSTONES}' as source, deleted_at as updated_at, id, table_name, record_id FROM {TOMBSTONES}"
+        stamp = 'deleted_at'
+    else:
+        select = f"SELECT '{source}' as source, updated_at, id, '{source}' as table_name, id as record_id FROM {source}"
+        stamp = 'updated_at'
+    clauses = [f"{stamp} < %s"]
+    params = []
+    if since is not None:
+        since_at, since_source, since_id = since
+        if source < since_source:
+            clauses.append(f"{stamp} > %s")
+            params.append(since_at)
+        elif source == since_source:
+            clauses.append(f"({stamp}, id) > (%s, %s) AND {stamp} >= %s")
+            params += [since_at, since_id, since_at]
+        else:
+            clauses.append(f"{stamp} >= %s")
+            params.append(since_at)
+    sql = f"({select} WHERE {' AND '.join(clauses)} ORDER BY {stamp}, id LIMIT {int(limit)})"
+    return sql, params
+
+
+def _fetch_rows(cursor, keys):
+    # {(table, id): row as JSON} for the upserts of a batch, one statement
+    # for all tables.  A row deleted since the keys were read is missing;
+    # its tombstone follows in a later batch.
+    ids = {}
+    for key in keys:
+        if key['source'] != TOMBSTONES:
+            ids.setdefault(key['source'], []).append(key['id'])
+    if not ids:
+        return {}
+    parts = [f"SELECT '{table}' as source, id, row_to_json(t) as row FROM {table} t WHERE id = ANY(%s)"
+             for table in ids]
+    cursor.execute(' UNION ALL '.join(parts), list(ids.values()))
+    return {(row['source'], row['id']): row['row'] for row in cursor.fetchall()}
+
+
+def changes_since(cursor, since=None, limit=SYNC_LIMIT):
+    # since: parse_since() result.  Returns {'changes', 'next', 'more'};
+    # pass 'next' back as since to continue, also when changes is empty.
+    # Sessions this role may not inspect show every column but the role
+    # as NULL, backend_type included
+    cursor.execute("""
+        SELECT COALESCE(MIN(xact_start), CURRENT_TIMESTAMP) as horizon,
+               string_agg(DISTINCT usename, ', ') FILTER (WHERE backend_type IS NULL) as hidden_roles
+        FROM pg_stat_activity
+        WHERE datname = current_database() AND (xact_start IS NOT NULL OR backend_type IS NULL)
+    """)
+    row = cursor.fetchone()
+    if row['hidden_roles']:
+        raise HorizonUnavailable(f"Transactions of role(s) {row['hidden_roles']} are hidden from this role; "
+                                 f"grant it pg_read_all_stats")
+    horizon = row['horizon']
+
+    parts = []
+    params = []
+    for source in SYNC_TABLES + (TOMBSTONES,):
+        sql, source_params = _source_query(source, since, limit + 1)
+        parts.append(sql)
+        params += [horizon] + source_params
+    cursor.execute(f"""
+        SELECT * FROM ({' UNION ALL '.join(parts)}) changes
+        ORDER BY updated_at, source COLLATE "C", id
+        LIMIT {int(limit) + 1}
+    """, params)
+    keys = cursor.fetchall()
+    more = len(keys) > limit
+    keys = keys[:limit]
+    rows = _fetch_rows(cursor, keys)
+
+    changes = []
+    for key in keys:
+        if key['source'] == TOMBSTONES:
+            changes.append({'table': key['table_name'], 'id': key['record_id'], 'op': 'delete',
+                            'updated_at': key['updated_at'].isoformat()})
+        elif (key['source'], key['id']) in rows:
+            changes.append({'table': key['table_name'], 'id': key['record_id'], 'op': 'upsert',
+                            'updated_at': key['updated_at'].isoformat(),
+                            'row': rows[(key['source'], key['id'])]})
+
+    if keys:
+        last = keys[-1]
+        next_cursor = encode_cursor([last['updated_at'], last['source'], last['id']])
+    elif since is not None:
+        next_cursor = encode_cursor(since)
+    else:
+        next_cursor = None
+    return {'changes': changes, 'next': next_cursor, 'more': more}
@@ -0,0 +1,169 @@
+from datetime import date, timedelta
+
+# Date windows for the employee task board and its calendar API.
+#
+# Both only read the tasks of one window (today, this week or a custom
+# range of at most MAX_RANGE_DAYS), optionally for one employee.  The
+# window is a range scan on idx_employee_tasks_task_date_employee
+# (task_date DESC, employee_number, from migration 0003), which also
+# returns the board's order, so a page costs about the number of tasks in
+# its window however many years of tasks the table holds.
+
+TASK_WINDOWS = ('today', 'week', 'range')
+DEFAULT_WINDOW = 'week'
+MAX_RANGE_DAYS = 92
+EMPLOYEES = tuple(range(1, 11))
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def task_window(window, start=None, end=None, today=None):
+    # (first day, last day) of a window; weeks run Monday to Sunday
+    today = today or date.today()
+    if window == 'today':
+        return today, today
+    if window == 'range':
+        if start is None or end is None:
+            raise InvalidFilter('A custom range needs a start and an end date')
+        if end < start:
+            raise InvalidFilter('The end date is before the start date')
+        if (end - start).days >= MAX_RANGE_DAYS:
+            raise InvalidFilter(f'A custom range can span at most {MAX_RANGE_DAYS} days')
+        return start, end
+    if window != 'week':
+        raise InvalidFilter(f"Unknown window '{window}'")
+    monday = today - timedelta(days=today.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def parse_employee(value):
+    # Employee number from a query string value, None for all employees
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number not in EMPLOYEES:
+        raise InvalidFilter('Employee must be a number from 1 to 10')
+    return number
+
+
+def _window_clause(first, last, employee):
+    where = "task_date >= %s AND task_date <= %s"
+    params = [first, last]
+    if employee is not None:
+        where += " AND employee_number = %s"
+        params.append(employee)
+    return where, params
+
+
+def tasks_between(cursor, first, last, employee=None):
+    where, params = _window_clause(first, last, employee)
+    cursor.execute(f"""
+        SELECT * FROM employee_tasks
+        WHERE {where}
+        ORDER BY task_date DESC, employee_number ASC
+    """, params)
+    return cursor.fetchall()
+
+
+def task_calendar(cursor, first, last, employee=None):
+    # {'start', 'end', 'employees': {number: [task, ...]}}, each employee's
+    # tasks in day and scheduled-time order, serialized by the database
+    where, params = _window_clause(first, last, employee)
+    cursor.execute(f"""
+        SELECT employee_number,
+               json_agg(t ORDER BY t.task_date, t.start_time NULLS LAST, t.id) as tasks
+        FROM employee_tasks t
+        WHERE {where}
+        GROUP BY employee_number
+    """, params)
+    grouped = {row['employee_number']: row['tasks'] for row in cursor.fetchall()}
+    employees = EMPLOYEES if employee is None else (employee,)
+    return {
+        'start': first.isoformat(),
+        'end': last.isoformat(),
+        'employees': {str(number): grouped.get(number, []) for number in employees}
+    }
+
+
+# Task states move one step at a time: Pending -> In Progress -> Completed.
+# Each target state maps to the only state it can be reached from.
+TASK_TRANSITIONS = {'In Progress': 'Pending', 'Completed': 'In Progress'}
+MAX_TRANSITION_IDS = 500
+
+
+def parse_task_ids(values):
+    # Distinct task ids in request order from a list of ints or strings
+    ids = []
+    for value in values:
+        try:
+            task_id = int(value)
+        except (TypeError, ValueError):
+            raise InvalidFilter(f"Invalid task id '{value}'")
+        if task_id not in ids:
+            ids.append(task_id)
+    if not ids:
+        raise InvalidFilter('No tasks selected')
+    if len(ids) > MAX_TRANSITION_IDS:
+        raise InvalidFilter(f'At most {MAX_TRANSITION_IDS} tasks can change state at once')
+    return ids
+
+
+def transition_tasks(cursor, ids, status, stamps=None):
+    # Moves the tasks that are in the state before status to it, stamping
+    # actual_start_time/actual_finish_time, in one statement.  The WHERE
+    # clause is the state machine: a row in any other state (or one a
+    # concurrent transition got to first) is left alone and reported as
+    # skipped with its current status (None for a missing id).  stamps:
+    # optional epoch seconds per id for the stamp (queued writes), default
+    # the transaction's start.
+    if status not in TASK_TRANSITIONS:
+        raise InvalidFilter(f"Tasks cannot be moved to '{status}'")
+    cursor.execute("""
+        WITH requested AS (
+            SELECT * FROM unnest(%(ids)s::int[], %(stamps)s::float8[]) WITH ORDINALITY r(id, stamp, n)
+        ), moved AS (
+            UPDATE employee_tasks t
+            SET status = %(status)s,
+                actual_start_time = CASE WHEN %(status)s = 'In Progress'
+                                         THEN COALESCE(to_timestamp(r.stamp), CURRENT_TIMESTAMP)
+                                         ELSE t.actual_start_time END,
+                actual_finish_time = CASE WHEN %(status)s = 'Completed'
+                                          THEN COALESCE(to_timestamp(r.stamp), CURRENT_TIMESTAMP)
+                                          ELSE t.actual_finish_time END
+            FROM requested r
+            WHERE t.id = r.id AND t.status = %(source)s
+            RETURNING t.id, t.status, t.actual_start_time, t.actual_finish_time
+        )
+        SELECT r.id, m.id IS NOT NULL as moved, t.id IS NOT NULL as found, t.status as previous_status,
+               m.actual_start_time, m.actual_finish_time
+        FROM requested r
+        LEFT JOIN moved m ON m.id = r.id
+        LEFT JOIN employee_tasks t ON t.id = r.id
+        ORDER BY r.n
+    """, {'ids': ids, 'stamps': stamps or [None] * len(ids), 'status': status,
+          'source': TASK_TRANSITIONS[status]})
+
+    updated = []
+    skipped = []
+    for row in cursor.fetchall():
+        if row['moved']:
+            updated.append({
+                'id': row['id'],
+                'actual_start_time': row['actual_start_time'] and row['actual_start_time'].isoformat(),
+                'actual_finish_time': row['actual_finish_time'] and row['actual_finish_time'].isoformat()
+            })
+        elif not row['found']:
+            skipped.append({'id': row['id'], 'status': None, 'reason': 'not found'})
+        elif row['previous_status'] == TASK_TRANSITIONS[status]:
+            # Matched the statement's snapshot but was moved by another
+            # transaction before this one could lock it
+            skipped.append({'id': row['id'], 'status': None, 'reason': 'changed concurrently'})
+        else:
+            skipped.append({'id': row['id'], 'status': row['previous_status'],
+                            'reason': f"is {row['previous_status']}, not {TASK_TRANSITIONS[status]}"})
+    return {'status': status, 'updated': updated, 'skipped': skipped}
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+from psycopg2 import extras
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+
+# Database-backed tests run against DATABASE_URL and are skipped without
+# it.  Pending migrations are applied once per session; each test then
+# works inside one transaction that is rolled back at the end, so tests
+# may truncate and reseed the farm tables freely.  Point DATABASE_URL at a
+# scratch database all the same: TRUNCATE locks the tables until rollback.
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+FARM_TABLES = ('tomato_plants', 'harvest', 'sales', 'operations', 'inventory', 'employee_tasks')
+
+
+@pytest.fixture(scope='session')
+def database():
+    if not DATABASE_URL:
+        pytest.skip('DATABASE_URL is not set')
+    connection = psycopg2.connect(DATABASE_URL)
+    try:
+        migrate(connection, log=lambda message: None)
+    finally:
+        connection.close()
+    return DATABASE_URL
+
+
+@pytest.fixture
+def cursor(database):
+    # A dict cursor in a transaction over empty farm tables (farm_stats
+    # rebuilt to match), rolled back after the test
+    connection = psycopg2.connect(database)
+    try:
+        cursor = connection.cursor(cursor_factory=extras.RealDictCursor)
+        cursor.execute(f"TRUNCATE {', '.join(FARM_TABLES)} CASCADE")
+        cursor.execute("""
+            UPDATE farm_stats SET total_plants = 0, total_harvest = 0, inventory_items = 0, total_sales = 0
+            WHERE id = 1
+        """)
+        yield cursor
+    finally:
+        connection.rollback()
+        connection.close()
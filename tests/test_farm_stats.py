@@ -0,0 +1,167 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from farm_stats import farm_stats_drift, read_farm_stats, reconcile_farm_stats
+
+# farm_stats against a seeded random workload on the four counted tables:
+# single-row and multi-row INSERT, UPDATE and DELETE (multi-row statements
+# go through the triggers' transition tables once per statement), with
+# unit and amount changes and updates that move harvest and sales rows to
+# another monthly partition.  The counters must match a recount after
+# every round.
+
+ROUNDS = 40
+UNITS = ('kg', 'kg', 'kg', 'lbs', 'tons')
+
+
+def random_day(rng):
+    return date.today() - timedelta(days=rng.randrange(0, 900))
+
+
+def random_amount(rng):
+    return None if rng.random() < 0.1 else round(rng.uniform(0, 5000), 2)
+
+
+def insert_plants(cursor, rng, count):
+    cursor.execute(
+        "INSERT INTO tomato_plants (variety, planting_date, field_location, quantity) "
+        "SELECT * FROM unnest(%s::text[], %s::date[], %s::text[], %s::int[])",
+        ([rng.choice(('Roma', 'Cherry', 'Beefsteak')) for _ in range(count)],
+         [random_day(rng) for _ in range(count)],
+         [rng.choice(('North', 'South', '', None)) for _ in range(count)],
+         [rng.randrange(1, 50) for _ in range(count)]))
+
+
+def insert_harvests(cursor, rng, count):
+    cursor.execute("SELECT id FROM tomato_plants")
+    plants = [row['id'] for row in cursor.fetchall()] + [None]
+    cursor.execute(
+        "INSERT INTO harvest (plant_id, harvest_date, quantity, unit, quality_grade) "
+        "SELECT * FROM unnest(%s::int[], %s::date[], %s::numeric[], %s::text[], %s::text[])",
+        ([rng.choice(plants) for _ in range(count)],
+         [random_day(rng) for _ in range(count)],
+         [round(rng.uniform(0.01, 900), 2) for _ in range(count)],
+         [rng.choice(UNITS) for _ in range(count)],
+         [rng.choice(('A', 'B', 'C', None)) for _ in range(count)]))
+
+
+def insert_sales(cursor, rng, count):
+    cursor.execute(
+        "INSERT INTO sales (sale_date, customer_name, quantity, total_amount, payment_status) "
+        "SELECT * FROM unnest(%s::date[], %s::text[], %s::numeric[], %s::numeric[], %s::text[])",
+        ([random_day(rng) for _ in range(count)],
+         [rng.choice(('Market', 'Cafe')) for _ in range(count)],
+         [round(rng.uniform(1, 500), 2) for _ in range(count)],
+         [random_amount(rng) for _ in range(count)],
+         [rng.choice(('Paid', 'Pending')) for _ in range(count)]))
+
+
+def insert_inventory(cursor, rng, count):
+    cursor.execute(
+        "INSERT INTO inventory (item_name, quantity, min_quantity) "
+        "SELECT * FROM unnest(%s::text[], %s::numeric[], %s::numeric[])",
+        ([rng.choice(('Seeds', 'Twine', 'Crates')) for _ in range(count)],
+         [round(rng.uniform(0, 300), 2) for _ in range(count)],
+         [round(rng.uniform(0, 50), 2) for _ in range(count)]))
+
+
+INSERTS = {
+    'tomato_plants': insert_plants,
+    'harvest': insert_harvests,
+    'sales': insert_sales,
+    'inventory': insert_inventory,
+}
+
+
+def random_ids(cursor, rng, table, count):
+    cursor.execute(f"SELECT id FROM {table}")
+    ids = [row['id'] for row in cursor.fetchall()]
+    return rng.sample(ids, min(count, len(ids)))
+
+
+def update_rows(cursor, rng, table, ids):
+    # Changes the counted columns (and partition keys) of the given rows
+    if table == 'harvest':
+        cursor.execute("""
+            UPDATE harvest SET quantity = round((quantity * %s)::numeric, 2),
+                               unit = CASE WHEN %s THEN %s ELSE unit END,
+                               harvest_date = harvest_date + %s
+            WHERE id = ANY(%s)
+        """, (rng.uniform(0.5, 2), rng.random() < 0.5, rng.choice(UNITS), rng.choice((0, 0, 45, -60)), ids))
+    elif table == 'sales':
+        cursor.execute("""
+            UPDATE sales SET total_amount = %s, sale_date = sale_date + %s
+            WHERE id = ANY(%s)
+        """, (random_amount(rng), rng.choice((0, 0, 31, -90)), ids))
+    elif table == 'tomato_plants':
+        cursor.execute("UPDATE tomato_plants SET status = %s, quantity = quantity + 1 WHERE id = ANY(%s)",
+                       (rng.choice(('Growing', 'Harvested')), ids))
+    else:
+        cursor.execute("UPDATE inventory SET quantity = quantity + 1 WHERE id = ANY(%s)", (ids,))
+
+
+def run_round(cursor, rng):
+    table = rng.choice(tuple(INSERTS))
+    operation = rng.choice(('insert', 'insert', 'update', 'delete'))
+    count = 1 if rng.random() < 0.5 else rng.randrange(2, 40)
+    if operation == 'insert':
+        INSERTS[table](cursor, rng, count)
+        return
+    ids = random_ids(cursor, rng, table, count)
+    if operation == 'update':
+        update_rows(cursor, rng, table, ids)
+    elif len(ids) == 1:
+        cursor.execute(f"DELETE FROM {table} WHERE id = %s", (ids[0],))
+    else:
+        cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s)", (ids,))
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_no_drift_under_random_workload(cursor, seed):
+    rng = random.Random(seed)
+    for table, insert in INSERTS.items():
+        insert(cursor, rng, 25)
+    assert farm_stats_drift(cursor) == {}
+    for round_number in range(ROUNDS):
+        run_round(cursor, rng)
+        assert farm_stats_drift(cursor) == {}, f'round {round_number}'
+
+
+def test_multi_row_statements_update_counters_once(cursor):
+    rng = random.Random(7)
+    insert_sales(cursor, rng, 30)
+    insert_harvests(cursor, rng, 30)
+    cursor.execute("UPDATE sales SET total_amount = COALESCE(total_amount, 0) + 1")
+    cursor.execute("UPDATE harvest SET unit = 'kg'")
+    cursor.execute("DELETE FROM harvest WHERE id IN (SELECT id FROM harvest ORDER BY id LIMIT 10)")
+    assert farm_stats_drift(cursor) == {}
+    stats = read_farm_stats(cursor)
+    cursor.execute("SELECT SUM(quantity) as kg FROM harvest")
+    assert stats['total_harvest'] == float(cursor.fetchone()['kg'])
+
+
+def test_reconcile_repairs_drift(cursor):
+    insert_plants(cursor, random.Random(3), 5)
+    cursor.execute("UPDATE farm_stats SET total_plants = total_plants + 100 WHERE id = 1")
+    assert farm_stats_drift(cursor) == {'total_plants': (105, 5)}
+    assert reconcile_farm_stats(cursor) == {'total_plants': (105, 5)}
+    assert farm_stats_drift(cursor) == {}
+
+
+def test_statements_matching_no_rows_leave_farm_stats_alone(cursor):
+    # Every UPDATE of the row leaves a new row version (new ctid), even
+    # within one transaction
+    insert_sales(cursor, random.Random(5), 3)
+    cursor.execute("SELECT ctid FROM farm_stats WHERE id = 1")
+    version = cursor.fetchone()['ctid']
+    cursor.execute("UPDATE sales SET total_amount = 1 WHERE id < 0")
+    cursor.execute("DELETE FROM harvest WHERE id < 0")
+    cursor.execute("UPDATE tomato_plants SET quantity = 1 WHERE id < 0")
+    cursor.execute("INSERT INTO inventory (item_name, quantity) SELECT 'None', 1 WHERE false")
+    cursor.execute("SELECT ctid FROM farm_stats WHERE id = 1")
+    assert cursor.fetchone()['ctid'] == version
+    cursor.execute("DELETE FROM sales WHERE id IN (SELECT id FROM sales LIMIT 1)")
+    cursor.execute("SELECT ctid FROM farm_stats WHERE id = 1")
+    assert cursor.fetchone()['ctid'] != version
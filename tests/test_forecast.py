@@ -0,0 +1,111 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from forecast import YieldForecaster
+
+# The yield forecaster on a seeded farm: the incremental top-up with new
+# harvests must give the same forecast as a full rebuild, and a hand-sized
+# case pins the curve arithmetic (unit conversion, exposure, shrinkage).
+
+VARIETIES = ('Roma', 'Cherry')
+FIELDS = ('North', 'South', '')
+
+
+def plant(cursor, rng, count):
+    today = date.today()
+    cursor.execute(
+        "INSERT INTO tomato_plants (variety, planting_date, status, field_location, quantity) "
+        "SELECT * FROM unnest(%s::text[], %s::date[], %s::text[], %s::text[], %s::int[]) RETURNING id",
+        ([rng.choice(VARIETIES) for _ in range(count)],
+         [today - timedelta(days=rng.randrange(0, 300)) for _ in range(count)],
+         [rng.choice(('Growing', 'Growing', 'Harvested')) for _ in range(count)],
+         [rng.choice(FIELDS) for _ in range(count)],
+         [rng.randrange(1, 40) for _ in range(count)]))
+    return [row['id'] for row in cursor.fetchall()]
+
+
+def harvest(cursor, rng, plants, count):
+    cursor.execute("SELECT id, planting_date FROM tomato_plants WHERE id = ANY(%s)", (plants,))
+    planted = {row['id']: row['planting_date'] for row in cursor.fetchall()}
+    picks = [rng.choice(plants) for _ in range(count)]
+    cursor.execute(
+        "INSERT INTO harvest (plant_id, harvest_date, quantity, unit) "
+        "SELECT * FROM unnest(%s::int[], %s::date[], %s::numeric[], %s::text[])",
+        (picks,
+         [min(planted[pick] + timedelta(days=rng.randrange(0, 400)), date.today()) for pick in picks],
+         [round(rng.uniform(0.5, 80), 2) for _ in range(count)],
+         [rng.choice(('kg', 'kg', 'lbs', 'tons')) for _ in range(count)]))
+
+
+def assert_same_forecast(actual, expected):
+    assert [week['kg'] for week in actual['weeks']] == pytest.approx([week['kg'] for week in expected['weeks']],
+                                                                      abs=0.01)
+    groups = {(group['variety'], group['field_location']): group for group in expected['groups']}
+    assert len(actual['groups']) == len(groups)
+    for group in actual['groups']:
+        other = groups[(group['variety'], group['field_location'])]
+        assert group['weekly_kg'] == pytest.approx(other['weekly_kg'], abs=0.01)
+        assert group['active_plants'] == other['active_plants']
+
+
+def test_top_up_matches_full_rebuild(cursor):
+    rng = random.Random(11)
+    plants = plant(cursor, rng, 60)
+    harvest(cursor, rng, plants, 400)
+    forecaster = YieldForecaster()
+    first = forecaster.forecast(cursor)
+    assert first['total_kg'] > 0
+
+    # New harvests, some for new plantings in a new group, are added to the
+    # kept sums instead of rebuilding them
+    plants += plant(cursor, rng, 10)
+    cursor.execute("INSERT INTO tomato_plants (variety, planting_date, status, field_location, quantity) "
+                   "VALUES ('Heirloom', CURRENT_DATE - 120, 'Growing', 'East', 12) RETURNING id")
+    plants.append(cursor.fetchone()['id'])
+    harvest(cursor, rng, plants, 150)
+    topped_up = forecaster.forecast(cursor)
+    assert forecaster.stats()['rebuilds'] == 1 and forecaster.stats()['updates'] == 1
+    assert topped_up['harvests_through_id'] > first['harvests_through_id']
+    assert_same_forecast(topped_up, YieldForecaster().forecast(cursor))
+
+
+def test_edited_harvests_wait_for_the_rebuild(cursor):
+    rng = random.Random(12)
+    plants = plant(cursor, rng, 30)
+    harvest(cursor, rng, plants, 200)
+    forecaster = YieldForecaster()
+    before = forecaster.forecast(cursor)
+    cursor.execute("UPDATE harvest SET quantity = quantity * 3")
+    assert forecaster.forecast(cursor)['weeks'] == before['weeks']
+
+    forecaster.rebuild_seconds = 0
+    rebuilt = forecaster.forecast(cursor)
+    assert forecaster.stats()['rebuilds'] == 2
+    assert_same_forecast(rebuilt, YieldForecaster().forecast(cursor))
+    assert rebuilt['total_kg'] == pytest.approx(3 * before['total_kg'], rel=0.01)
+
+
+def test_curve_arithmetic(cursor):
+    # Ten plants ten weeks old yielded 20 kg (0.02 tons) in their third
+    # week: 2 kg per plant at age week 2, the same for the group, the
+    # variety and the farm, so shrinkage leaves it alone.  Five plants a
+    # week old reach age week 2 next week.
+    today = date.today()
+    cursor.execute("""
+        INSERT INTO tomato_plants (variety, planting_date, status, field_location, quantity) VALUES
+            ('Roma', %s, 'Harvested', 'North', 10),
+            ('Roma', %s, 'Growing', 'North', 5)
+        RETURNING id
+    """, (today - timedelta(days=70), today - timedelta(days=7)))
+    old = cursor.fetchone()['id']
+    cursor.execute("INSERT INTO harvest (plant_id, harvest_date, quantity, unit) VALUES (%s, %s, 0.02, 'tons')",
+                   (old, today - timedelta(days=70 - 15)))
+
+    result = YieldForecaster().forecast(cursor, weeks=4)
+    assert [week['kg'] for week in result['weeks']] == [0.0, 10.0, 0.0, 0.0]
+    assert result['active_plantings'] == 1 and result['active_plants'] == 5
+    [group] = result['groups']
+    assert (group['variety'], group['field_location'], group['peak_week']) == ('Roma', 'North', 2)
+    assert group['kg_per_plant'] == 2.0
@@ -0,0 +1,148 @@
+import struct
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sensors import choose_resolution, ingest, roll_up_from, series
+
+# Sensor ingestion, rollups and resolution choice.  Rollups are run with
+# roll_up_from() inside the test's transaction; rollup() only adds the
+# claim of sensor_rollup_state.dirty_from around it.
+
+DAY = timedelta(days=1)
+
+# 0.1 as stored in a REAL column
+REAL_TENTH = struct.unpack('f', struct.pack('f', 0.1))[0]
+
+
+@pytest.fixture
+def sensor_cursor(cursor):
+    cursor.execute("TRUNCATE sensors, sensor_readings, sensor_rollup_5m, sensor_rollup_1h, sensor_rollup_1d")
+    cursor.execute("UPDATE sensor_rollup_state SET dirty_from = NULL, rolled_up_at = NULL WHERE id = 1")
+    return cursor
+
+
+@pytest.fixture
+def morning():
+    # 10:00 UTC three days ago: a whole day of buckets in the past
+    return (datetime.now(timezone.utc) - 3 * DAY).replace(hour=10, minute=0, second=0, microsecond=0)
+
+
+def readings(sensor, start, values, step=timedelta(seconds=1), **first):
+    # One reading per step from start; the first carries field_location
+    # and metric when given
+    batch = [{'sensor': sensor, 'at': (start + step * index).isoformat(), 'value': value}
+             for index, value in enumerate(values)]
+    batch[0].update(first)
+    return batch
+
+
+def write(cursor, records):
+    # ingest() takes a plain cursor in the caller's transaction
+    result = ingest(cursor.connection.cursor(), records)
+    assert result['errors'] == []
+    return result
+
+
+def dirty_from(cursor):
+    cursor.execute("SELECT dirty_from FROM sensor_rollup_state WHERE id = 1")
+    return cursor.fetchone()['dirty_from']
+
+
+def buckets(cursor, table):
+    cursor.execute(f"SELECT bucket, readings, total, min_value, max_value FROM {table} ORDER BY bucket")
+    return cursor.fetchall()
+
+
+@pytest.mark.parametrize('span, sensors, expected', [
+    (timedelta(minutes=5), 2, 'raw'),
+    (timedelta(minutes=10), 1, 'raw'),
+    (timedelta(minutes=10), 2, '5m'),
+    (timedelta(hours=1), 1, '5m'),
+    (3 * DAY, 1, '5m'),
+    (4 * DAY, 1, '1h'),
+    (41 * DAY, 1, '1h'),
+    (42 * DAY, 1, '1d'),
+    (3650 * DAY, 1, '1d'),
+])
+def test_resolution_is_the_finest_source_that_fits(span, sensors, expected):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert choose_resolution(start, start + span, sensors, max_points=1000) == expected
+
+
+def test_ingest_registers_sensors_and_lowers_dirty_from(sensor_cursor, morning):
+    result = write(sensor_cursor, readings('valve-1', morning, [1.0, 2.0], field_location='North', metric='flow'))
+    assert result == {'accepted': 2, 'registered': 1, 'errors': []}
+    assert dirty_from(sensor_cursor) == morning
+
+    # A later batch leaves the pending range alone, an earlier one extends it
+    write(sensor_cursor, readings('valve-1', morning + DAY, [3.0]))
+    assert dirty_from(sensor_cursor) == morning
+    write(sensor_cursor, readings('valve-1', morning - DAY, [4.0]))
+    assert dirty_from(sensor_cursor) == morning - DAY
+    sensor_cursor.execute("SELECT COUNT(*) as count FROM sensor_readings")
+    assert sensor_cursor.fetchone()['count'] == 4
+
+
+def test_ingest_rejects_the_whole_batch(sensor_cursor, morning):
+    batch = readings('valve-1', morning, [1.0], field_location='North', metric='flow')
+    batch += readings('valve-2', morning, [2.0])
+    batch += [{'sensor': 'valve-1', 'at': (datetime.now(timezone.utc) + DAY).isoformat(), 'value': 3.0}]
+    batch += [{'sensor': 'valve-1', 'at': morning.isoformat(), 'value': 'wet'}]
+    result = ingest(sensor_cursor.connection.cursor(), batch)
+    assert [error['index'] for error in result['errors']] == [2, 3]
+    assert result['accepted'] == 0
+
+    result = ingest(sensor_cursor.connection.cursor(), batch[:2])
+    assert [error['index'] for error in result['errors']] == [1]
+    sensor_cursor.execute("SELECT (SELECT COUNT(*) FROM sensors) + (SELECT COUNT(*) FROM sensor_readings) as count")
+    assert sensor_cursor.fetchone()['count'] == 0
+    assert dirty_from(sensor_cursor) is None
+
+
+def test_rollup_merges_late_readings_into_existing_buckets(sensor_cursor, morning):
+    write(sensor_cursor, readings('valve-1', morning, [1.0] * 120, field_location='North', metric='flow'))
+    write(sensor_cursor, readings('valve-2', morning + timedelta(hours=1), [5.0] * 60,
+                                  field_location='North', metric='flow'))
+    roll_up_from(sensor_cursor, dirty_from(sensor_cursor))
+    assert [(row['readings'], row['total']) for row in buckets(sensor_cursor, 'sensor_rollup_5m')] \
+        == [(120, 120.0), (60, 300.0)]
+
+    # A late reading in the first bucket and one an hour before it: every
+    # level is rebuilt from there, not added to
+    write(sensor_cursor, readings('valve-1', morning + timedelta(minutes=4), [9.0]))
+    write(sensor_cursor, readings('valve-1', morning - timedelta(hours=1), [-2.0]))
+    assert dirty_from(sensor_cursor) == morning - timedelta(hours=1)
+    roll_up_from(sensor_cursor, dirty_from(sensor_cursor))
+    roll_up_from(sensor_cursor, dirty_from(sensor_cursor))
+    assert [(row['readings'], row['total'], row['min_value'], row['max_value'])
+            for row in buckets(sensor_cursor, 'sensor_rollup_5m')] \
+        == [(1, -2.0, -2.0, -2.0), (121, 129.0, 1.0, 9.0), (60, 300.0, 5.0, 5.0)]
+    assert [(row['readings'], row['total']) for row in buckets(sensor_cursor, 'sensor_rollup_1h')] \
+        == [(1, -2.0), (121, 129.0), (60, 300.0)]
+    assert [(row['readings'], row['total']) for row in buckets(sensor_cursor, 'sensor_rollup_1d')] \
+        == [(182, 427.0)]
+
+
+def test_five_minute_totals_are_summed_in_double_precision(sensor_cursor, morning):
+    write(sensor_cursor, readings('probe-1', morning, [0.1] * 300, field_location='North', metric='moisture'))
+    roll_up_from(sensor_cursor, morning)
+    [bucket] = buckets(sensor_cursor, 'sensor_rollup_5m')
+    assert bucket['total'] == pytest.approx(300 * REAL_TENTH, abs=1e-9)
+
+
+def test_series_reads_the_chosen_level(sensor_cursor, morning):
+    write(sensor_cursor, readings('valve-1', morning, [2.0] * 600, field_location='North', metric='flow'))
+    roll_up_from(sensor_cursor, morning)
+
+    result = series(sensor_cursor, 'North', 'flow', morning, morning + timedelta(minutes=10))
+    assert result['resolution'] == 'raw'
+    assert len(result['points']) == 600 and not result['truncated']
+
+    result = series(sensor_cursor, 'North', 'flow', morning, morning + DAY)
+    assert result['resolution'] == '5m'
+    assert [(point['readings'], point['avg']) for point in result['points']] == [(300, 2.0), (300, 2.0)]
+
+    result = series(sensor_cursor, 'North', 'flow', morning - 30 * DAY, morning + DAY)
+    assert result['resolution'] == '1h'
+    assert [point['readings'] for point in result['points']] == [600]
@@ -0,0 +1,66 @@
+import json
+import time
+
+from db import DatabaseUnavailable
+from write_behind import WriteBehindQueue
+
+# Poison writes in the write-behind queue: handlers cast each write's n to
+# int4 in the flush transaction, so a value out of range fails the whole
+# batch the way a real column overflow does.
+
+
+def drain(queue, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while queue.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.stats()['pending'] == 0
+
+
+def make_queue(tmp_path, handler, logged):
+    return WriteBehindQueue(str(tmp_path / 'spool'), {'count': handler}, flush_ms=10, max_attempts=2,
+                            log=logged.append)
+
+
+def test_rejected_write_is_set_aside_and_the_rest_go_through(database, tmp_path):
+    applied = []
+
+    def handler(cursor, events):
+        for event in events:
+            cursor.execute("SELECT %s::int", (event['data']['n'],))
+        applied.extend(event['data']['n'] for event in events)
+
+    logged = []
+    queue = make_queue(tmp_path, handler, logged)
+    for n in (1, 2 ** 40, 3):
+        queue.enqueue('count', {'n': n})
+    drain(queue)
+    queue.close()
+
+    assert sorted(applied) == [1, 3]
+    [dead] = [json.loads(line) for line in open(queue.dead_letter)]
+    assert dead['data'] == {'n': 2 ** 40} and 'out of range' in dead['error']
+    assert queue.stats()['dead_lettered'] == 1 and queue.stats()['flushed'] == 2
+    assert any(dead['id'] in message for message in logged)
+
+    # The dead-letter file is not replayed as spool
+    queue = make_queue(tmp_path, handler, logged)
+    queue.start()
+    queue.close()
+    assert queue.stats()['recovered'] == 0
+
+
+def test_outages_are_retried_and_never_set_aside(database, tmp_path):
+    calls = []
+
+    def handler(cursor, events):
+        calls.append(len(events))
+        if len(calls) <= 5:
+            raise DatabaseUnavailable('connection refused')
+
+    queue = make_queue(tmp_path, handler, [])
+    queue.enqueue('count', {'n': 1})
+    drain(queue)
+    queue.close()
+
+    assert len(calls) == 6
+    assert queue.stats()['dead_lettered'] == 0 and queue.stats()['flushed'] == 1
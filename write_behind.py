@@ -0,0 +1,308 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import psycopg2
+
+from db import DatabaseUnavailable, db
+
+# Write-behind queue for high-frequency writes (task starts and finishes,
+# operation logs).
+#
+# enqueue() appends the write to a local spool file and an in-memory queue
+# and returns; a background flusher applies everything queued in one
+# transaction every flush_ms, or as soon as batch_size writes are waiting,
+# through the handler registered for each kind of write.  A request
+# therefore never waits on Postgres, only on one append to the spool.
+#
+# The spool is a directory of JSON-lines segments.  The flusher starts a
+# new segment each time it takes a batch and deletes the old ones once the
+# batch has committed, so the segments on disk always hold every write
+# that is not yet in the database.  Each process locks its segments
+# (flock); at start a process adopts the unlocked segments left behind by
+# one that crashed and replays them.  A crash between the commit and the
+# delete replays a batch twice, so handlers must be idempotent (each write
+# carries a unique id).  Without fsync a write survives a crash of the
+# process but not of the machine.
+#
+# The queue holds at most max_pending writes.  When it is full (Postgres
+# down or too slow) enqueue() waits up to put_timeout seconds for room and
+# then raises QueueFull, and the caller writes synchronously instead.
+# close() flushes what is left; the app calls it at exit.
+#
+# A flush that fails on the database being down or a lost connection is
+# retried until it goes through.  One that fails max_attempts times for
+# any other reason is taken to hold a write Postgres will never accept (a
+# value that overflows its column, a CHECK violation), which would
+# otherwise block every write queued behind it.  The batch is then applied
+# one write at a time, and the writes that still fail are appended to the
+# dead-letter file (JSON lines with the error) and logged.
+
+# Errors that say nothing about the writes themselves
+TRANSIENT_ERRORS = (DatabaseUnavailable, psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehindQueue:
+    def __init__(self, spool_dir, handlers, flush_ms=50, batch_size=500, max_pending=10000,
+                 put_timeout=0.5, fsync=False, max_attempts=3, dead_letter=None, on_flush=None, log=print):
+        # handlers: {kind: function(cursor, events)}, applied in this order.
+        # dead_letter defaults to dead-letter/writes.jsonl in the spool
+        # (outside the segments replayed at start).
+        self.spool_dir = spool_dir
+        self.handlers = handlers
+        self.flush_seconds = flush_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.dead_letter = dead_letter or os.path.join(spool_dir, 'dead-letter', 'writes.jsonl')
+        self.on_flush = on_flush
+        self.log = log
+        self._cond = threading.Condition()
+        self._pending = deque()       # (queued_at, event) in the current segment
+        self._in_flight = []          # events in the closed segments
+        self._segments = []           # (path, file) closed segments, oldest first
+        self._current = None
+        self._thread = None
+        self._closed = False
+        self.enqueued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.dead_lettered = 0
+
+    def start(self):
+        with self._cond:
+            self._start()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._recover()
+        self._current = self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        # Locked before it gets the name other processes look for
+        path = os.path.join(self.spool_dir, f'{time.time_ns()}-{os.getpid()}.jsonl')
+        segment = open(path + '.tmp', 'a', encoding='utf-8')
+        fcntl.flock(segment, fcntl.LOCK_EX)
+        os.rename(path + '.tmp', path)
+        return path, segment, 0
+
+    def _recover(self):
+        # Adopts the segments no live process holds a lock on
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*.jsonl'))):
+            try:
+                segment = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                segment.close()
+                continue
+            events = []
+            for line in segment:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # The last line of a crashed writer can be cut short
+                    continue
+            if not events:
+                os.remove(path)
+                segment.close()
+                continue
+            self._in_flight += events
+            self._segments.append((path, segment))
+            self.recovered += len(events)
+        if self.recovered:
+            self.log(f"Write-behind queue recovered {self.recovered} spooled writes")
+
+    def _size(self):
+        return len(self._pending) + len(self._in_flight)
+
+    def enqueue(self, kind, data):
+        # Spools one write and returns its id; raises QueueFull when there
+        # is no room after put_timeout seconds, or after close()
+        if kind not in self.handlers:
+            raise ValueError(f'No write-behind handler for {kind}')
+        event = {'id': uuid.uuid4().hex, 'kind': kind, 'at': time.time(), 'data': data}
+        line = json.dumps(event, default=str) + '\n'
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            self._start()
+            while self._size() >= self.max_pending and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._closed or self._size() >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull('Write-behind queue is full' if not self._closed else 'Write-behind queue is closed')
+            path, segment, count = self._current
+            segment.write(line)
+            segment.flush()
+            if self.fsync:
+                os.fsync(segment.fileno())
+            self._current = (path, segment, count + 1)
+            self._pending.append((time.monotonic(), event))
+            self.enqueued += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return event['id']
+
+    def _take(self):
+        # Waits for a batch and moves it in flight.  Returns the events in
+        # flight and how many closed segments hold them; no events once
+        # closed and drained.
+        with self._cond:
+            while not self._closed:
+                if self._in_flight or len(self._pending) >= self.batch_size:
+                    break
+                if self._pending:
+                    remaining = self._pending[0][0] + self.flush_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            if self._pending:
+                path, segment, _ = self._current
+                self._segments.append((path, segment))
+                self._current = self._open_segment()
+                self._in_flight += [event for _, event in self._pending]
+                self._pending.clear()
+            return list(self._in_flight), len(self._segments)
+
+    def _apply(self, events):
+        with db(cursor_factory=None) as cursor:
+            for kind, handler in self.handlers.items():
+                batch = [event for event in events if event['kind'] == kind]
+                if batch:
+                    handler(cursor, batch)
+        unknown = {event['kind'] for event in events} - set(self.handlers)
+        if unknown:
+            self.log(f"Write-behind queue dropped writes of unknown kinds: {', '.join(sorted(unknown))}")
+
+    def _apply_each(self, events, dead):
+        # Applies the writes one at a time; the ones that fail go to the
+        # dead-letter file and their ids into dead.  Transient errors are
+        # raised, and a later pass skips the writes already in dead.
+        # Returns the writes applied.
+        applied = []
+        for event in events:
+            if event['id'] in dead:
+                continue
+            try:
+                self._apply([event])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                self._dead_letter(event, e)
+                dead.add(event['id'])
+                continue
+            applied.append(event)
+        return applied
+
+    def _dead_letter(self, event, error):
+        os.makedirs(os.path.dirname(self.dead_letter), exist_ok=True)
+        line = json.dumps(dict(event, error=str(error).strip(), failed_at=time.time()), default=str) + '\n'
+        with open(self.dead_letter, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        with self._cond:
+            self.dead_lettered += 1
+        self.log(f"Write-behind {event['kind']} write {event['id']} moved to {self.dead_letter}: {error}")
+
+    def _run(self):
+        retries = 0
+        rejections = 0                # failed flushes not explained by an outage
+        dead = set()                  # ids of the batch moved to the dead-letter file
+        while True:
+            events, segments = self._take()
+            if not events:
+                return
+            try:
+                if rejections >= self.max_attempts:
+                    applied = self._apply_each(events, dead)
+                else:
+                    self._apply(events)
+                    applied = events
+            except Exception as e:
+                with self._cond:
+                    self.failures += 1
+                    closed = self._closed
+                self.log(f"Write-behind flush of {len(events)} writes failed: {e}")
+                if closed:
+                    return
+                if not isinstance(e, TRANSIENT_ERRORS):
+                    rejections += 1
+                # Back off; the batch stays spooled and is retried first
+                retries += 1
+                with self._cond:
+                    self._cond.wait(min(self.flush_seconds * 2 ** min(retries, 10), 5.0))
+                continue
+            retries = 0
+            rejections = 0
+            dead.clear()
+            with self._cond:
+                for path, segment in self._segments[:segments]:
+                    os.remove(path)
+                    segment.close()
+                del self._segments[:segments]
+                self._in_flight = self._in_flight[len(events):]
+                self.flushed += len(applied)
+                self.flushes += 1
+                self._cond.notify_all()
+            if self.on_flush is not None and applied:
+                try:
+                    self.on_flush({event['kind'] for event in applied})
+                except Exception as e:
+                    self.log(f"Write-behind flush handler failed: {e}")
+
+    def close(self, timeout=10.0):
+        # Flushes what is queued; anything that cannot be written in time
+        # stays in the spool for the next start
+        with self._cond:
+            if self._thread is None or self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return
+        with self._cond:
+            path, segment, count = self._current
+            if not count:
+                os.remove(path)
+            segment.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': self._size(),
+                'enqueued': self.enqueued,
+                'flushed': self.flushed,
+                'flushes': self.flushes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'recovered': self.recovered,
+                'dead_lettered': self.dead_lettered
+            }